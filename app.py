@@ -1,24 +1,206 @@
+import aiohttp
+from aiohttp import web
+import asyncio
+import atexit
+import csv
 import discord
 from discord import app_commands
 from discord.ui import Button, View, Select, Modal, TextInput
 from discord.ext import commands
+import gc
+import functools
+import hashlib
+import heapq
+import importlib.util
+import io
+import json
 import logging
-from typing import Dict, List, Optional, Tuple
+import logging.handlers
+import math
+import multiprocessing
+import os
+import queue
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import types
+import urllib.parse
+import uuid
+from itertools import islice
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from discord.ext import tasks
 
-# Set up basic logging
-logging.basicConfig(level=logging.INFO)
+PROCESS_STARTED = time.monotonic()
 
 # Configuration
 CONFIG = {
     "TARGET_CATEGORY_ID": 000000000000, #Category where the party channels get created
-    "MAX_PLAYERS_PER_PARTY": 6,
+    "OVERFLOW_CATEGORY_IDS": [],  # More categories for party channels, filled least loaded first together with the one above
+    "CATEGORY_CHANNEL_LIMIT": 50,  # Discord's cap on channels per category
+    "AUTO_OVERFLOW_CATEGORIES": True,  # Create extra categories when all configured ones are full
+    "OVERFLOW_CATEGORY_NAME": "Worm Parties (overflow)",
+    "OVERFLOW_RETIRE_DELAY": 10 * 60,  # Seconds an auto-created category stays empty before it is deleted
     "YOUR_CHANNEL_ID": 0000000000, #Channel where the party message get send
     "AUTHORIZED_USER_ID": 00000000000, #Bot owner ID
-    "MACRO_CHECKS_CHANNEL_ID": 000000000000  #here comes a channel ID with confirmed macro checks to read out
+    "MACRO_CHECKS_CHANNEL_ID": 000000000000,  #here comes a channel ID with confirmed macro checks to read out
+    "DATA_DIR": "data",  # Local files (recordings, caches, logs) are kept here
+    "LOG_FILE": "bot.log.jsonl",  # Structured JSON log in DATA_DIR, None for console logging only
+    "LOG_MAX_BYTES": 20 * 1024 * 1024,
+    "LOG_BACKUPS": 5,
+    "LOG_QUEUE_SIZE": 10000,  # Records waiting for the log thread; more are dropped rather than block the loop
+    "LOG_SAMPLE_EVERY": {  # {event: n} keeps 1 in n records of high-volume event logs
+        "presence_update": 100,
+        "interaction": 1
+    },
+    "EVENT_RECORDING": False,  # Record handled gateway events to DATA_DIR/events.jsonl for replay.py
+    "EVENT_RECORDING_MAX_BYTES": 20 * 1024 * 1024,
+    "EVENT_RECORDING_BACKUPS": 5,
+    "LEAN_MEMBER_CACHE": False,  # Skip member chunking and only cache party members + recently active users
+    "RECENT_MEMBER_CACHE_SIZE": 500,
+    "INTERACTION_RATE_LIMITS": {  # {action: (burst, seconds per token)} per user
+        "join": (1, 5),
+        "party": (5, 2),
+        "modal": (3, 5),
+        "guide": (6, 2)
+    },
+    "PERMISSION_FLUSH_DELAY": 0.5,  # Seconds to collect member access changes per channel before one bulk edit
+    "DM_CONCURRENCY": 5,  # DMs sent in parallel by the notifier
+    "DM_CLOSED_TTL": 6 * 60 * 60,  # Seconds to skip users whose DMs were closed
+    "SIDE_EFFECT_RETRIES": 3,  # Retries for idempotent cosmetic calls (pins, lobby and countdown edits)
+    "SIDE_EFFECT_BACKOFF": 0.5,  # Seconds, doubled per retry with full jitter
+    "SIDE_EFFECT_TIMEOUT": 5,  # Seconds a cosmetic call may take; discord.py's 429 waits count, so timeouts don't open circuits
+    "CIRCUIT_FAILURE_THRESHOLD": 5,  # Consecutive transient failures before a route's cosmetic calls are shed
+    "CIRCUIT_COOLDOWN": 30,  # Seconds a route sheds calls before one probe call is let through
+    "PERFORMANCE_PROFILE": False,  # uvloop + orjson when installed, and a tuned HTTP connection pool
+    "HTTP_POOL_SIZE": 100,  # Connections to Discord's API in the performance profile, discord.py's default is unlimited
+    "HTTP_KEEPALIVE": 60,  # Seconds idle API connections are kept open in the performance profile
+    "MATCHMAKING_MODE": False,  # Queue joiners and form parties in batches instead of placing them instantly
+    "MATCHMAKING_INTERVAL": 15,  # Seconds between matchmaking batches
+    "MATCHMAKING_MAX_WAIT": 60,  # Seconds before a queued player is placed even if their party can't be filled
+    "IGN_RESOLVER": "mojang",  # "mojang", "stub" (offline, accepts any well-formed name) or None to skip lookups
+    "IGN_LOOKUP_TIMEOUT": 2,
+    "IGN_CACHE_SIZE": 5000,
+    "IGN_CACHE_TTL": 24 * 60 * 60,
+    "IGN_NEGATIVE_CACHE_TTL": 10 * 60,  # Unknown names are re-checked after this, they may get registered
+    "IGN_MEMORY_PER_USER": 5,  # Recently used IGNs remembered per user for /join and the lobby button
+    "IGN_MEMORY_USERS": 20000,
+    "PARTY_LOG_MAX_BYTES": 10 * 1024 * 1024,  # Party lifecycle log in DATA_DIR/party_events.jsonl, feeds /partystats
+    "PARTY_LOG_BACKUPS": 10,
+    "PARTY_IDLE_TIMEOUT": 6 * 60 * 60,  # Close parties without messages or interactions for this long, None to disable
+    "PARTY_IDLE_WARNING": 15 * 60,  # The party is warned this long before it is closed
+    "MEMORY_REPORT_SAMPLE": 500,  # Entries deep-sized per structure by !memory, larger ones are extrapolated
+    "MEMORY_REPORT_SLICE": 0.002,  # Seconds !memory walks objects before yielding to the event loop
+    "MEMORY_TRACE": False,  # Allow !memory trace; every tracemalloc snapshot blocks the event loop while it is copied
+    "LOOP_LAG_INTERVAL": 0.1,  # Seconds between event loop lag samples
+    "LOOP_LAG_WINDOW": 15,  # Minutes of lag samples kept for !lag
+    "LOOP_STALL_THRESHOLD": 0.25,  # Seconds the loop may be blocked before the blocking stack is captured
+    "LOOP_STALL_FRAMES": 8,  # Innermost frames kept per captured stall
+    "PARTY_API_PORT": None,  # Port for the read-only party list API (GET /parties, /parties/stream), None to disable
+    "PARTY_API_HOST": "127.0.0.1",
+    "PARTY_API_HEARTBEAT": 15,  # Seconds between keepalive comments on idle change streams
+    "PARTY_API_STREAM_BUFFER": 100,  # Changes queued per stream client before the client is dropped
+    "MACRO_IMPORT_MAX_BYTES": 1024 * 1024,  # Largest CSV/JSON file !macroimport accepts
+    "MACRO_IMPORT_INTERVAL": 1.2,  # Seconds between imported checks; Discord allows 5 messages per 5s per channel
+    "CHART_WORKERS": 1,  # Processes rendering /macrostats charts (needs matplotlib)
+    "ASSET_CHANNEL_ID": None,  # Channel guide images are uploaded to once and served from, None embeds the original links
+    "ASSET_REFRESH_MARGIN": 2 * 60 * 60,  # Seconds before a stored image link expires that it is re-signed
+    "ASSET_RETRY_DELAY": 15 * 60,  # Seconds before a guide image that failed to store is tried again
+    "GUIDE_ASSET_DIR": "guide_assets",  # Committed <asset name>.<ext> guide images, relative to app.py
+    "SHUTDOWN_TIMEOUT": 20,  # Seconds SIGTERM/SIGINT waits for in-flight handlers and queued Discord calls
+    "PARTY_TYPES": [  # Activities the finder runs parties for, each gets its own lobby button; the first is /join's default
+        {
+            "key": "worm",
+            "name": "Worm",
+            "emoji": "⛏️",
+            "button_id": "initial_join_button",  # kept from the single-button lobby so old boards keep working
+            "max_size": 6,
+            "trigger_label": "Worm Trigger Count",
+            "triggers": {  # {member count: text} announced in the party when the member count changes
+                1: "1 Member = 15-20",
+                2: "2 Member = 25-30",
+                3: "3 Member = 35-40",
+                4: "4 Member = 45-50",
+                5: "5 Member = 50-55",
+                6: "6 Member = 55-60"
+            }
+        }
+    ]
 }
 
+# ====================== Party Types ======================
+
+class PartyType:
+    def __init__(self, key: str, name: str, emoji: Optional[str] = None, button_id: Optional[str] = None,
+                 max_size: int = 6, min_size: int = 2, trigger_label: Optional[str] = None,
+                 triggers: Optional[Dict[int, str]] = None):
+        self.key = key
+        self.name = name
+        self.emoji = emoji
+        self.button_id = button_id or f"join_party_{key}"
+        self.max_size = max_size
+        self.min_size = min_size  # smallest size the leader can shrink the party to
+        self.trigger_label = trigger_label
+        self.triggers = {int(count): text for count, text in (triggers or {}).items()}
+
+
+PARTY_TYPES: Dict[str, PartyType] = {spec["key"]: PartyType(**spec) for spec in CONFIG["PARTY_TYPES"]}
+DEFAULT_PARTY_TYPE = next(iter(PARTY_TYPES.values()))
+
+
+def party_type_of(data: dict) -> PartyType:
+    return PARTY_TYPES.get(data.get('type'), DEFAULT_PARTY_TYPE)
+
+
+def party_title(data: dict) -> str:
+    # Parties restored from a snapshot taken before numbers were stored have none
+    number = data.get('number')
+    return f"⚔️ {party_type_of(data).name} Party" + (f" #{number}" if number else "")
+
+
+class PartyIndex:
+    # The parties of one type. Open ones (a free seat and not locked) also sit
+    # in a heap by channel id, i.e. by age, so a join finds the oldest open
+    # party of its type without looking at any other party. Entries for
+    # parties that have filled up or closed are skipped when they surface.
+    # A party is only open once create_party has sent its message
+    def __init__(self):
+        self.parties: set = set()
+        self.open: set = set()
+        self._oldest: List[int] = []  # heap of channel ids
+
+    def update(self, channel_id: int, data: Optional[dict]):
+        if data is None:
+            self.parties.discard(channel_id)
+            self.open.discard(channel_id)
+            return
+        self.parties.add(channel_id)
+        if (len(data['members']) < data['max_size'] and not data.get('locked', False)
+                and data['message_id'] is not None):
+            if channel_id not in self.open:
+                self.open.add(channel_id)
+                heapq.heappush(self._oldest, channel_id)
+                if len(self._oldest) > 2 * len(self.open) + 16:
+                    self._oldest = sorted(self.open)  # a sorted list is a valid heap
+        else:
+            self.open.discard(channel_id)
+
+    def first_open(self) -> Optional[int]:
+        while self._oldest and self._oldest[0] not in self.open:
+            heapq.heappop(self._oldest)
+        return self._oldest[0] if self._oldest else None
+
+    def open_oldest_first(self) -> List[int]:
+        return sorted(self.open)
+
 # Global state
 class BotState:
     def __init__(self):
@@ -26,13 +208,33 @@ class BotState:
         self.party_views: Dict[int, View] = {}
         self.user_participation: Dict[int, int] = {}  # {user_id: channel_id}
         self.initial_button_message_id: Optional[int] = None
-        self.last_interaction_time: Dict[int, datetime] = {}  # {user_id: last_interaction_time}
         self.last_online_time: Dict[int, datetime] = {}  # Track when users were last online
         self.offline_warning_messages: Dict[int, Tuple[int, int]] = {}  # {user_id: (channel_id, message_id)}
+        self.party_indexes: Dict[str, PartyIndex] = {key: PartyIndex() for key in PARTY_TYPES}
+        self.matchmaking_queues: "Dict[str, OrderedDict[int, Tuple[str, datetime]]]" = {
+            key: OrderedDict() for key in PARTY_TYPES
+        }  # {party type: {user_id: (mc_username, queued_at)}}
 
 
 state = BotState()
 
+
+def index_party(channel_id: int):
+    # Call after any change to a party's members, size or lock
+    data = state.active_channels[channel_id]
+    state.party_indexes[party_type_of(data).key].update(channel_id, data)
+
+
+def unindex_party(channel_id: int, data: dict):
+    state.party_indexes[party_type_of(data).key].update(channel_id, None)
+
+
+def queued_type(user_id: int) -> Optional[PartyType]:
+    for key, waiting in state.matchmaking_queues.items():
+        if user_id in waiting:
+            return PARTY_TYPES[key]
+    return None
+
 # Initialize bot
 intents = discord.Intents.default()
 intents.messages = True
@@ -41,951 +243,3813 @@ intents.members = True
 intents.message_content = True
 intents.presences = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
 
-# ====================== Worm Party Finder Components ======================
+def member_cache_options() -> dict:
+    # Lean mode turns off startup chunking and discord.py's own member cache;
+    # MemberCache below keeps just the members the party finder needs. The Bot
+    # takes these when it is built at import, so lean mode can also be chosen
+    # per process with LEAN_MEMBER_CACHE=1 in the environment
+    if os.environ.get("LEAN_MEMBER_CACHE") == "1":
+        CONFIG["LEAN_MEMBER_CACHE"] = True
+    if not CONFIG["LEAN_MEMBER_CACHE"]:
+        return {}
+    return {
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none()
+    }
 
-class CommandModal(Modal):
-    def __init__(self, channel_id: int):
-        super().__init__(title="Set Join Command")
-        self.channel_id = channel_id
-        self.command = TextInput(
-            label="/wormparty join ... ...",
-            placeholder="ex: /wormparty join Peach Test123",
-            max_length=100
-        )
-        self.add_item(self.command)
-    
-    async def on_submit(self, interaction: discord.Interaction):
-        state.active_channels[self.channel_id]['join_cmd'] = self.command.value
-        await update_party_embed(self.channel_id)
-        await interaction.response.send_message("Join command updated!", ephemeral=True)
 
-class UsernameModal(Modal):
+bot = commands.Bot(command_prefix='!', intents=intents, **member_cache_options())
+
+# ====================== Event Recording ======================
+
+def data_path(name: str) -> str:
+    os.makedirs(CONFIG["DATA_DIR"], exist_ok=True)
+    return os.path.join(CONFIG["DATA_DIR"], name)
+
+
+class RotatingJsonlWriter:
+    # Append-only JSON lines file, rotated to name.1 ... name.N once it grows past max_bytes
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        self._size = 0
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        if self._file is None:
+            self._open()
+        if self._size and self._size + len(line) > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._file.flush()
+        self._size += len(line)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def existing_files(path: str) -> List[str]:
+        # Oldest first: name.N ... name.1, then the live file
+        backups = []
+        directory, name = os.path.split(path)
+        if not os.path.isdir(directory or "."):
+            return []
+        for candidate in os.listdir(directory or "."):
+            suffix = candidate[len(name) + 1:]
+            if candidate.startswith(f"{name}.") and suffix.isdigit():
+                backups.append((int(suffix), os.path.join(directory, candidate)))
+        files = [candidate for _, candidate in sorted(backups, reverse=True)]
+        return files + ([path] if os.path.exists(path) else [])
+
+
+class EventRecorder:
+    # Opt-in recording of the gateway events the bot handles, replayable with replay.py
     def __init__(self):
-        super().__init__(title="Ign")
-        self.username = TextInput(
-            label="Ign",
-            placeholder="Ign...",
-            min_length=3,
-            max_length=16
-        )
-        self.add_item(self.username)
+        self._writer: Optional[RotatingJsonlWriter] = None
 
-    async def on_submit(self, interaction: discord.Interaction):
-        if interaction.user.id in state.user_participation:
-            channel_id = state.user_participation[interaction.user.id]
-            channel = bot.get_channel(channel_id)
-            await interaction.response.send_message(
-                embed=discord.Embed(
-                    title="Already in a Party",
-                    description=f"You're already in a party! Please leave {channel.mention} before joining another.",
-                    color=discord.Color.red()
-                ),
-                ephemeral=True
-            )
+    def record(self, event: str, **fields):
+        if not CONFIG["EVENT_RECORDING"]:
             return
-
         try:
-            await handle_party_join(interaction, self.username.value)
-        except Exception as e:
-            logging.error(f"Error in UsernameModal on_submit: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "An error occurred while processing your request.",
-                    ephemeral=True
+            if self._writer is None:
+                self._writer = RotatingJsonlWriter(
+                    data_path("events.jsonl"),
+                    CONFIG["EVENT_RECORDING_MAX_BYTES"],
+                    CONFIG["EVENT_RECORDING_BACKUPS"]
                 )
+            self._writer.write({"ts": round(time.time(), 3), "e": event, **fields})
+        except OSError as e:
+            logging.warning(f"Failed to record {event} event: {e}")
 
-
-class LockConfirmModal(Modal):
-    def __init__(self, channel_id: int):
-        super().__init__(title="Confirm AFK Party")
-        self.channel_id = channel_id
-        self.confirm = TextInput(
-            label="Type 'AFK' to confirm",  # Shortened label
-            placeholder="Party will be permanently locked (AFK)",
-            max_length=3
-        )
-        self.add_item(self.confirm)
-    
-    async def on_submit(self, interaction: discord.Interaction):
-        if self.confirm.value.upper() != "AFK":
-            await interaction.response.send_message(
-                "You didn't type 'AFK'. Party remains unlocked.",
-                ephemeral=True
-            )
-            return
-            
-        state.active_channels[self.channel_id]['locked'] = True
-        await update_party_embed(self.channel_id)
-        await interaction.response.send_message(
-            "Party has been locked! No one can join now.",
-            ephemeral=True
+    def record_interaction(self, interaction: discord.Interaction):
+        self.record(
+            "interaction",
+            type=interaction.type.value,
+            user=interaction.user.id,
+            name=interaction.user.display_name,
+            channel=interaction.channel_id,
+            data=interaction.data
         )
 
-class KickSelect(Select):
-    def __init__(self, channel_id: int, members: List[int], usernames: List[str]):
-        self.channel_id = channel_id
-        options = []
-        
-        channel = bot.get_channel(channel_id)
-        if not channel:
-            raise ValueError("Channel not found")
-            
-        guild = channel.guild
-        
-        for member_id, mc_name in zip(members, usernames):
-            member = guild.get_member(member_id)
-            if member:
-                options.append(discord.SelectOption(
-                    label=f"{member.display_name} (MC: {mc_name})",
-                    value=str(member_id)
-                ))
-        
-        super().__init__(
-            placeholder="Select a member to kick...",
-            min_values=1,
-            max_values=1,
-            options=options
+    def record_presence(self, before: discord.Member, after: discord.Member):
+        self.record("presence", user=after.id, before=str(before.status), after=str(after.status))
+
+    def record_message(self, message: discord.Message):
+        # Only commands are kept verbatim; other chat just marks channel activity
+        content = message.content if message.content.startswith("!") else None
+        self.record(
+            "message",
+            user=message.author.id,
+            name=message.author.display_name,
+            channel=message.channel.id,
+            content=content
         )
-    
-    async def callback(self, interaction: discord.Interaction):
+
+
+recorder = EventRecorder()
+
+# ====================== Logging ======================
+
+# Record attributes every LogRecord has; anything else was passed in extra= and goes into the JSON line
+STANDARD_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+# Per-event records (interactions, presence updates) only go to the JSON log, not the console
+event_log = logging.getLogger("wormparty.events")
+
+
+class JsonlLogHandler(logging.Handler):
+    # Runs on the log thread, so the file writes and rotation never touch the event loop
+    def __init__(self, path: str):
+        super().__init__()
+        self.writer = RotatingJsonlWriter(path, CONFIG["LOG_MAX_BYTES"], CONFIG["LOG_BACKUPS"])
+
+    def emit(self, record: logging.LogRecord):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in STANDARD_RECORD_FIELDS)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
         try:
-            # Defer the interaction first to prevent timeout
-            await interaction.response.defer(ephemeral=True)
-            
-            party_data = state.active_channels[self.channel_id]
-            if interaction.user.id != party_data['creator_id']:
-                await interaction.followup.send(
-                    "Only the party creator can kick members!",
-                    ephemeral=True
-                )
-                return
-            
-            member_id = int(self.values[0])
-            if member_id == interaction.user.id:
-                await interaction.followup.send(
-                    "You can't kick yourself! Use the leave button instead.",
-                    ephemeral=True
-                )
-                return
-            
-            # Remove the member from the party
-            index = party_data['members'].index(member_id)
-            party_data['members'].pop(index)
-            mc_name = party_data['usernames'].pop(index)
-            
-            # Remove user from participation tracking
-            if member_id in state.user_participation:
-                del state.user_participation[member_id]
-            
-            channel = interaction.guild.get_channel(self.channel_id)
-            member = interaction.guild.get_member(member_id)
-            
-            if member:
-                await channel.set_permissions(
-                    member,
-                    read_messages=False,
-                    send_messages=False
-                )
-                try:
-                    await member.send(
-                        embed=discord.Embed(
-                            title="You were kicked from a Worm Party",
-                            description=f"You were removed from the party in {channel.mention}",
-                            color=discord.Color.red()
-                        )
-                    )
-                except discord.Forbidden:
-                    pass  # User has DMs disabled
+            self.writer.write(entry)
+        except OSError:
+            self.handleError(record)
 
-            await update_party_embed(self.channel_id)
+    def close(self):
+        self.writer.close()
+        super().close()
 
-            # Send kick notification to the party channel
-            await channel.send(
-                f"{member.display_name if member else 'A member'} (MC: {mc_name}) was kicked by {interaction.user.mention}"
-            )
-            
-                
-        except Exception as e:
-            logging.error(f"Error in KickSelect callback: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "An error occurred while processing your request.",
-                    ephemeral=True
-                )
-            else:
-                try:
-                    await interaction.followup.send(
-                        "An error occurred while processing your request.",
-                        ephemeral=True
-                    )
-                except:
-                    pass
 
+class SamplingFilter(logging.Filter):
+    # Keeps 1 in LOG_SAMPLE_EVERY[event] records per event type; kept records carry
+    # the rate as sample_every so counts can be scaled back up
+    def __init__(self):
+        super().__init__()
+        self.seen: Counter = Counter()
+        self.dropped: Counter = Counter()
 
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        every = CONFIG["LOG_SAMPLE_EVERY"].get(event, 1)
+        if every <= 1:
+            return True
+        self.seen[event] += 1
+        if (self.seen[event] - 1) % every:
+            self.dropped[event] += 1
+            return False
+        record.sample_every = every
+        return True
 
-class TransferLeaderSelect(Select):
-    def __init__(self, channel_id: int, options: List[discord.SelectOption]):
-        super().__init__(
-            placeholder="Select new party leader...",
-            min_values=1,
-            max_values=1,
-            options=options
-        )
-        self.channel_id = channel_id
-    
-    async def callback(self, interaction: discord.Interaction):
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never waits for the log thread: when the queue is full the record is counted and dropped
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare, but the traceback stays separate from the message
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
         try:
-            # Defer the interaction first to prevent timeout
-            await interaction.response.defer(ephemeral=True)
-            
-            party_data = state.active_channels.get(self.channel_id)
-            if not party_data:
-                await interaction.followup.send("Party data not found!", ephemeral=True)
-                return
-                
-            if interaction.user.id != party_data['creator_id']:
-                await interaction.followup.send(
-                    "Only the current party leader can transfer leadership!",
-                    ephemeral=True
-                )
-                return
-                
-            new_leader_id = int(self.values[0])
-            
-            # Update the creator_id in party data
-            old_leader_id = party_data['creator_id']
-            party_data['creator_id'] = new_leader_id
-            
-            # Get member objects for notifications
-            channel = interaction.guild.get_channel(self.channel_id)
-            old_leader = interaction.guild.get_member(old_leader_id)
-            new_leader = interaction.guild.get_member(new_leader_id)
-            
-            # Notify the party
-            if channel:
-                await channel.send(
-                    f"{new_leader.mention if new_leader else 'The new leader'} is now the party leader! "
-                    f"They can now set the join command and manage the party."
-                )
-            
-            # Update the embed with new leader controls
-            await update_party_embed(self.channel_id)
-            
-            
-        except Exception as e:
-            logging.error(f"Error in TransferLeaderSelect callback: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "An error occurred while transferring leadership.",
-                    ephemeral=True
-                )
-            else:
-                try:
-                    await interaction.followup.send(
-                        "An error occurred while transferring leadership.",
-                        ephemeral=True
-                    )
-                except:
-                    pass
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 
+def interaction_log_fields(interaction: discord.Interaction) -> dict:
+    # extra= fields tying a log record to the user, their party and the clicked component
+    return {
+        "user": interaction.user.id,
+        "party": state.user_participation.get(interaction.user.id),
+        "custom_id": (interaction.data or {}).get("custom_id")
+    }
 
-class SizeSelectView(View):
-    def __init__(self, channel_id: int, current_size: int, creator_id: int):
-        super().__init__(timeout=30)
-        self.creator_id = creator_id
-        options = []
-        
-        for size in range(2, CONFIG["MAX_PLAYERS_PER_PARTY"] + 1):
-            options.append(discord.SelectOption(
-                label=f"{size} players",
-                value=str(size),
+
+def setup_logging() -> logging.handlers.QueueListener:
+    # The loop thread only formats and enqueues; the console and the JSON file
+    # are written by a QueueListener thread
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    handlers: List[logging.Handler] = [console]
+    if CONFIG["LOG_FILE"]:
+        handlers.append(JsonlLogHandler(data_path(CONFIG["LOG_FILE"])))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(CONFIG["LOG_QUEUE_SIZE"]))
+    queue_handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    event_log.setLevel(logging.DEBUG)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_logging():
+    # Flushes queued records to the handlers; safe to call more than once
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+# Started by run_bot; importing the module (harnesses, chart worker processes) leaves logging alone
+log_listener: Optional[logging.handlers.QueueListener] = None
+atexit.register(stop_logging)
+
+# ====================== Party Event Log ======================
+
+class PartyStats:
+    # Running aggregates over the party log, updated per event so reads are O(1)
+    def __init__(self):
+        self.counts: Counter = Counter()  # {event: count}
+        self.close_reasons: Counter = Counter()
+        self.open: Dict[int, list] = {}  # {party: [created_ts, size, max_size, peak_size, filled]}
+        self.fill_seconds = 0.0
+        self.filled = 0
+        self.lifetime_seconds = 0.0
+        self.peak_sizes = 0
+        self.closed = 0
+        self.joins_by_user: Counter = Counter()
+        self.leads_by_user: Counter = Counter()
+        self.created_by_type: Counter = Counter()  # {party type key: parties created}
+
+    def apply(self, record: dict):
+        event, party, ts = record["e"], record.get("party"), record["ts"]
+        self.counts[event] += 1
+        if event == "create":
+            self.created_by_type[record.get("type", DEFAULT_PARTY_TYPE.key)] += 1
+            size = len(record["members"])
+            self.open[party] = [ts, size, record["max_size"], size, False]
+            self.joins_by_user.update(record["members"])
+            self.leads_by_user[record["members"][0]] += 1
+        elif party not in self.open:
+            return  # party created before the log started
+        elif event == "join":
+            self.open[party][1] += 1
+            self.joins_by_user[record["user"]] += 1
+        elif event in ("leave", "kick", "offline_remove"):
+            self.open[party][1] -= 1
+        elif event == "resize":
+            self.open[party][2] = record["size"]
+        elif event == "transfer":
+            self.leads_by_user[record["user"]] += 1
+        elif event == "close":
+            created_ts, _, _, peak_size, _ = self.open.pop(party)
+            self.close_reasons[record["reason"]] += 1
+            self.lifetime_seconds += ts - created_ts
+            self.peak_sizes += peak_size
+            self.closed += 1
+            return
+
+        data = self.open[party]
+        data[3] = max(data[3], data[1])
+        if not data[4] and data[1] >= data[2]:
+            data[4] = True
+            self.fill_seconds += ts - data[0]
+            self.filled += 1
+
+
+class PartyLog:
+    # Append-only log of party lifecycle events. /partystats reads the running
+    # aggregates; the log is only scanned once, to rebuild them after a restart.
+    # That scan reads up to PARTY_LOG_MAX_BYTES x (PARTY_LOG_BACKUPS + 1), so it
+    # runs in a thread from on_ready; events recorded meanwhile are held back
+    # and applied and written once it is done
+    def __init__(self, filename: Optional[str] = "party_events.jsonl"):
+        self.filename = filename  # None keeps the aggregates in memory only
+        self._writer: Optional[RotatingJsonlWriter] = None
+        self._stats: Optional[PartyStats] = None if filename else PartyStats()
+        self._pending: List[dict] = []  # recorded while the log is being read back
+        self._loading: Optional[asyncio.Future] = None
+        self.sequence = 0  # bumped per event, lets readers tell whether anything changed
+        self.listeners: List[Callable[[dict], None]] = []  # called with each record, after the state change
+
+    @property
+    def loaded(self) -> bool:
+        return self._stats is not None
+
+    async def load(self) -> PartyStats:
+        if self._stats is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load())
+            try:
+                await asyncio.shield(self._loading)
+            finally:
+                self._loading = None  # a failed rebuild is retried by the next caller
+        return self._stats
+
+    async def _load(self):
+        stats = PartyStats()
+        await asyncio.to_thread(self._rebuild, stats, data_path(self.filename))
+        self._stats = stats
+        pending, self._pending = self._pending, []
+        for record in pending:
+            self._apply(record)
+        logging.info(f"Rebuilt party stats from the log, {stats.counts['create']} parties")
+
+    @staticmethod
+    def _rebuild(stats: PartyStats, path: str):
+        for file in RotatingJsonlWriter.existing_files(path):
+            try:
+                with open(file, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            stats.apply(json.loads(line))
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Skipping unreadable party log {file}: {e}")
+
+    def record(self, event: str, party: int, **fields):
+        record = {"ts": round(time.time(), 3), "e": event, "party": party, **fields}
+        self.sequence += 1
+        for listener in self.listeners:
+            listener(record)
+        if self._stats is None:
+            self._pending.append(record)  # written after the rebuild, so the scan can't see it twice
+        else:
+            self._apply(record)
+
+    def _apply(self, record: dict):
+        self._stats.apply(record)
+        if not self.filename:
+            return
+        try:
+            if self._writer is None:
+                self._writer = RotatingJsonlWriter(
+                    data_path(self.filename),
+                    CONFIG["PARTY_LOG_MAX_BYTES"],
+                    CONFIG["PARTY_LOG_BACKUPS"]
+                )
+            self._writer.write(record)
+        except OSError as e:
+            logging.warning(f"Failed to write party {record['e']} event: {e}")
+
+
+party_log = PartyLog()
+
+# ====================== Member Cache ======================
+
+def resident_memory_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MemberCache:
+    # In lean mode the guild member cache only holds party members plus an LRU of
+    # recently active users; everything else is loaded lazily when needed.
+    # discord.py has no public way to add to or evict from a guild's member
+    # cache, or to drop gateway events before they are parsed, so the internals
+    # used for that are checked for once; if a discord.py release changes them,
+    # lean mode falls back to discord.py's own chunking-free behaviour
+    GUILD_CACHE_INTERNALS = hasattr(discord.Guild, "_add_member") and hasattr(discord.Guild, "_remove_member")
+
+    def __init__(self):
+        self.recent: "OrderedDict[int, int]" = OrderedDict()  # {user_id: guild_id}
+        self.presences_dropped = 0
+        self.startup_seconds: Optional[float] = None
+        self._filter_installed = False
+
+    def touch(self, member):
+        if not CONFIG["LEAN_MEMBER_CACHE"] or not self.GUILD_CACHE_INTERNALS or not isinstance(member, discord.Member):
+            return
+        guild = member.guild
+        if guild.get_member(member.id) is None:
+            guild._add_member(member)
+        self.recent[member.id] = guild.id
+        self.recent.move_to_end(member.id)
+        while len(self.recent) > CONFIG["RECENT_MEMBER_CACHE_SIZE"]:
+            user_id, guild_id = self.recent.popitem(last=False)
+            evicted_guild = bot.get_guild(guild_id)
+            if evicted_guild and user_id not in state.user_participation and user_id != bot.user.id:
+                evicted_guild._remove_member(discord.Object(user_id))
+
+    def trim(self):
+        # Drop members that left their party and have since aged out of the LRU
+        if not CONFIG["LEAN_MEMBER_CACHE"] or not self.GUILD_CACHE_INTERNALS:
+            return
+        for guild in bot.guilds:
+            for member in list(guild.members):
+                if (member.id not in state.user_participation and member.id not in self.recent
+                        and member.id != bot.user.id):
+                    guild._remove_member(member)
+
+    def install_presence_filter(self):
+        if self._filter_installed or not CONFIG["LEAN_MEMBER_CACHE"]:
+            return
+        parsers = getattr(getattr(bot, "_connection", None), "parsers", None)
+        if not isinstance(parsers, dict) or "PRESENCE_UPDATE" not in parsers:
+            logging.warning("Presence filter unavailable in this discord.py version; uncached members' presences are parsed")
+            self._filter_installed = True
+            return
+        parse_presence_update = parsers["PRESENCE_UPDATE"]
+
+        def filtered(data):
+            # Cheapest point to drop: before discord.py builds any objects for the event
+            user_id = int(data["user"]["id"])
+            if user_id in state.user_participation or queued_type(user_id) is not None:
+                parse_presence_update(data)
+            else:
+                self.presences_dropped += 1
+
+        parsers["PRESENCE_UPDATE"] = filtered
+        self._filter_installed = True
+
+    async def load_party_members(self, guild: discord.Guild):
+        if not CONFIG["LEAN_MEMBER_CACHE"]:
+            return
+        missing = [user_id for user_id in state.user_participation if guild.get_member(user_id) is None]
+        for i in range(0, len(missing), 100):
+            try:
+                await guild.query_members(user_ids=missing[i:i + 100], presences=True, cache=True)
+            except (asyncio.TimeoutError, discord.HTTPException) as e:
+                logging.warning(f"Failed to load party members: {e}")
+
+    def report(self) -> dict:
+        return {
+            "mode": "lean" if CONFIG["LEAN_MEMBER_CACHE"] else "full",
+            "startup_seconds": self.startup_seconds,
+            "rss_mb": resident_memory_mb(),
+            "cached_members": sum(len(guild.members) for guild in bot.guilds),
+            "presences_dropped": self.presences_dropped
+        }
+
+
+member_cache = MemberCache()
+
+# ====================== Command Sync ======================
+
+def command_tree_hash() -> str:
+    # Hash of the payload tree.sync() would upload, so any change to a command's
+    # name, description, options or permissions triggers a sync
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands()),
+        key=lambda command: (command["name"], command.get("type", 1))
+    )
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def load_synced_command_hash() -> Optional[dict]:
+    try:
+        with open(data_path("command_tree.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_synced_command_hash(application_id: int, tree_hash: str):
+    try:
+        with open(data_path("command_tree.json"), "w", encoding="utf-8") as f:
+            json.dump({"application_id": application_id, "hash": tree_hash}, f)
+    except OSError as e:
+        logging.warning(f"Failed to save command tree hash: {e}")
+
+
+async def sync_command_tree(force: bool = False) -> Optional[int]:
+    # Returns the number of synced commands, or None if the global sync was skipped
+    tree_hash = command_tree_hash()
+    synced_hash = load_synced_command_hash()
+    if not force and synced_hash == {"application_id": bot.application_id, "hash": tree_hash}:
+        logging.info(f"Command tree unchanged ({tree_hash[:12]}), skipping sync")
+        return None
+
+    logging.info("Syncing commands...")
+    synced = await bot.tree.sync()
+    save_synced_command_hash(bot.application_id, tree_hash)
+    logging.info(f"Successfully synced {len(synced)} commands")
+    return len(synced)
+
+# ====================== Shutdown ======================
+
+class GracefulShutdown:
+    # On SIGTERM/SIGINT: refuse new interactions, let admitted handlers and
+    # running periodic tasks finish, flush the queued Discord calls, then
+    # snapshot the party state and close the bot. A second signal skips the wait
+    def __init__(self):
+        self.closing = False
+        self.in_flight: set = set()  # tasks of admitted interactions
+        self.busy = 0  # periodic task iterations running
+        self._task: Optional[asyncio.Task] = None
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request, sig.name)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C stops the bot without draining, as before
+
+    def request(self, reason: str):
+        if self._task is None:
+            logging.info(f"{reason} received, shutting down")
+            self._task = asyncio.create_task(self.run())
+        elif not self._task.done():
+            logging.warning(f"{reason} received again, closing without waiting")
+            self._task.cancel()
+
+    def track(self, task: Optional[asyncio.Task]):
+        if task is not None:
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    def periodic(self, coro):
+        # For tasks.loop bodies: an iteration that has started delays shutdown,
+        # none starts once shutdown has begun
+        @functools.wraps(coro)
+        async def iteration(*args, **kwargs):
+            if self.closing:
+                return
+            self.busy += 1
+            try:
+                return await coro(*args, **kwargs)
+            finally:
+                self.busy -= 1
+        return iteration
+
+    async def _handlers_done(self):
+        current = asyncio.current_task()
+        while self.busy or self.in_flight - {current}:
+            await asyncio.sleep(0.05)
+
+    async def run(self):
+        self.closing = True
+        started = time.monotonic()
+        deadline = started + CONFIG["SHUTDOWN_TIMEOUT"]
+        steps = [
+            ("in-flight handlers", self._handlers_done),
+            ("permission changes", permission_batcher.flush_all),
+            ("DMs", dm_notifier.drain),
+            ("cosmetic Discord calls", side_effects.drain)
+        ]
+        try:
+            for name, step in steps:
+                try:
+                    await asyncio.wait_for(step(), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    logging.warning(f"Shutdown timed out waiting for {name} after {CONFIG['SHUTDOWN_TIMEOUT']}s")
+                    break
+        except asyncio.CancelledError:
+            pass
+        for periodic_task in (check_offline_members, collect_idle_parties, run_matchmaking, refresh_guide_assets):
+            periodic_task.cancel()
+        state_snapshot.save()
+        ign_memory.save()
+        await party_api.stop()
+        macro_charts.close()
+        close_backend = getattr(ign_resolver.backend, "close", None)
+        if close_backend is not None:
+            await close_backend()
+        logging.info(
+            f"Shutdown finished in {time.monotonic() - started:.1f}s, "
+            f"{len(state.active_channels)} parties open"
+        )
+        await bot.close()
+
+
+graceful_shutdown = GracefulShutdown()
+
+
+class StateSnapshot:
+    # Party bookkeeping written at shutdown and read back once at the next
+    # start, so a restart keeps parties, offline timers and queues
+    def __init__(self, filename: Optional[str] = "state_snapshot.json"):
+        self.filename = filename  # in DATA_DIR, None disables the snapshot
+
+    def capture(self) -> dict:
+        return {
+            "saved_at": datetime.now().timestamp(),
+            "lobby_message_id": state.initial_button_message_id,
+            "parties": {str(channel_id): data for channel_id, data in state.active_channels.items()},
+            "last_online": {str(user_id): at.timestamp() for user_id, at in state.last_online_time.items()},
+            "offline_warnings": {str(user_id): list(ids) for user_id, ids in state.offline_warning_messages.items()},
+            "queues": {
+                key: [[user_id, mc_username, queued_at.timestamp()] for user_id, (mc_username, queued_at) in waiting.items()]
+                for key, waiting in state.matchmaking_queues.items()
+            }
+        }
+
+    def save(self):
+        if not self.filename:
+            return
+        path = data_path(self.filename)
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(self.capture(), f, separators=(",", ":"))
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.error(f"Failed to save the state snapshot: {e}")
+
+    def restore(self) -> int:
+        # Returns the number of parties restored. The file is removed once read:
+        # after a crash, a snapshot from an earlier shutdown would be stale
+        if not self.filename or not os.path.exists(data_path(self.filename)):
+            return 0
+        path = data_path(self.filename)
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read the state snapshot: {e}")
+            return 0
+
+        state.initial_button_message_id = state.initial_button_message_id or snapshot.get("lobby_message_id")
+        for channel_id, data in snapshot.get("parties", {}).items():
+            channel = bot.get_channel(int(channel_id))
+            if channel is None:
+                continue  # deleted while the bot was down
+            channel_id = int(channel_id)
+            state.active_channels[channel_id] = data
+            for user_id in data['members']:
+                state.user_participation[user_id] = channel_id
+            index_party(channel_id)
+            if channel.category_id is not None:
+                category_allocator.assign(channel_id, channel.category_id)
+            idle_parties.touch(channel_id)
+            view = PartyView(channel_id, data['creator_id'])
+            state.party_views[channel_id] = view
+            if data.get('message_id'):
+                bot.add_view(view, message_id=data['message_id'])
+
+        for user_id, at in snapshot.get("last_online", {}).items():
+            if int(user_id) in state.user_participation:
+                state.last_online_time[int(user_id)] = datetime.fromtimestamp(at)
+        for user_id, (channel_id, message_id) in snapshot.get("offline_warnings", {}).items():
+            if channel_id in state.active_channels:
+                state.offline_warning_messages[int(user_id)] = (channel_id, message_id)
+        for key, entries in snapshot.get("queues", {}).items():
+            waiting = state.matchmaking_queues.get(key)
+            if waiting is None:
+                continue  # party type removed from the config
+            for user_id, mc_username, queued_at in entries:
+                if user_id not in state.user_participation:
+                    waiting[user_id] = (mc_username, datetime.fromtimestamp(queued_at))
+
+        age = datetime.now().timestamp() - snapshot.get("saved_at", 0)
+        logging.info(f"Restored {len(state.active_channels)} parties from a snapshot taken {age:.0f}s ago")
+        return len(state.active_channels)
+
+
+state_snapshot = StateSnapshot()
+
+# ====================== Interaction Rate Limiting ======================
+
+class TokenBucketLimiter:
+    # Token bucket per (user, action). A bucket left alone long enough to refill
+    # completely is indistinguishable from a new one, so it is evicted after that
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock  # replay.py swaps in the recorded clock
+        self._buckets: OrderedDict = OrderedDict()  # {(user_id, action): [tokens, updated, notified]}
+        self.dropped = 0
+
+    def acquire(self, user_id: int, action: str) -> Tuple[float, bool]:
+        # Returns (0, False) if allowed, else (seconds until the next token, whether to tell the user)
+        burst, per_token = CONFIG["INTERACTION_RATE_LIMITS"][action]
+        now = self.clock()
+        self._evict(now)
+
+        key = (user_id, action)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [burst, now, False]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) / per_token)
+            bucket[1] = now
+        self._buckets[key] = bucket
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return 0, False
+
+        # Only the first rejected click of a burst gets a response
+        self.dropped += 1
+        notify = not bucket[2]
+        bucket[2] = True
+        return (1 - bucket[0]) * per_token, notify
+
+    def _evict(self, now: float):
+        ttl = max(burst * per_token for burst, per_token in CONFIG["INTERACTION_RATE_LIMITS"].values())
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < ttl:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+interaction_limiter = TokenBucketLimiter()
+
+
+async def admit_interaction(interaction: discord.Interaction, action: str) -> bool:
+    if graceful_shutdown.closing:
+        if not interaction.response.is_done():
+            await interaction.response.send_message(
+                "The bot is restarting, please try again in a moment.",
+                ephemeral=True
+            )
+        return False
+    retry_after, notify = interaction_limiter.acquire(interaction.user.id, action)
+    if not retry_after:
+        graceful_shutdown.track(asyncio.current_task())
+        return True
+    if notify and not interaction.response.is_done():
+        await interaction.response.send_message(
+            f"Please wait {math.ceil(retry_after)} seconds before using this again.",
+            ephemeral=True
+        )
+    return False
+
+
+class RateLimitedView(View):
+    # interaction_check runs before any component callback of the view
+    def __init__(self, *, timeout: Optional[float] = 180, action: str = "party"):
+        super().__init__(timeout=timeout)
+        self.rate_limit_action = action
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await admit_interaction(interaction, self.rate_limit_action)
+
+
+class RateLimitedModal(Modal):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await admit_interaction(interaction, "modal")
+
+# ====================== Permission Batching ======================
+
+class PermissionBatcher:
+    # Collects member access changes per channel and applies them with a single
+    # channel.edit(overwrites=...) per flush window instead of one PUT per member
+    def __init__(self):
+        self._pending: Dict[int, Dict[int, discord.PermissionOverwrite]] = {}  # {channel_id: {member_id: overwrite}}
+        self._applied: Dict[int, Dict[int, discord.PermissionOverwrite]] = {}  # member overwrites last sent per channel
+        self._flushes: Dict[int, asyncio.Task] = {}
+        self.changes = 0
+        self.requests = 0
+
+    def set_access(self, channel, member_id: int, allowed: bool):
+        overwrite = discord.PermissionOverwrite(read_messages=allowed, send_messages=allowed)
+        self._pending.setdefault(channel.id, {})[member_id] = overwrite
+        self.changes += 1
+        if channel.id not in self._flushes:
+            self._flushes[channel.id] = asyncio.create_task(self._flush_later(channel.id))
+
+    async def _flush_later(self, channel_id: int):
+        await asyncio.sleep(CONFIG["PERMISSION_FLUSH_DELAY"])
+        del self._flushes[channel_id]
+        await self.flush(channel_id)
+
+    async def flush(self, channel_id: int):
+        pending = self._pending.pop(channel_id, None)
+        channel = bot.get_channel(channel_id)
+        if not pending or channel is None:
+            self._applied.pop(channel_id, None)
+            return
+
+        # The cached channel can lag behind our last edit until its CHANNEL_UPDATE
+        # arrives, so member overwrites we set ourselves take precedence over it
+        applied = self._applied.setdefault(channel_id, {})
+        applied.update(pending)
+        overwrites = {target: overwrite for target, overwrite in channel.overwrites.items() if target.id not in applied}
+        for member_id, overwrite in applied.items():
+            overwrites[discord.Object(id=member_id, type=discord.Member)] = overwrite
+
+        try:
+            self.requests += 1
+            await channel.edit(overwrites=overwrites)
+        except discord.NotFound:
+            self._applied.pop(channel_id, None)  # channel was deleted in the meantime
+        except discord.HTTPException as e:
+            logging.error(f"Failed to update permissions for {len(pending)} members in channel {channel_id}: {e}")
+
+        for stale_id in [cid for cid in self._applied if cid not in state.active_channels]:
+            del self._applied[stale_id]
+
+    async def flush_all(self):
+        for task in self._flushes.values():
+            task.cancel()
+        self._flushes.clear()
+        for channel_id in list(self._pending):
+            await self.flush(channel_id)
+
+
+permission_batcher = PermissionBatcher()
+
+# ====================== DM Notifications ======================
+
+class DMNotifier:
+    # Sends DMs in the background with bounded concurrency and remembers users
+    # with closed DMs for a while, since every failed attempt costs a round trip
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(CONFIG["DM_CONCURRENCY"])
+        self._closed: OrderedDict = OrderedDict()  # {user_id: expiry}, in expiry order
+        self._tasks = set()
+        self.sent = 0
+        self.skipped = 0
+
+    def notify(self, user_ids: List[int], embed: discord.Embed):
+        for user_id in user_ids:
+            if self.dms_closed(user_id):
+                self.skipped += 1
+                continue
+            task = asyncio.create_task(self._send(user_id, embed))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def dms_closed(self, user_id: int) -> bool:
+        now = time.monotonic()
+        while self._closed and next(iter(self._closed.values())) <= now:
+            self._closed.popitem(last=False)
+        return user_id in self._closed
+
+    async def _send(self, user_id: int, embed: discord.Embed):
+        async with self._semaphore:
+            try:
+                user = bot.get_user(user_id)
+                if user is not None:
+                    await user.send(embed=embed)
+                else:
+                    channel = await bot.create_dm(discord.Object(id=user_id))
+                    await channel.send(embed=embed)
+                self.sent += 1
+            except discord.Forbidden:
+                # User has DMs disabled
+                self._closed.pop(user_id, None)
+                self._closed[user_id] = time.monotonic() + CONFIG["DM_CLOSED_TTL"]
+            except discord.HTTPException as e:
+                logging.warning(f"Failed to DM user {user_id}: {e}")
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+dm_notifier = DMNotifier()
+
+# ====================== Side Effects ======================
+
+def is_transient(error: BaseException) -> bool:
+    # Server errors, exhausted rate limits, timeouts and connection errors say
+    # nothing about the request itself; 4xx responses do and aren't retried
+    if isinstance(error, discord.HTTPException):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+
+class CircuitBreaker:
+    # Opens after CIRCUIT_FAILURE_THRESHOLD consecutive transient failures and sheds
+    # calls for CIRCUIT_COOLDOWN seconds; then one probe call decides whether it closes
+    def __init__(self, route: str, clock=time.monotonic):
+        self.route = route
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    def allows(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.probing or self.clock() - self.opened_at < CONFIG["CIRCUIT_COOLDOWN"]:
+            return False
+        self.probing = True
+        return True
+
+    def succeeded(self):
+        if self.opened_at is not None:
+            logging.info(f"Circuit for {self.route} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failed(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= CONFIG["CIRCUIT_FAILURE_THRESHOLD"]):
+            if self.opened_at is None:
+                logging.warning(f"Circuit for {self.route} opened after {self.failures} failures")
+            self.opened_at = self.clock()
+            self.probing = False
+
+
+class SideEffects:
+    # Cosmetic Discord calls (pins, lobby, embed and countdown refreshes) go
+    # through here: idempotent ones are retried with jittered backoff, and a
+    # breaker per route and channel sheds them while Discord is failing there,
+    # so the calls users wait on keep the rate limit budget. Transient failures
+    # never reach the caller. Party notices are delivered here too, but never shed
+    def __init__(self):
+        self.breakers: Dict[Tuple[str, Optional[int]], CircuitBreaker] = {}  # only routes that failed lately
+        self._tasks = set()
+        self.retried: Counter = Counter()
+        self.shed: Counter = Counter()
+        self.given_up: Counter = Counter()
+
+    def breaker(self, route: str, channel_id: Optional[int] = None) -> CircuitBreaker:
+        # One busy channel must not shed the calls for every other party
+        key = (route, channel_id)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(route if channel_id is None else f"{route} in {channel_id}")
+        return self.breakers[key]
+
+    async def run(self, route: str, call: Callable[[], Awaitable], idempotent: bool = True,
+                  channel_id: Optional[int] = None) -> bool:
+        # True if the call went through; client errors (e.g. NotFound) are raised as usual
+        breaker = self.breaker(route, channel_id)
+        attempts = 1 + (CONFIG["SIDE_EFFECT_RETRIES"] if idempotent else 0)
+        for attempt in range(attempts):
+            if not breaker.allows():
+                self.shed[route] += 1
+                return False
+            try:
+                await asyncio.wait_for(call(), CONFIG["SIDE_EFFECT_TIMEOUT"])
+            except Exception as e:
+                if not is_transient(e):
+                    self._succeeded(route, channel_id, breaker)  # Discord answered, the request itself was wrong
+                    raise
+                if not isinstance(e, asyncio.TimeoutError):
+                    # A timeout may just be discord.py waiting out a busy bucket, not Discord failing
+                    breaker.failed()
+                if attempt + 1 == attempts:
+                    self.given_up[route] += 1
+                    logging.warning(f"Giving up on {route} after {attempts} attempts: {e!r}")
+                    return False
+                self.retried[route] += 1
+                await asyncio.sleep(random.uniform(0, CONFIG["SIDE_EFFECT_BACKOFF"] * 2 ** attempt))
+            else:
+                self._succeeded(route, channel_id, breaker)
+                return True
+        return False
+
+    def _succeeded(self, route: str, channel_id: Optional[int], breaker: CircuitBreaker):
+        breaker.succeeded()
+        self.breakers.pop((route, channel_id), None)  # closed breakers aren't kept, one per party would pile up
+
+    def spawn(self, route: str, call: Callable[[], Awaitable], idempotent: bool = True,
+              channel_id: Optional[int] = None):
+        # Fire and forget, for calls the handler shouldn't wait on
+        self._track(self._run_logged(route, call, idempotent, channel_id))
+
+    def _track(self, coroutine: Awaitable):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_logged(self, route: str, call: Callable[[], Awaitable], idempotent: bool,
+                          channel_id: Optional[int]):
+        try:
+            await self.run(route, call, idempotent, channel_id)
+        except discord.HTTPException as e:
+            logging.warning(f"Failed to {route}: {e}")
+
+    def send_notices(self, channel: discord.TextChannel, notices: List[dict]):
+        # Join/leave notices carry the trigger counts and the "Your Party is full!"
+        # ping players act on, so they are sent in order and never shed. Each has
+        # a nonce, so Discord drops a resend whose first attempt got through, and
+        # no timeout, so discord.py waits out 429s instead of the send being cancelled
+        if notices:
+            self._track(self._deliver(channel, notices))
+
+    async def _deliver(self, channel: discord.TextChannel, notices: List[dict]):
+        for notice in notices:
+            nonce = uuid.uuid4().hex[:25]  # Discord accepts nonces of up to 25 characters
+            for attempt in range(1 + CONFIG["SIDE_EFFECT_RETRIES"]):
+                try:
+                    await channel.send(nonce=nonce, **notice)
+                    break
+                except Exception as e:
+                    if not is_transient(e) or attempt == CONFIG["SIDE_EFFECT_RETRIES"]:
+                        self.given_up["send party notice"] += 1
+                        logging.error(f"Failed to send party notice in {channel.id}: {e!r}")
+                        break
+                    self.retried["send party notice"] += 1
+                    await asyncio.sleep(random.uniform(0, CONFIG["SIDE_EFFECT_BACKOFF"] * 2 ** attempt))
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+side_effects = SideEffects()
+
+# ====================== IGN Resolver ======================
+
+IGN_PATTERN = re.compile(r"^[A-Za-z0-9_]{3,16}$")
+
+
+class IgnLookupUnavailable(Exception):
+    pass
+
+
+class MojangIgnBackend:
+    URL = "https://api.mojang.com/users/profiles/minecraft/{}"
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def lookup(self, name: str) -> Optional[Tuple[str, str]]:
+        # Returns (canonical name, uuid), or None if no account has this name
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=CONFIG["IGN_LOOKUP_TIMEOUT"]))
+        try:
+            async with self._session.get(self.URL.format(name)) as response:
+                if response.status in (204, 404):
+                    return None
+                if response.status != 200:
+                    raise IgnLookupUnavailable(f"Mojang API answered {response.status}")
+                profile = await response.json()
+                return profile["name"], profile["id"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            raise IgnLookupUnavailable(f"Mojang API lookup failed: {e!r}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class StubIgnBackend:
+    # Offline backend for bench/load/replay runs: any well-formed name exists
+    # unless listed in unknown, with a stable made-up uuid
+    def __init__(self, unknown=(), delay: float = 0):
+        self.unknown = {name.lower() for name in unknown}
+        self.delay = delay
+        self.lookups = 0
+
+    async def lookup(self, name: str) -> Optional[Tuple[str, str]]:
+        self.lookups += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if name.lower() in self.unknown:
+            return None
+        return name, uuid.uuid5(uuid.NAMESPACE_OID, name.lower()).hex
+
+
+def make_ign_backend(kind: Optional[str]):
+    if kind == "mojang":
+        return MojangIgnBackend()
+    if kind == "stub":
+        return StubIgnBackend()
+    return None
+
+
+class IgnResolver:
+    # LRU + TTL cache in front of the backend. Unknown names are cached too,
+    # for a shorter time, and concurrent lookups of one name share a request
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._cache: OrderedDict = OrderedDict()  # {name.lower(): (expiry, profile or None)}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        key = name.lower()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._lookup(key, name))
+            self._inflight[key] = task
+        # shield: one caller timing out must not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def _lookup(self, key: str, name: str) -> Optional[Tuple[str, str]]:
+        if self.backend is None:
+            self.backend = make_ign_backend(CONFIG["IGN_RESOLVER"])
+        try:
+            profile = await self.backend.lookup(name)
+        finally:
+            del self._inflight[key]
+        ttl = CONFIG["IGN_CACHE_TTL"] if profile else CONFIG["IGN_NEGATIVE_CACHE_TTL"]
+        self._cache.pop(key, None)
+        self._cache[key] = (time.monotonic() + ttl, profile)
+        while len(self._cache) > CONFIG["IGN_CACHE_SIZE"]:
+            self._cache.popitem(last=False)
+        return profile
+
+
+ign_resolver = IgnResolver()
+
+
+async def canonical_ign(name: str) -> Optional[Tuple[str, Optional[str]]]:
+    # (canonical name, uuid) for a valid IGN, None if it can't be one. If the
+    # lookup service is down the name is taken as typed, with no uuid
+    name = name.strip()
+    if not IGN_PATTERN.match(name):
+        return None
+    if not CONFIG["IGN_RESOLVER"]:
+        return name, None
+    try:
+        return await ign_resolver.resolve(name)
+    except IgnLookupUnavailable as e:
+        logging.warning(f"IGN lookup for {name} unavailable, accepting it as typed: {e}")
+        return name, None
+
+
+def unknown_ign_embed(name: str) -> discord.Embed:
+    return discord.Embed(
+        title="Unknown IGN",
+        description=f"**{discord.utils.escape_markdown(name)}** isn't a Minecraft account. Check the spelling and try again.",
+        color=discord.Color.red()
+    )
+
+
+class IgnMemory:
+    # IGNs each user recently joined with, newest first, persisted to DATA_DIR
+    def __init__(self, filename: Optional[str] = "igns.json"):
+        self.filename = filename  # None keeps it in memory only
+        self._igns: Optional[OrderedDict] = None  # {user_id: [ign, ...]}, least recently active user first
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _load(self) -> OrderedDict:
+        if self._igns is None:
+            self._igns = OrderedDict()
+            if self.filename and os.path.exists(data_path(self.filename)):
+                try:
+                    with open(data_path(self.filename), encoding="utf-8") as f:
+                        for user_id, igns in json.load(f).items():
+                            self._igns[int(user_id)] = igns
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Failed to load remembered IGNs: {e}")
+        return self._igns
+
+    def recent(self, user_id: int) -> List[str]:
+        return list(self._load().get(user_id, []))
+
+    def remember(self, user_id: int, ign: str):
+        igns = self._load()
+        recent = [ign] + [name for name in igns.pop(user_id, []) if name.lower() != ign.lower()]
+        igns[user_id] = recent[:CONFIG["IGN_MEMORY_PER_USER"]]
+        while len(igns) > CONFIG["IGN_MEMORY_USERS"]:
+            igns.popitem(last=False)
+        if self.filename and self._save_task is None:
+            self._save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        # Coalesce a burst of joins into one write
+        await asyncio.sleep(5)
+        self._save_task = None
+        self.save()
+
+    def save(self):
+        if not self.filename or self._igns is None:
+            return
+        path = data_path(self.filename)
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({str(user_id): igns for user_id, igns in self._igns.items()}, f, separators=(",", ":"))
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.warning(f"Failed to save remembered IGNs: {e}")
+
+
+ign_memory = IgnMemory()
+
+# ====================== Party Categories ======================
+
+class PartyCategoriesFull(Exception):
+    pass
+
+
+class CategoryAllocator:
+    # Spreads party channels over TARGET_CATEGORY_ID and OVERFLOW_CATEGORY_IDS,
+    # least loaded first, using channel counts kept in memory. Once they are all
+    # full, overflow categories are created. Those only take parties while the
+    # configured ones are full, so they drain when load drops and get deleted
+    def __init__(self):
+        self.counts: Dict[int, int] = {}  # {category_id: channels}, counting creations in flight
+        self.auto_created: List[int] = []
+        self.party_category: Dict[int, int] = {}  # {channel_id: category_id}
+        self._retiring: Dict[int, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+        self.created = 0
+        self.retired = 0
+
+    def load(self, category: discord.CategoryChannel) -> int:
+        if category.id not in self.counts:
+            self.counts[category.id] = len(category.channels)
+        return self.counts[category.id]
+
+    def _least_loaded(self, guild: discord.Guild, category_ids: List[int]) -> Optional[discord.CategoryChannel]:
+        categories = [guild.get_channel(category_id) for category_id in category_ids]
+        with_room = [c for c in categories if c is not None and self.load(c) < CONFIG["CATEGORY_CHANNEL_LIMIT"]]
+        return min(with_room, key=self.load, default=None)
+
+    async def reserve(self, guild: discord.Guild) -> discord.CategoryChannel:
+        # Counts a channel against the returned category; release() it if the create fails
+        async with self._lock:
+            configured = [CONFIG["TARGET_CATEGORY_ID"], *CONFIG["OVERFLOW_CATEGORY_IDS"]]
+            category = self._least_loaded(guild, configured) or self._least_loaded(guild, self.auto_created)
+            if category is None:
+                if not CONFIG["AUTO_OVERFLOW_CATEGORIES"]:
+                    raise PartyCategoriesFull()
+                category = await guild.create_category(CONFIG["OVERFLOW_CATEGORY_NAME"])
+                self.auto_created.append(category.id)
+                self.counts[category.id] = 0
+                self.created += 1
+                logging.info(f"Created overflow category {category.id}, {len(self.auto_created)} in use")
+            self.counts[category.id] = self.load(category) + 1
+            retiring = self._retiring.pop(category.id, None)
+            if retiring is not None:
+                retiring.cancel()
+            return category
+
+    def assign(self, channel_id: int, category_id: int):
+        self.party_category[channel_id] = category_id
+
+    def release(self, category_id: int):
+        self.counts[category_id] = max(self.counts.get(category_id, 1) - 1, 0)
+        self._retire_if_empty(category_id)
+
+    def _retire_if_empty(self, category_id: int):
+        if category_id in self.auto_created and self.counts[category_id] == 0 and category_id not in self._retiring:
+            self._retiring[category_id] = asyncio.create_task(self._retire_later(category_id))
+
+    def closed(self, channel_id: int):
+        category_id = self.party_category.pop(channel_id, None)
+        if category_id is not None:
+            self.release(category_id)
+
+    def adopt(self, guild: discord.Guild):
+        # Overflow categories left over from before a restart are recognised by name
+        configured = [CONFIG["TARGET_CATEGORY_ID"], *CONFIG["OVERFLOW_CATEGORY_IDS"]]
+        for category in guild.categories:
+            if (category.name == CONFIG["OVERFLOW_CATEGORY_NAME"] and category.id not in configured
+                    and category.id not in self.auto_created):
+                self.auto_created.append(category.id)
+                self.counts[category.id] = len(category.channels)
+                self._retire_if_empty(category.id)
+
+    async def _retire_later(self, category_id: int):
+        await asyncio.sleep(CONFIG["OVERFLOW_RETIRE_DELAY"])
+        del self._retiring[category_id]
+        if self.counts.get(category_id):
+            return
+        self.auto_created.remove(category_id)
+        self.counts.pop(category_id, None)
+        category = bot.get_channel(category_id)
+        if category is not None:
+            try:
+                await category.delete()
+            except discord.NotFound:
+                pass
+        self.retired += 1
+        logging.info(f"Retired empty overflow category {category_id}, {len(self.auto_created)} in use")
+
+
+category_allocator = CategoryAllocator()
+
+# ====================== Worm Party Finder Components ======================
+
+class CommandModal(RateLimitedModal):
+    def __init__(self, channel_id: int):
+        super().__init__(title="Set Join Command", custom_id=f"command_modal_{channel_id}_{os.urandom(4).hex()}")
+        self.channel_id = channel_id
+        self.command = TextInput(
+            label="/wormparty join ... ...",
+            placeholder="ex: /wormparty join Peach Test123",
+            max_length=100
+        )
+        self.add_item(self.command)
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        state.active_channels[self.channel_id]['join_cmd'] = self.command.value
+        update_party_embed(self.channel_id)
+        await interaction.response.send_message("Join command updated!", ephemeral=True)
+
+class UsernameModal(RateLimitedModal):
+    def __init__(self, party_type: Optional[PartyType] = None):
+        super().__init__(title="Ign", custom_id=f"username_modal_{os.urandom(8).hex()}")
+        self.party_type = party_type or DEFAULT_PARTY_TYPE
+        self.username = TextInput(
+            label="Ign",
+            placeholder="Ign...",
+            min_length=3,
+            max_length=16
+        )
+        self.add_item(self.username)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        if await reject_if_in_party(interaction):
+            return
+
+        try:
+            # The Mojang lookup plus creating a channel can outlast the 3s to answer
+            await interaction.response.defer(ephemeral=True)
+            profile = await canonical_ign(self.username.value)
+            if profile is None:
+                await send_ephemeral(interaction, embed=unknown_ign_embed(self.username.value))
+                return
+            ign_memory.remember(interaction.user.id, profile[0])
+            await handle_party_join(interaction, profile[0], self.party_type)
+        except Exception as e:
+            logging.error(f"Error in UsernameModal on_submit: {e}", extra=interaction_log_fields(interaction))
+            await send_ephemeral(interaction, "An error occurred while processing your request.")
+
+
+class LockConfirmModal(RateLimitedModal):
+    def __init__(self, channel_id: int):
+        super().__init__(title="Confirm AFK Party", custom_id=f"lock_modal_{channel_id}_{os.urandom(4).hex()}")
+        self.channel_id = channel_id
+        self.confirm = TextInput(
+            label="Type 'AFK' to confirm",  # Shortened label
+            placeholder="Party will be permanently locked (AFK)",
+            max_length=3
+        )
+        self.add_item(self.confirm)
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        if self.confirm.value.upper() != "AFK":
+            await interaction.response.send_message(
+                "You didn't type 'AFK'. Party remains unlocked.",
+                ephemeral=True
+            )
+            return
+            
+        state.active_channels[self.channel_id]['locked'] = True
+        index_party(self.channel_id)
+        party_log.record("lock", self.channel_id, by=interaction.user.id)
+        update_party_embed(self.channel_id)
+        await interaction.response.send_message(
+            "Party has been locked! No one can join now.",
+            ephemeral=True
+        )
+
+class KickSelect(Select):
+    def __init__(self, channel_id: int, members: List[int], usernames: List[str]):
+        self.channel_id = channel_id
+        options = []
+        
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            raise ValueError("Channel not found")
+            
+        guild = channel.guild
+        
+        for member_id, mc_name in zip(members, usernames):
+            member = guild.get_member(member_id)
+            if member:
+                options.append(discord.SelectOption(
+                    label=f"{member.display_name} (MC: {mc_name})",
+                    value=str(member_id)
+                ))
+        
+        super().__init__(
+            placeholder="Select a member to kick...",
+            min_values=1,
+            max_values=1,
+            options=options,
+            custom_id=f"kick_select_{channel_id}"
+        )
+    
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            # Defer the interaction first to prevent timeout
+            await interaction.response.defer(ephemeral=True)
+            
+            party_data = state.active_channels[self.channel_id]
+            if interaction.user.id != party_data['creator_id']:
+                await interaction.followup.send(
+                    "Only the party creator can kick members!",
+                    ephemeral=True
+                )
+                return
+            
+            member_id = int(self.values[0])
+            if member_id == interaction.user.id:
+                await interaction.followup.send(
+                    "You can't kick yourself! Use the leave button instead.",
+                    ephemeral=True
+                )
+                return
+            
+            # Remove the member from the party
+            index = party_data['members'].index(member_id)
+            party_data['members'].pop(index)
+            mc_name = party_data['usernames'].pop(index)
+            index_party(self.channel_id)
+            party_log.record("kick", self.channel_id, user=member_id, by=interaction.user.id)
+            
+            # Remove user from participation tracking
+            if member_id in state.user_participation:
+                del state.user_participation[member_id]
+            
+            channel = interaction.guild.get_channel(self.channel_id)
+            member = interaction.guild.get_member(member_id)
+            
+            permission_batcher.set_access(channel, member_id, False)
+            dm_notifier.notify(
+                [member_id],
+                discord.Embed(
+                    title=f"You were kicked from a {party_type_of(party_data).name} Party",
+                    description=f"You were removed from the party in {channel.mention}",
+                    color=discord.Color.red()
+                )
+            )
+
+            update_party_embed(self.channel_id)
+
+            # Send kick notification to the party channel
+            await channel.send(
+                f"{member.display_name if member else 'A member'} (MC: {mc_name}) was kicked by {interaction.user.mention}"
+            )
+            
+                
+        except Exception as e:
+            logging.error(f"Error in KickSelect callback: {e}", extra=interaction_log_fields(interaction))
+            if not interaction.response.is_done():
+                await interaction.response.send_message(
+                    "An error occurred while processing your request.",
+                    ephemeral=True
+                )
+            else:
+                try:
+                    await interaction.followup.send(
+                        "An error occurred while processing your request.",
+                        ephemeral=True
+                    )
+                except:
+                    pass
+
+
+
+class TransferLeaderSelect(Select):
+    def __init__(self, channel_id: int, options: List[discord.SelectOption]):
+        super().__init__(
+            placeholder="Select new party leader...",
+            min_values=1,
+            max_values=1,
+            options=options,
+            custom_id=f"transfer_select_{channel_id}"
+        )
+        self.channel_id = channel_id
+    
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            # Defer the interaction first to prevent timeout
+            await interaction.response.defer(ephemeral=True)
+            
+            party_data = state.active_channels.get(self.channel_id)
+            if not party_data:
+                await interaction.followup.send("Party data not found!", ephemeral=True)
+                return
+                
+            if interaction.user.id != party_data['creator_id']:
+                await interaction.followup.send(
+                    "Only the current party leader can transfer leadership!",
+                    ephemeral=True
+                )
+                return
+                
+            new_leader_id = int(self.values[0])
+            
+            # Update the creator_id in party data
+            old_leader_id = party_data['creator_id']
+            party_data['creator_id'] = new_leader_id
+            party_log.record("transfer", self.channel_id, user=new_leader_id, previous=old_leader_id, auto=False)
+            
+            # Get member objects for notifications
+            channel = interaction.guild.get_channel(self.channel_id)
+            old_leader = interaction.guild.get_member(old_leader_id)
+            new_leader = interaction.guild.get_member(new_leader_id)
+            
+            # Notify the party
+            if channel:
+                await channel.send(
+                    f"{new_leader.mention if new_leader else 'The new leader'} is now the party leader! "
+                    f"They can now set the join command and manage the party."
+                )
+            
+            # Update the embed with new leader controls
+            update_party_embed(self.channel_id)
+            
+            
+        except Exception as e:
+            logging.error(f"Error in TransferLeaderSelect callback: {e}", extra=interaction_log_fields(interaction))
+            if not interaction.response.is_done():
+                await interaction.response.send_message(
+                    "An error occurred while transferring leadership.",
+                    ephemeral=True
+                )
+            else:
+                try:
+                    await interaction.followup.send(
+                        "An error occurred while transferring leadership.",
+                        ephemeral=True
+                    )
+                except:
+                    pass
+
+
+
+class SizeSelectView(RateLimitedView):
+    def __init__(self, channel_id: int, current_size: int, creator_id: int):
+        super().__init__(timeout=30)
+        self.creator_id = creator_id
+        options = []
+        
+        party_type = party_type_of(state.active_channels[channel_id])
+        for size in range(party_type.min_size, party_type.max_size + 1):
+            options.append(discord.SelectOption(
+                label=f"{size} players",
+                value=str(size),
                 default=(size == current_size)
             ))
         
-        select = Select(
-            placeholder="Select maximum party size...",
-            min_values=1,
-            max_values=1,
-            options=options,
-            custom_id=f"size_select_{channel_id}"
-        )
-        select.callback = self.on_select
-        self.add_item(select)
-    
-    async def on_select(self, interaction: discord.Interaction):
-        try:
-            # Check if the user is the party creator
-            if interaction.user.id != self.creator_id:
-                await interaction.response.send_message(
-                    "Only the party creator can adjust the party size!",
-                    ephemeral=True
-                )
-                return
-                
-            channel_id = int(interaction.data['custom_id'].split('_')[-1])
-            new_size = int(interaction.data['values'][0])
+        select = Select(
+            placeholder="Select maximum party size...",
+            min_values=1,
+            max_values=1,
+            options=options,
+            custom_id=f"size_select_{channel_id}"
+        )
+        select.callback = self.on_select
+        self.add_item(select)
+    
+    async def on_select(self, interaction: discord.Interaction):
+        try:
+            # Check if the user is the party creator
+            if interaction.user.id != self.creator_id:
+                await interaction.response.send_message(
+                    "Only the party creator can adjust the party size!",
+                    ephemeral=True
+                )
+                return
+                
+            channel_id = int(interaction.data['custom_id'].split('_')[-1])
+            new_size = int(interaction.data['values'][0])
+        
+            # Defer the interaction first
+            await interaction.response.defer()
+        
+            state.active_channels[channel_id]['max_size'] = new_size
+            index_party(channel_id)
+            party_log.record("resize", channel_id, size=new_size, by=interaction.user.id)
+            update_party_embed(channel_id)
+        
+            channel = bot.get_channel(channel_id)
+            await channel.send(f"Party size changed to {new_size} players by {interaction.user.mention}")
+        
+            # Edit the original response to show success
+            await interaction.followup.send(
+                content=f"Party size updated to {new_size}",
+                ephemeral=True
+            )
+        
+        except Exception as e:
+            logging.error(f"Error in SizeSelectView: {e}", extra=interaction_log_fields(interaction))
+            if not interaction.response.is_done():
+                await interaction.response.send_message(
+                    "An error occurred while changing party size",
+                    ephemeral=True
+                )
+
+class PartyView(RateLimitedView):
+    def __init__(self, channel_id: int, creator_id: int):
+        super().__init__(timeout=None)
+        self.channel_id = channel_id
+        self.creator_id = creator_id
+        
+        # Set Join CMD button (only for creator)
+        cmd_button = Button(
+            label="Set Join CMD",
+            style=discord.ButtonStyle.blurple,
+            emoji="💻",
+            custom_id=f"cmd_button_{channel_id}"
+        )
+        cmd_button.callback = self.on_cmd_button
+        self.add_item(cmd_button)
+        
+        # Transfer Leader button (only for creator, only if there are other members)
+        party_data = state.active_channels.get(channel_id, {})
+        if party_data.get('creator_id') == creator_id and len(party_data.get('members', [])) > 1:
+            transfer_button = Button(
+                label="Transfer Leader",
+                style=discord.ButtonStyle.grey,
+                emoji="👑",
+                custom_id=f"transfer_button_{channel_id}"
+            )
+            transfer_button.callback = self.on_transfer_button
+            self.add_item(transfer_button)
+
+        # Adjust size button (only for creator)
+        size_button = Button(
+            label="Adjust Size",
+            style=discord.ButtonStyle.grey,
+            emoji="🔢",
+            custom_id=f"size_button_{channel_id}"
+        )
+        size_button.callback = self.on_size_button
+        self.add_item(size_button)
+        
+        # Leave button for everyone
+        leave_button = Button(
+            label="Leave Party",
+            style=discord.ButtonStyle.red,
+            emoji="🚪",
+            custom_id=f"leave_party_{channel_id}"
+        )
+        leave_button.callback = self.on_leave_button
+        self.add_item(leave_button)
+        
+        # Kick button (only for creator)
+        kick_button = Button(
+            label="Kick Member",
+            style=discord.ButtonStyle.red,
+            emoji="👢",
+            custom_id=f"kick_button_{channel_id}"
+        )
+        kick_button.callback = self.on_kick_button
+        self.add_item(kick_button)
+        
+        # Lock button (only for creator, only if not already locked)
+        party_data = state.active_channels.get(channel_id, {})
+        if not party_data.get('locked', False):
+            lock_button = Button(
+                label="AFK Party",
+                style=discord.ButtonStyle.danger,
+                emoji="🔒",
+                custom_id=f"lock_button_{channel_id}"
+            )
+            lock_button.callback = self.on_lock_button
+            self.add_item(lock_button)
+
+    
+    async def on_leave_button(self, interaction: discord.Interaction):
+        if interaction.user.id not in state.active_channels[self.channel_id]['members']:
+            await interaction.response.send_message("You're not in this Party!", ephemeral=True)
+            return
+            
+        index = state.active_channels[self.channel_id]['members'].index(interaction.user.id)
+        state.active_channels[self.channel_id]['members'].pop(index)
+        state.active_channels[self.channel_id]['usernames'].pop(index)
+        index_party(self.channel_id)
+        
+        # Remove user from participation tracking
+        if interaction.user.id in state.user_participation:
+            del state.user_participation[interaction.user.id]
+        
+        channel = interaction.guild.get_channel(self.channel_id)
+        permission_batcher.set_access(channel, interaction.user.id, False)
+        party_log.record("leave", self.channel_id, user=interaction.user.id)
+        
+        # Get the party data and creator
+        party_data = state.active_channels[self.channel_id]
+        creator = interaction.guild.get_member(party_data['creator_id'])
+        notices = []
+        
+        # Check if the leaving user was the creator
+        if interaction.user.id == party_data['creator_id'] and party_data['members']:
+            # Transfer creator role to the oldest remaining member
+            new_creator_id = party_data['members'][0]
+            party_data['creator_id'] = new_creator_id
+            party_log.record("transfer", self.channel_id, user=new_creator_id, previous=interaction.user.id, auto=True)
+            
+            # Notify the Party about the change
+            new_creator = interaction.guild.get_member(new_creator_id)
+            notices.append(dict(
+                content=f"Party creator has left. {new_creator.mention} is now the new Party creator "
+                        "and can set the join command."
+            ))
+            creator = new_creator  # Update creator reference for the leave message
+        
+        # Get the updated member count
+        member_count = len(party_data['members'])
+        party_type = party_type_of(party_data)
         
-            # Defer the interaction first
-            await interaction.response.defer()
+        # Send leave notification if there are still members left
+        if member_count > 0 and member_count in party_type.triggers:
+            leave_embed = discord.Embed(
+                title=f"Player Left the Party",
+                description=f"{interaction.user.mention} has left the party!",
+                color=discord.Color.orange()
+            )
+            leave_embed.add_field(
+                name=f"Updated {party_type.trigger_label}",
+                value=party_type.triggers[member_count],
+                inline=False
+            )
+            leave_embed.set_footer(text=f"Party Creator: {creator.display_name if creator else 'Unknown'}")
+            notices.append(dict(embed=leave_embed))
+
+        # Answer first; the notices and the embed refresh follow in the background
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                title="Left Party",
+                description="You've left the Party.",
+                color=discord.Color.blue()
+            ),
+            ephemeral=True
+        )
         
-            state.active_channels[channel_id]['max_size'] = new_size
-            await update_party_embed(channel_id)
+        # Delete channel if empty
+        if not party_data['members']:
+            await close_party(self.channel_id, "empty")
+        else:
+            side_effects.send_notices(channel, notices)
+            update_party_embed(self.channel_id)
+            await post_initial_button()
+    
+
+    async def on_transfer_button(self, interaction: discord.Interaction):
+        party_data = state.active_channels.get(self.channel_id)
+        if not party_data:
+            await interaction.response.send_message("Party data not found!", ephemeral=True)
+            return
         
-            channel = bot.get_channel(channel_id)
-            await channel.send(f"Party size changed to {new_size} players by {interaction.user.mention}")
+        if interaction.user.id != party_data['creator_id']:
+            await interaction.response.send_message(
+                "Only the party leader can transfer leadership!",
+                ephemeral=True
+            )
+            return
         
-            # Edit the original response to show success
-            await interaction.followup.send(
-                content=f"Party size updated to {new_size}",
+        # Create a select menu of members to transfer to (excluding current leader)
+        options = []
+        for member_id, mc_name in zip(party_data['members'], party_data['usernames']):
+            if member_id != party_data['creator_id']:  # Don't include current leader
+                member = interaction.guild.get_member(member_id)
+                if member:
+                    options.append(discord.SelectOption(
+                        label=f"{member.display_name} (MC: {mc_name})",
+                        value=str(member_id)
+                    ))
+    
+        if not options:
+            await interaction.response.send_message(
+                "There are no other members to transfer leadership to!",
                 ephemeral=True
             )
+            return
         
-        except Exception as e:
-            logging.error(f"Error in SizeSelectView: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "An error occurred while changing party size",
-                    ephemeral=True
-                )
+        view = RateLimitedView(timeout=30)
+        view.add_item(TransferLeaderSelect(self.channel_id, options))
+    
+        await interaction.response.send_message(
+            "Select the new party leader:",
+            view=view,
+        )
 
-class PartyView(View):
-    def __init__(self, channel_id: int, creator_id: int):
-        super().__init__(timeout=None)
-        self.channel_id = channel_id
-        self.creator_id = creator_id
+
+
+    async def on_cmd_button(self, interaction: discord.Interaction):
+        if interaction.user.id != state.active_channels[self.channel_id]['creator_id']:
+            await interaction.response.send_message(
+                "Only the Party creator can set the join command!",
+                ephemeral=True
+            )
+            return
         
-        # Set Join CMD button (only for creator)
-        cmd_button = Button(
-            label="Set Join CMD",
-            style=discord.ButtonStyle.blurple,
-            emoji="💻",
-            custom_id=f"cmd_button_{channel_id}"
+        await interaction.response.send_modal(CommandModal(self.channel_id))
+
+
+    async def on_size_button(self, interaction: discord.Interaction):
+        party_data = state.active_channels[self.channel_id]
+        if interaction.user.id != party_data['creator_id']:
+            await interaction.response.send_message(
+                "Only the party creator can adjust the party size!",
+                ephemeral=True
+            )
+            return
+
+        current_size = party_data['max_size']
+        current_members = len(party_data['members'])
+
+        if current_members > current_size:
+            await interaction.response.send_message(
+                f"You currently have {current_members} members which is more than your set maximum ({current_size}). "
+                "You can't reduce the size below your current member count.",
+                ephemeral=True
+            )
+            return
+
+        # Defer before sending the view
+
+        await interaction.response.defer(ephemeral=False)
+        view = SizeSelectView(self.channel_id, current_size, party_data['creator_id'])
+        await interaction.followup.send(
+            "Select the new maximum party size:",
+            view=view
         )
-        cmd_button.callback = self.on_cmd_button
-        self.add_item(cmd_button)
-        
-        # Transfer Leader button (only for creator, only if there are other members)
-        party_data = state.active_channels.get(channel_id, {})
-        if party_data.get('creator_id') == creator_id and len(party_data.get('members', [])) > 1:
-            transfer_button = Button(
-                label="Transfer Leader",
-                style=discord.ButtonStyle.grey,
-                emoji="👑",
-                custom_id=f"transfer_button_{channel_id}"
+
+
+    async def on_kick_button(self, interaction: discord.Interaction):
+        party_data = state.active_channels[self.channel_id]
+        if interaction.user.id != party_data['creator_id']:
+            await interaction.response.send_message(
+                "Only the party creator can kick members!",
+                ephemeral=True
+            )
+            return
+
+        # Don't allow kicking if there's only 1 member
+        if len(party_data['members']) <= 1:
+            await interaction.response.send_message(
+                "You can't kick yourself! Use the leave button instead.",
+                ephemeral=True
+            )
+            return
+
+        # Create a view with select menu of members to kick
+        view = RateLimitedView(timeout=30)
+        view.add_item(KickSelect(
+            self.channel_id,
+            party_data['members'],
+            party_data['usernames']
+        ))
+
+        # Send the response with the view
+        await interaction.response.send_message(
+            "Select a member to kick:",
+            view=view,
+            ephemeral=False
+        )
+    
+
+    
+    async def on_lock_button(self, interaction: discord.Interaction):
+        if interaction.user.id != state.active_channels[self.channel_id]['creator_id']:
+            await interaction.response.send_message(
+                "Only the Party creator can lock the party!",
+                ephemeral=True
+            )
+            return
+            
+        await interaction.response.send_modal(LockConfirmModal(self.channel_id))
+
+def update_party_embed(channel_id: int):
+    # Refreshed in the background, so a reply never waits on the retries. The
+    # embed is rebuilt from BotState when the refresh runs, so one that is shed
+    # or fails during an outage only leaves it stale until the next change
+    channel = bot.get_channel(channel_id)
+    if not channel or channel_id not in state.active_channels:
+        return
+    if state.active_channels[channel_id]['message_id'] is None:
+        return  # create_party is still sending the message, which shows the current members
+    side_effects.spawn("refresh party embed", lambda: render_party_embed(channel), channel_id=channel_id)
+
+async def render_party_embed(channel: discord.TextChannel):
+    channel_id = channel.id
+    data = state.active_channels.get(channel_id)
+    if data is None:
+        return  # Closed while a retry was waiting
+    message = await channel.fetch_message(data['message_id'])
+    
+    embed = discord.Embed(
+        title=party_title(data),
+        color=discord.Color.green()
+    )
+    
+    # Add locked status to title if party is locked
+    if data.get('locked', False):
+        embed.title += " (LOCKED 🔒)"
+    
+    # Players list
+    player_list = []
+    for i, (member_id, mc_name) in enumerate(zip(data['members'], data['usernames']), 1):
+        player_list.append(f"{i}. <@{member_id}> (MC: {mc_name})")
+    
+    embed.add_field(
+        name="Players",
+        value="\n".join(player_list) or "No players in Party",
+        inline=False
+    )
+    
+    # Join command (if set)
+    if data.get('join_cmd'):
+        embed.add_field(
+            name="Join Command",
+            value=f"```{data['join_cmd']}```",
+            inline=False
+        )
+    
+    player_count = len(data['members'])
+    max_size = data['max_size']
+    status = "Party complete! 🎉" if player_count == max_size else f"{player_count}/{max_size} players joined"
+    
+    # Add locked status to footer if party is locked
+    if data.get('locked', False):
+        status += " | PARTY LOCKED 🔒"
+    
+    embed.set_footer(text=status)
+    
+    view = PartyView(channel_id, data['creator_id'])
+    await message.edit(embed=embed, view=view)
+    
+    # Pin the message if it's not already pinned
+    if not message.pinned:
+        side_effects.spawn("pin message", message.pin, channel_id=channel_id)
+    
+
+async def handle_party_join(interaction: discord.Interaction, mc_username: str, party_type: Optional[PartyType] = None):
+    party_type = party_type or DEFAULT_PARTY_TYPE
+    # First check if user is trying to join a locked party
+    ch_id = state.user_participation.get(interaction.user.id)
+    if ch_id is not None:
+        data = state.active_channels.get(ch_id)
+        if data is not None and data.get('locked', False):
+            channel = bot.get_channel(ch_id)
+            await send_ephemeral(
+                interaction,
+                embed=discord.Embed(
+                    title="Party Locked",
+                    description=f"The party in {channel.mention} is locked and not accepting new members.",
+                    color=discord.Color.red()
+                )
+            )
+            return
+
+    member_cache.touch(interaction.user)
+
+    if CONFIG["MATCHMAKING_MODE"]:
+        await enqueue_for_matchmaking(interaction, mc_username, party_type)
+        return
+
+    # Only this type's index is consulted, other activities' parties are never scanned
+    channel = None
+    ch_id = state.party_indexes[party_type.key].first_open()
+    if ch_id is not None:
+        channel = interaction.guild.get_channel(ch_id)
+
+    if channel is None:
+        # Create new party channel
+        try:
+            channel = await create_party(interaction.guild, [(interaction.user.id, mc_username)], party_type)
+        except PartyCategoriesFull:
+            await send_ephemeral(
+                interaction,
+                embed=discord.Embed(
+                    title="No Room",
+                    description="All party categories are full, please try again later!",
+                    color=discord.Color.red()
+                )
+            )
+            return
+        await post_initial_button()
+
+        await send_ephemeral(
+            interaction,
+            embed=discord.Embed(
+                title="Party Created!",
+                description=f"You've started a new Party in {channel.mention}",
+                color=discord.Color.green()
             )
-            transfer_button.callback = self.on_transfer_button
-            self.add_item(transfer_button)
+        )
+    else:
+        # Join existing party
+        add_party_members(channel, [(interaction.user.id, mc_username)])
+        await send_ephemeral(
+            interaction,
+            embed=discord.Embed(
+                title="Joined Party!",
+                description=f"You've joined {channel.mention}",
+                color=discord.Color.green()
+            )
+        )
 
-        # Adjust size button (only for creator)
-        size_button = Button(
-            label="Adjust Size",
-            style=discord.ButtonStyle.grey,
-            emoji="🔢",
-            custom_id=f"size_button_{channel_id}"
+creating_party_numbers: set = set()  # (type key, number) of parties whose channel is being created
+
+
+def next_party_number(party_type: PartyType) -> int:
+    # The lowest number no party of this type has, so a party keeps its number
+    # when an earlier one closes and numbers stay small
+    used = {state.active_channels[channel_id].get('number') for channel_id in state.party_indexes[party_type.key].parties}
+    used.update(number for key, number in creating_party_numbers if key == party_type.key)
+    number = 1
+    while number in used:
+        number += 1
+    return number
+
+
+async def create_party(guild: discord.Guild, members: List[Tuple[int, str]],
+                       party_type: Optional[PartyType] = None) -> discord.TextChannel:
+    # members: [(user_id, mc_username)], the first one leads the party. Every
+    # member's overwrite goes into the create call, so no follow-up permission edits
+    party_type = party_type or DEFAULT_PARTY_TYPE
+    creator_id = members[0][0]
+    overwrites = {guild.default_role: discord.PermissionOverwrite(read_messages=False)}
+    for user_id, _ in members:
+        overwrites[discord.Object(id=user_id, type=discord.Member)] = discord.PermissionOverwrite(read_messages=True)
+    number = next_party_number(party_type)
+    creating_party_numbers.add((party_type.key, number))
+    try:
+        category = await category_allocator.reserve(guild)
+        try:
+            channel = await category.create_text_channel(f'{party_type.name}-Party-{number}', overwrites=overwrites)
+        except discord.HTTPException:
+            category_allocator.release(category.id)
+            raise
+    finally:
+        creating_party_numbers.discard((party_type.key, number))
+    category_allocator.assign(channel.id, category.id)
+    recorder.record("channel_create", channel=channel.id)
+
+    state.active_channels[channel.id] = {
+        'members': [user_id for user_id, _ in members],
+        'usernames': [mc_username for _, mc_username in members],
+        'message_id': None,
+        'creator_id': creator_id,
+        'join_cmd': None,
+        'max_size': party_type.max_size,
+        'locked': False,
+        'type': party_type.key,
+        'number': number
+    }
+    index_party(channel.id)
+
+    # Track user participation
+    for user_id, _ in members:
+        state.user_participation[user_id] = channel.id
+    party_log.record("create", channel.id, members=[user_id for user_id, _ in members],
+                     max_size=party_type.max_size, type=party_type.key)
+    idle_parties.touch(channel.id)
+
+    view = PartyView(channel.id, creator_id)
+    state.party_views[channel.id] = view
+
+    embed = discord.Embed(
+        title=party_title(state.active_channels[channel.id]),
+        color=discord.Color.green()
+    )
+    embed.add_field(
+        name="Players",
+        value="\n".join(f"{i}. <@{user_id}> (MC: {mc_username})" for i, (user_id, mc_username) in enumerate(members, 1)),
+        inline=False
+    )
+    embed.set_footer(text=f"{len(members)}/{party_type.max_size} players joined")
+
+    message = await channel.send(embed=embed, view=view)
+    state.active_channels[channel.id]['message_id'] = message.id
+    index_party(channel.id)  # now open for joins, which refresh the message's embed
+
+    side_effects.spawn("pin message", message.pin, channel_id=channel.id)
+    return channel
+
+def add_party_members(channel: discord.TextChannel, members: List[Tuple[int, str]]):
+    # Updates the state right away; the notices and the embed refresh follow in
+    # the background so the caller can answer the interaction first
+    party_data = state.active_channels[channel.id]
+    for user_id, mc_username in members:
+        party_data['members'].append(user_id)
+        party_data['usernames'].append(mc_username)
+        state.user_participation[user_id] = channel.id
+        permission_batcher.set_access(channel, user_id, True)
+        index_party(channel.id)
+        party_log.record("join", channel.id, user=user_id)
+
+    # Get the current member count
+    member_count = len(party_data['members'])
+    party_type = party_type_of(party_data)
+    
+    notices = []
+    if member_count in party_type.triggers:
+        mentions = ", ".join(f"<@{user_id}>" for user_id, _ in members)
+        join_embed = discord.Embed(
+            title=f"New Player Joined!" if len(members) == 1 else "New Players Joined!",
+            description=f"{mentions} {'has' if len(members) == 1 else 'have'} joined the party!",
+            color=discord.Color.green()
         )
-        size_button.callback = self.on_size_button
-        self.add_item(size_button)
-        
-        # Leave button for everyone
-        leave_button = Button(
-            label="Leave Party",
-            style=discord.ButtonStyle.red,
-            emoji="🚪",
-            custom_id=f"leave_party_{channel_id}"
+        join_embed.add_field(
+            name=party_type.trigger_label,
+            value=party_type.triggers[member_count],
+            inline=False
         )
-        leave_button.callback = self.on_leave_button
-        self.add_item(leave_button)
-        
-        # Kick button (only for creator)
-        kick_button = Button(
-            label="Kick Member",
-            style=discord.ButtonStyle.red,
-            emoji="👢",
-            custom_id=f"kick_button_{channel_id}"
+        notices.append(dict(embed=join_embed))
+    if len(party_data['members']) == party_type.max_size:
+        notices.append(dict(content="Your Party is full!"))
+    side_effects.send_notices(channel, notices)
+
+    update_party_embed(channel.id)
+
+async def on_join_button(interaction: discord.Interaction, party_type: Optional[PartyType] = None):
+    # Rate limited by the join button's RateLimitedView
+    party_type = party_type or DEFAULT_PARTY_TYPE
+
+    if queued_type(interaction.user.id) is not None:
+        leave_matchmaking_queue(interaction.user.id)
+        await interaction.response.send_message(
+            embed=discord.Embed(
+                title="Left the Queue",
+                description="You left the matchmaking queue.",
+                color=discord.Color.orange()
+            ),
+            ephemeral=True
         )
-        kick_button.callback = self.on_kick_button
-        self.add_item(kick_button)
-        
-        # Lock button (only for creator, only if not already locked)
-        party_data = state.active_channels.get(channel_id, {})
-        if not party_data.get('locked', False):
-            lock_button = Button(
-                label="AFK Party",
-                style=discord.ButtonStyle.danger,
-                emoji="🔒",
-                custom_id=f"lock_button_{channel_id}"
-            )
-            lock_button.callback = self.on_lock_button
-            self.add_item(lock_button)
+        return
+
+    if await reject_if_in_party(interaction):
+        return
 
+    recent = ign_memory.recent(interaction.user.id)
+    if recent:
+        # Returning players skip the IGN modal; /join <ign> switches accounts.
+        # Creating their party can take longer than the 3s response deadline
+        await interaction.response.defer(ephemeral=True)
+        await handle_party_join(interaction, recent[0], party_type)
+        return
     
-    async def on_leave_button(self, interaction: discord.Interaction):
-        if interaction.user.id not in state.active_channels[self.channel_id]['members']:
-            await interaction.response.send_message("You're not in this Party!", ephemeral=True)
-            return
-            
-        index = state.active_channels[self.channel_id]['members'].index(interaction.user.id)
-        state.active_channels[self.channel_id]['members'].pop(index)
-        state.active_channels[self.channel_id]['usernames'].pop(index)
-        
-        # Remove user from participation tracking
-        if interaction.user.id in state.user_participation:
-            del state.user_participation[interaction.user.id]
-        
-        channel = interaction.guild.get_channel(self.channel_id)
-        await channel.set_permissions(
-            interaction.user,
-            read_messages=False,
-            send_messages=False
+    await interaction.response.send_modal(UsernameModal(party_type))
+
+async def send_ephemeral(interaction: discord.Interaction, content: Optional[str] = None, **kwargs):
+    # Joins defer before slow work (IGN lookup, channel creation); the reply then goes out as a followup
+    if interaction.response.is_done():
+        await interaction.followup.send(content, ephemeral=True, **kwargs)
+    else:
+        await interaction.response.send_message(content, ephemeral=True, **kwargs)
+
+async def reject_if_in_party(interaction: discord.Interaction) -> bool:
+    if interaction.user.id not in state.user_participation:
+        return False
+    channel_id = state.user_participation[interaction.user.id]
+    channel = bot.get_channel(channel_id)
+    await send_ephemeral(
+        interaction,
+        embed=discord.Embed(
+            title="Already in a Party",
+            description=f"You're already in a party! Please leave {channel.mention} before joining another.",
+            color=discord.Color.red()
         )
+    )
+    return True
+
+def lobby_description() -> str:
+    if len(PARTY_TYPES) == 1:
+        description = (
+            f"Click the button to create a {DEFAULT_PARTY_TYPE.name} party, "
+            "or use `/join <ign>` to play on a different account."
+        )
+    else:
+        description = "Click a button to create a party, or use `/join <ign>` to play on a different account."
+    for party_type in PARTY_TYPES.values():
+        heading = "Current active parties" if len(PARTY_TYPES) == 1 else f"{party_type.name} parties"
+        description += f"\n\n**{heading}:** {len(state.party_indexes[party_type.key].parties)}"
+        waiting = state.matchmaking_queues[party_type.key]
+        if CONFIG["MATCHMAKING_MODE"]:
+            description += f"\n**Waiting for a party:** {len(waiting)}"
+            now = datetime.now()
+            for position, user_id in enumerate(list(waiting)[:10], 1):
+                description += f"\n{position}. <@{user_id}> ~{estimated_wait(user_id, now, party_type)}s"
+    return description
+
+def lobby_board() -> Tuple[discord.Embed, View]:
+    embed = discord.Embed(
+        title=f"{DEFAULT_PARTY_TYPE.name} Party Finder" if len(PARTY_TYPES) == 1 else "Party Finder",
+        description=lobby_description(),
+        color=discord.Color.blue()
+    )
+    view = RateLimitedView(timeout=None, action="join")
+    for party_type in PARTY_TYPES.values():
+        join_button = Button(
+            label=f"Join / Create a {party_type.name} Party",
+            style=discord.ButtonStyle.green,
+            emoji=party_type.emoji,
+            custom_id=party_type.button_id
+        )
+        join_button.callback = functools.partial(on_join_button, party_type=party_type)
+        view.add_item(join_button)
+    return embed, view
+
+async def post_initial_button():
+    channel = bot.get_channel(CONFIG["YOUR_CHANNEL_ID"])
+    if not channel:
+        return
+
+    try:
+        message = None
+        if not state.initial_button_message_id:
+            # Search for the last message sent by the bot in this channel
+            async for msg in channel.history(limit=10):
+                if msg.author == bot.user and msg.embeds and "Party Finder" in msg.embeds[0].title:
+                    message = msg
+                    state.initial_button_message_id = msg.id
+                    break
+
+        if state.initial_button_message_id:
+            # Update existing message. Refreshing the board is cosmetic: it is retried and
+            # shed while Discord is failing, and a failed refresh mustn't post a second board
+            async def refresh():
+                target = message or await channel.fetch_message(state.initial_button_message_id)
+                embed, view = lobby_board()
+                await target.edit(embed=embed, view=view)
+
+            await side_effects.run("refresh lobby", refresh, channel_id=channel.id)
+            return
         
-        # Get the party data and creator
-        party_data = state.active_channels[self.channel_id]
-        creator = interaction.guild.get_member(party_data['creator_id'])
-        
-        # Check if the leaving user was the creator
-        if interaction.user.id == party_data['creator_id'] and party_data['members']:
-            # Transfer creator role to the oldest remaining member
-            new_creator_id = party_data['members'][0]
-            party_data['creator_id'] = new_creator_id
-            
-            # Notify the Party about the change
-            new_creator = interaction.guild.get_member(new_creator_id)
+    except discord.NotFound:
+        pass  # Message doesn't exist, will create new one
+    except Exception as e:
+        logging.error(f"Error while trying to find/edit message: {e}")
+    
+    # Create new message if we couldn't find an existing one
+    embed, view = lobby_board()
+    message = await channel.send(embed=embed, view=view)
+    state.initial_button_message_id = message.id
+
+# ====================== Idle Parties ======================
+
+class IdlePartyCollector:
+    # Deadlines live in a heap; activity only updates a timestamp, and a popped
+    # deadline that activity has made stale is pushed back with the new one
+    def __init__(self):
+        self._deadlines: List[Tuple[float, int]] = []  # heap of (deadline, channel_id)
+        self._last_activity: Dict[int, float] = {}
+        self._closing_at: Dict[int, float] = {}  # warned parties and when they close
+        self.reclaimed = 0
+
+    def touch(self, channel_id: int):
+        if not CONFIG["PARTY_IDLE_TIMEOUT"]:
+            return
+        now = datetime.now().timestamp()
+        if channel_id not in self._last_activity:
+            heapq.heappush(self._deadlines, (now + self._warn_after(), channel_id))
+        self._last_activity[channel_id] = now
+        self._closing_at.pop(channel_id, None)
+
+    def _warn_after(self) -> float:
+        return max(0, CONFIG["PARTY_IDLE_TIMEOUT"] - CONFIG["PARTY_IDLE_WARNING"])
+
+    def due(self, now: float) -> Tuple[List[int], List[int]]:
+        # Returns (parties to warn, parties to close)
+        to_warn, to_close = [], []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, channel_id = heapq.heappop(self._deadlines)
+            if channel_id not in state.active_channels:
+                self._last_activity.pop(channel_id, None)
+                self._closing_at.pop(channel_id, None)
+                continue
+
+            last_activity = self._last_activity.get(channel_id, now)
+            if channel_id in self._closing_at and now >= self._closing_at[channel_id]:
+                to_close.append(channel_id)
+                self._last_activity.pop(channel_id, None)
+                del self._closing_at[channel_id]
+            elif channel_id not in self._closing_at and now - last_activity >= self._warn_after():
+                # Always give the full warning period, even if the deadline was overslept
+                closing_at = max(last_activity + CONFIG["PARTY_IDLE_TIMEOUT"], now + CONFIG["PARTY_IDLE_WARNING"])
+                self._closing_at[channel_id] = closing_at
+                heapq.heappush(self._deadlines, (closing_at, channel_id))
+                to_warn.append(channel_id)
+            else:
+                heapq.heappush(self._deadlines, (last_activity + self._warn_after(), channel_id))
+        return to_warn, to_close
+
+
+idle_parties = IdlePartyCollector()
+
+async def close_party(channel_id: int, reason: str) -> bool:
+    # Every party close goes through here. The state is dropped before the
+    # delete so nobody is placed into a channel that is going away; if Discord
+    # refuses the delete the party is registered again, so the channel isn't
+    # orphaned and the idle sweep closes it later. Returns whether it closed
+    party_data = state.active_channels.pop(channel_id, None)
+    if party_data is None:
+        return False
+    unindex_party(channel_id, party_data)
+    offline = {}  # {member_id: (last online, countdown message)}, put back if the delete fails
+    for member_id in party_data['members']:
+        if state.user_participation.get(member_id) == channel_id:
+            del state.user_participation[member_id]
+        offline[member_id] = (state.last_online_time.pop(member_id, None), state.offline_warning_messages.pop(member_id, None))
+    view = state.party_views.pop(channel_id, None)
+
+    channel = bot.get_channel(channel_id)
+    if channel:
+        try:
+            await channel.delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            logging.error(f"Failed to delete party channel {channel_id}, keeping the party: {e}")
+            reopen_party(channel_id, party_data, view, offline)
+            return False
+    category_allocator.closed(channel_id)
+    party_log.record("close", channel_id, reason=reason)
+    await post_initial_button()
+    return True
+
+def reopen_party(channel_id: int, party_data: dict, view: Optional[View], offline: dict):
+    # Members who joined another party while the delete was pending stay there
+    kept = [
+        (member_id, username) for member_id, username in zip(party_data['members'], party_data['usernames'])
+        if state.user_participation.get(member_id, channel_id) == channel_id
+    ]
+    party_data['members'] = [member_id for member_id, _ in kept]
+    party_data['usernames'] = [username for _, username in kept]
+    state.active_channels[channel_id] = party_data
+    for member_id in party_data['members']:
+        state.user_participation[member_id] = channel_id
+        last_online, countdown = offline.get(member_id, (None, None))
+        if last_online is not None:
+            state.last_online_time.setdefault(member_id, last_online)
+        if countdown is not None:
+            state.offline_warning_messages.setdefault(member_id, countdown)
+    if view is not None:
+        state.party_views[channel_id] = view
+    index_party(channel_id)
+    idle_parties.touch(channel_id)
+
+@tasks.loop(seconds=30)
+@graceful_shutdown.periodic
+async def collect_idle_parties():
+    to_warn, to_close = idle_parties.due(datetime.now().timestamp())
+    for channel_id in to_warn:
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            continue
+        minutes = CONFIG["PARTY_IDLE_WARNING"] // 60
+        try:
             await channel.send(
-                f"Party creator has left. {new_creator.mention} is now the new Party creator "
-                "and can set the join command."
+                embed=discord.Embed(
+                    title="Party Inactive",
+                    description=(
+                        f"This party has been inactive for a while and will be closed in **{minutes} minutes**.\n"
+                        "Send a message or use a party button to keep it open."
+                    ),
+                    color=discord.Color.orange()
+                )
             )
-            creator = new_creator  # Update creator reference for the leave message
-        
-        # Get the updated member count
-        member_count = len(party_data['members'])
-        
-        # Create the appropriate trigger message based on member count
-        trigger_messages = {
-            1: "1 Member = 15-20",
-            2: "2 Member = 25-30",
-            3: "3 Member = 35-40",
-            4: "4 Member = 45-50",
-            5: "5 Member = 50-55",
-            6: "6 Member = 55-60"
-        }
-        
-        # Send leave notification if there are still members left
-        if member_count > 0 and member_count in trigger_messages:
-            leave_embed = discord.Embed(
-                title=f"Player Left the Party",
-                description=f"{interaction.user.mention} has left the party!",
+        except discord.HTTPException as e:
+            logging.warning(f"Failed to warn idle party {channel_id}: {e}")
+
+    for channel_id in to_close:
+        party_data = state.active_channels.get(channel_id)
+        if party_data is None:
+            continue
+        dm_notifier.notify(
+            party_data['members'],
+            discord.Embed(
+                title="Party Closed",
+                description=f"Your {party_type_of(party_data).name} party was closed because it was inactive.",
                 color=discord.Color.orange()
             )
-            leave_embed.add_field(
-                name="Updated Worm Trigger Count",
-                value=trigger_messages[member_count],
-                inline=False
-            )
-            leave_embed.set_footer(text=f"Party Creator: {creator.display_name if creator else 'Unknown'}")
-            await channel.send(embed=leave_embed)
+        )
+        if await close_party(channel_id, "idle"):
+            idle_parties.reclaimed += 1
+    if to_close:
+        logging.info(f"Closed {len(to_close)} idle parties, {idle_parties.reclaimed} reclaimed since startup")
+
+# ====================== Matchmaking ======================
+
+async def enqueue_for_matchmaking(interaction: discord.Interaction, mc_username: str, party_type: PartyType):
+    user_id = interaction.user.id
+    waiting = state.matchmaking_queues[party_type.key]
+    if user_id not in waiting:
+        waiting[user_id] = (mc_username, datetime.now())
+    position = list(waiting).index(user_id) + 1
+    await send_ephemeral(
+        interaction,
+        embed=discord.Embed(
+            title="Joined the Queue",
+            description=(
+                f"You're **#{position}** in the {party_type.name} matchmaking queue, "
+                f"estimated wait **~{estimated_wait(user_id, datetime.now(), party_type)}s**.\n"
+                "You'll be pinged in your party channel. Click the button again to leave the queue."
+            ),
+            color=discord.Color.green()
+        )
+    )
+
+def leave_matchmaking_queue(user_id: int):
+    for waiting in state.matchmaking_queues.values():
+        waiting.pop(user_id, None)
+
+def estimated_wait(user_id: int, now: datetime, party_type: PartyType) -> int:
+    interval = CONFIG["MATCHMAKING_INTERVAL"]
+    next_batch = interval
+    if run_matchmaking.next_iteration is not None:
+        next_batch = max(0, (run_matchmaking.next_iteration - discord.utils.utcnow()).total_seconds())
+
+    # Open seats the next batch can fill: free slots in this type's open parties plus whole new parties
+    target = party_type.max_size
+    waiting = state.matchmaking_queues[party_type.key]
+    open_seats = 0
+    for channel_id in state.party_indexes[party_type.key].open:
+        data = state.active_channels[channel_id]
+        open_seats += data['max_size'] - len(data['members'])
+    queued = len(waiting)
+    seats = open_seats + (queued - min(open_seats, queued)) // target * target
+    position = list(waiting).index(user_id) + 1
+    if position <= seats:
+        return math.ceil(next_batch)
+
+    # Otherwise the batch after the oldest player reaches MATCHMAKING_MAX_WAIT places everyone
+    _, oldest_queued_at = next(iter(waiting.values()))
+    remaining = CONFIG["MATCHMAKING_MAX_WAIT"] - (now - oldest_queued_at).total_seconds()
+    if remaining <= next_batch:
+        return math.ceil(next_batch)
+    return math.ceil(next_batch + math.ceil((remaining - next_batch) / interval) * interval)
+
+def pop_queued(waiting: OrderedDict, count: int) -> List[Tuple[int, str]]:
+    batch = []
+    while waiting and len(batch) < count:
+        user_id, (mc_username, _) = waiting.popitem(last=False)
+        batch.append((user_id, mc_username))
+    return batch
+
+async def match_queued_players():
+    for party_type in PARTY_TYPES.values():
+        await match_queued_type(party_type)
+
+async def match_queued_type(party_type: PartyType):
+    waiting = state.matchmaking_queues[party_type.key]
+    if not waiting:
+        return
+    lobby = bot.get_channel(CONFIG["YOUR_CHANNEL_ID"])
+    if lobby is None:
+        logging.error(f"Matchmaking: couldn't find the lobby channel for {party_type.name} parties")
+        return
+
+    target = party_type.max_size
+    _, oldest_queued_at = next(iter(waiting.values()))
+    oldest_is_due = datetime.now() - oldest_queued_at >= timedelta(seconds=CONFIG["MATCHMAKING_MAX_WAIT"])
+    formed = 0
+
+    # Top up this type's open parties first, then form full parties; the remainder
+    # waits for more players until the oldest of them has waited long enough
+    for channel_id in state.party_indexes[party_type.key].open_oldest_first():
+        if not waiting:
+            break
+        data = state.active_channels.get(channel_id)
+        channel = bot.get_channel(channel_id)
+        if data is None or channel is None:
+            continue
+        free = data['max_size'] - len(data['members'])
+        if free <= 0 or data.get('locked', False):  # changed while earlier parties were topped up
+            continue
+        batch = pop_queued(waiting, free)
+        add_party_members(channel, batch)
+        await channel.send(" ".join(f"<@{user_id}>" for user_id, _ in batch) + " you've been matched into this party!")
+
+    while len(waiting) >= target or (waiting and oldest_is_due):
+        batch = pop_queued(waiting, target)
+        try:
+            channel = await create_party(lobby.guild, batch, party_type)
+        except (discord.HTTPException, PartyCategoriesFull) as e:
+            logging.error(f"Matchmaking: failed to create a party for {len(batch)} players: {e}")
+            # Put them back at the front, in order, and retry next batch
+            for user_id, mc_username in reversed(batch):
+                waiting[user_id] = (mc_username, oldest_queued_at)
+                waiting.move_to_end(user_id, last=False)
+            break
+        formed += 1
+        await channel.send(" ".join(f"<@{user_id}>" for user_id, _ in batch) + " your party is ready!")
+
+    if formed:
+        logging.info(f"Matchmaking: formed {formed} {party_type.name} parties, {len(waiting)} players still waiting")
+
+@tasks.loop(seconds=CONFIG["MATCHMAKING_INTERVAL"])
+@graceful_shutdown.periodic
+async def run_matchmaking():
+    had_queue = any(state.matchmaking_queues.values())
+    try:
+        await match_queued_players()
+    except Exception as e:
+        logging.error(f"Error in matchmaking: {e}")
+    # The lobby board shows queue positions and waits, refresh it while anyone is or was queued
+    if had_queue:
+        await post_initial_button()
+
+# ====================== Wormfishing Guide Components ======================
+
+class MenuView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(Button(style=discord.ButtonStyle.primary, label="Taunahi Settings", custom_id="taunahi_settings"))
+        self.add_item(Button(style=discord.ButtonStyle.success, label="3rd Party Mods", custom_id="third_party_mods"))
+        self.add_item(Button(style=discord.ButtonStyle.danger, label="Ingame Setup", custom_id="ingame_setup"))
+
+class ThirdPartyModsView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(Button(style=discord.ButtonStyle.primary, label="Odin", custom_id="odin_mod"))
+        self.add_item(Button(style=discord.ButtonStyle.secondary, label="Chattriggers", custom_id="chattriggers_mod"))
+        self.add_item(Button(style=discord.ButtonStyle.success, label="NEU", custom_id="neu_mod"))
+
+class IngameSetupView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(Button(style=discord.ButtonStyle.primary, label="Fishing Setup", custom_id="fishing_setup"))
+        self.add_item(Button(style=discord.ButtonStyle.secondary, label="Cage Setup", custom_id="cage_setup"))
+
+class FishingSetupView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(Button(emoji="🛡️", label="Armor", custom_id="fishing_armor", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="🧰", label="Equipment", custom_id="fishing_equipment", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="🐚", label="Pet", custom_id="fishing_pet", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="🎣", label="Fishing Rod", custom_id="fishing_rod", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="⚔️", label="Weapons", custom_id="fishing_weapons", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="🪨", label="Power Stone", custom_id="power_stone", style=discord.ButtonStyle.primary))
+        self.add_item(Button(emoji="⛏️", label="HOTM", custom_id="fishing_hotm", style=discord.ButtonStyle.primary))
+
+# Guide buttons are answered in on_interaction rather than by view callbacks
+GUIDE_BUTTON_IDS = {
+    "taunahi_settings", "third_party_mods", "ingame_setup", "odin_mod", "chattriggers_mod", "neu_mod",
+    "fishing_setup", "cage_setup", "fishing_armor", "fishing_equipment", "fishing_pet", "fishing_rod",
+    "fishing_weapons", "power_stone", "fishing_hotm"
+}
+
+# ====================== Guide Assets ======================
+
+GUIDE_IMAGES = {  # {asset name: original attachment link}, only downloaded for images missing from GUIDE_ASSET_DIR
+    "taunahi_settings_1": "https://cdn.discordapp.com/attachments/1373747930066063472/1373834661033414829/Screenshot_2025-05-19_030542.png",
+    "taunahi_settings_2": "https://cdn.discordapp.com/attachments/1373747930066063472/1373834661830197298/Screenshot_2025-05-19_030627.png",
+    "taunahi_settings_3": "https://cdn.discordapp.com/attachments/1373747930066063472/1373834661435805746/Screenshot_2025-05-19_030649.png",
+    "magma_lord_helmet": "https://cdn.discordapp.com/attachments/1374148859034468496/1374148870249910342/magma_lord_helmet.png",
+    "magma_lord_chestplate": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149395939065916/magma_lord_chestplate.png",
+    "magma_lord_leggings": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149434518143066/magma_lord_leggings.png",
+    "magma_lord_boots": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149467124793364/magma_lord_boots.png",
+    "thunderbolt_necklace": "https://cdn.discordapp.com/attachments/1374148859034468496/1374777154675540139/Thunderbolt_Necklace.png",
+    "gillsplash_cloak": "https://cdn.discordapp.com/attachments/1374148859034468496/1374525958458970322/latest.png",
+    "gillsplash_belt": "https://cdn.discordapp.com/attachments/1374148859034468496/1374526000699801621/latest.png",
+    "gillsplash_gloves": "https://cdn.discordapp.com/attachments/1374148859034468496/1374526044274430033/latest.png",
+    "ammonite": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149564159754311/a074a7bd976fe6aba1624161793be547d54c835cf422243a851ba09d1e650553.png",
+    "hellfire_rod": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149629637034074/hellfire_rod.png",
+    "hyperion": "https://cdn.discordapp.com/attachments/1374148859034468496/1374150077974577306/hyperion.png",
+    "dreadlord_sword": "https://cdn.discordapp.com/attachments/1374148859034468496/1374149764853268642/dreadlord_sword.png",
+    "power_stone": "https://cdn.discordapp.com/attachments/1374148859034468496/1375837261480067152/Glass_JE4_BE2.webp?ex=683323cc&is=6831d24c&hm=db054d393fff2d050f209af73160adf683d7e6a84ab40ab1c6cc069dc20af3e5&",
+    "hotm": "https://cdn.discordapp.com/attachments/1373747930066063472/1374151457196085329/image.png",
+    "cage_setup": "https://cdn.discordapp.com/attachments/1373747930066063472/1374121091529969834/cageonline-video-cutter.com-ezgif.com-video-to-gif-converter.gif",
+    "odin": "https://cdn.discordapp.com/attachments/1373747930066063472/1373964133426270248/Recording2025-05-19113500online-video-cutter.com1-ezgif.com-video-to-gif-converter.gif"
+}
 
-        await update_party_embed(self.channel_id)
-        await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Left Party",
-                description="You've left the Party.",
-                color=discord.Color.blue()
-            ),
-            ephemeral=True
-        )
-        
-        # Delete channel if empty
-        if not party_data['members']:
-            await channel.delete()
-            del state.active_channels[self.channel_id]
-            if self.channel_id in state.party_views:
-                del state.party_views[self.channel_id]
-        
-        await post_initial_button()
-    
 
-    async def on_transfer_button(self, interaction: discord.Interaction):
-        party_data = state.active_channels.get(self.channel_id)
-        if not party_data:
-            await interaction.response.send_message("Party data not found!", ephemeral=True)
+def attachment_expiry(url: str) -> Optional[float]:
+    # Discord signs attachment links with their expiry as hex unix time in ?ex=
+    try:
+        return float(int(urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)["ex"][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class AssetStore:
+    # Guide images kept by content. GUIDE_ASSET_DIR holds the committed images;
+    # one that is missing there is downloaded once from its original link and
+    # saved there. The bytes live in DATA_DIR/assets/<sha256>,
+    # each distinct image is uploaded once to ASSET_CHANNEL_ID and the link of
+    # that upload is cached in DATA_DIR/assets.json. Lookups never wait on
+    # Discord; a link close to expiry is re-signed in the background by
+    # fetching the storage message again, without uploading
+    def __init__(self, filename: Optional[str] = "assets.json"):
+        self.filename = filename  # None keeps the index in memory only
+        self.names: Optional[Dict[str, str]] = None  # {asset name: sha256}
+        self.uploads: Dict[str, dict] = {}  # {sha256: {"filename", "message_id", "url", "expires"}}
+        self._pending: Dict[str, asyncio.Task] = {}  # {asset name: store/refresh task}
+        self._failed: Dict[str, float] = {}  # {asset name: time of the last failed attempt}
+        self._lock = asyncio.Lock()  # one Discord round trip at a time, so equal images upload once
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, str]:
+        if self.names is None:
+            self.names = {}
+            if self.filename and os.path.exists(data_path(self.filename)):
+                try:
+                    with open(data_path(self.filename), encoding="utf-8") as f:
+                        index = json.load(f)
+                    self.names, self.uploads = index["names"], index["uploads"]
+                except (OSError, ValueError, KeyError) as e:
+                    logging.warning(f"Failed to load the guide asset index: {e}")
+            # An image replaced in GUIDE_ASSET_DIR is stored again
+            for name, digest in list(self.names.items()):
+                local = self._local_file(name)
+                if local is not None and hashlib.sha256(local[0]).hexdigest() != digest:
+                    del self.names[name]
+        return self.names
+
+    def save(self):
+        if not self.filename or self.names is None:
             return
-        
-        if interaction.user.id != party_data['creator_id']:
-            await interaction.response.send_message(
-                "Only the party leader can transfer leadership!",
-                ephemeral=True
-            )
+        path = data_path(self.filename)
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"names": self.names, "uploads": self.uploads}, f, indent=1)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.warning(f"Failed to save the guide asset index: {e}")
+
+    @staticmethod
+    def _blob_path(digest: str) -> str:
+        directory = data_path("assets")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, digest)
+
+    @staticmethod
+    def _fresh(upload: Optional[dict], margin: float) -> bool:
+        if not upload or not upload.get("url"):
+            return False
+        expires = upload.get("expires")
+        return expires is None or expires - time.time() > margin
+
+    def _upload(self, name: str) -> Optional[dict]:
+        digest = self._load().get(name)
+        upload = self.uploads.get(digest)
+        if not self._fresh(upload, CONFIG["ASSET_REFRESH_MARGIN"]):
+            self._schedule(name)
+        return upload
+
+    def url(self, name: str) -> str:
+        # Link to embed for a guide image; the original link until the image is stored
+        upload = self._upload(name)
+        if self._fresh(upload, 0):
+            self.hits += 1
+            return upload["url"]
+        self.misses += 1
+        return GUIDE_IMAGES[name]
+
+    def refresh(self):
+        # Re-sign links nearing expiry even for images nobody opened lately
+        for name in GUIDE_IMAGES:
+            self._upload(name)
+
+    def _schedule(self, name: str):
+        if not CONFIG["ASSET_CHANNEL_ID"] or name in self._pending:
             return
-        
-        # Create a select menu of members to transfer to (excluding current leader)
-        options = []
-        for member_id, mc_name in zip(party_data['members'], party_data['usernames']):
-            if member_id != party_data['creator_id']:  # Don't include current leader
-                member = interaction.guild.get_member(member_id)
-                if member:
-                    options.append(discord.SelectOption(
-                        label=f"{member.display_name} (MC: {mc_name})",
-                        value=str(member_id)
+        if time.time() - self._failed.get(name, 0) < CONFIG["ASSET_RETRY_DELAY"]:
+            return
+        task = asyncio.create_task(self._store(name))
+        self._pending[name] = task
+        task.add_done_callback(functools.partial(self._stored, name))
+
+    def _stored(self, name: str, task: asyncio.Task):
+        self._pending.pop(name, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._failed[name] = time.time()
+            logging.warning(f"Failed to store guide image {name}: {task.exception()!r}")
+        else:
+            self._failed.pop(name, None)
+
+    async def _store(self, name: str):
+        async with self._lock:
+            channel = bot.get_channel(CONFIG["ASSET_CHANNEL_ID"])
+            if channel is None:
+                raise LookupError(f"asset channel {CONFIG['ASSET_CHANNEL_ID']} not found")
+            digest = self._load().get(name)
+            if digest is None or not os.path.exists(self._blob_path(digest)):
+                digest = await self._ingest(name)
+            upload = self.uploads.setdefault(digest, {})
+            # Another name with the same bytes may have stored it already
+            if not self._fresh(upload, CONFIG["ASSET_REFRESH_MARGIN"]):
+                message, attachment = None, None
+                if upload.get("message_id"):
+                    try:
+                        message = await channel.fetch_message(upload["message_id"])
+                        attachment = message.attachments[0] if message.attachments else None
+                    except discord.NotFound:
+                        pass  # storage message deleted, upload again
+                if attachment is None:
+                    message = await channel.send(file=discord.File(
+                        self._blob_path(digest), filename=upload.get("filename") or digest
                     ))
-    
-        if not options:
-            await interaction.response.send_message(
-                "There are no other members to transfer leadership to!",
-                ephemeral=True
-            )
+                    attachment = message.attachments[0]
+                    logging.info(f"Uploaded guide image {name} ({digest[:12]})")
+                upload.update(message_id=message.id, url=attachment.url, expires=attachment_expiry(attachment.url))
+            self.names[name] = digest
+            self.save()
+
+    async def _ingest(self, name: str) -> str:
+        local = self._local_file(name)
+        if local is None:
+            local = await self._download(GUIDE_IMAGES[name])
+            self._save_local_file(name, *local)
+        data, extension = local
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        self.uploads.setdefault(digest, {}).setdefault("filename", f"{name}{extension}")
+        return digest
+
+    @staticmethod
+    def _asset_dir() -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG["GUIDE_ASSET_DIR"])
+
+    @staticmethod
+    def _local_path(name: str) -> Optional[str]:
+        directory = AssetStore._asset_dir()
+        if os.path.isdir(directory):
+            for entry in os.listdir(directory):
+                if os.path.splitext(entry)[0] == name:
+                    return os.path.join(directory, entry)
+        return None
+
+    @staticmethod
+    def _local_file(name: str) -> Optional[Tuple[bytes, str]]:
+        path = AssetStore._local_path(name)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read(), os.path.splitext(path)[1]
+
+    def report_missing(self):
+        # Without its committed file an image depends on the original link, which expires
+        missing = [name for name in GUIDE_IMAGES if self._local_path(name) is None]
+        if not missing:
             return
-        
-        view = View(timeout=30)
-        view.add_item(TransferLeaderSelect(self.channel_id, options))
-    
-        await interaction.response.send_message(
-            "Select the new party leader:",
-            view=view,
+        expired = [name for name in missing if (attachment_expiry(GUIDE_IMAGES[name]) or math.inf) < time.time()]
+        logging.error(
+            f"Guide images missing from {self._asset_dir()}: {', '.join(missing)}. They are served from their "
+            "original links until those expire" + (f"; already expired: {', '.join(expired)}" if expired else "")
         )
 
+    @staticmethod
+    def _save_local_file(name: str, data: bytes, extension: str):
+        # Kept so the image can be committed; its original link expires
+        path = os.path.join(AssetStore._asset_dir(), f"{name}{extension}")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+            logging.warning(f"Guide image {name} was downloaded from its original link, commit {path}")
+        except OSError as e:
+            logging.warning(f"Failed to save guide image {name} to {path}: {e}")
 
+    @staticmethod
+    async def _download(url: str) -> Tuple[bytes, str]:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read(), os.path.splitext(urllib.parse.urlsplit(url).path)[1]
 
-    async def on_cmd_button(self, interaction: discord.Interaction):
-        if interaction.user.id != state.active_channels[self.channel_id]['creator_id']:
-            await interaction.response.send_message(
-                "Only the Party creator can set the join command!",
-                ephemeral=True
-            )
-            return
-        
-        await interaction.response.send_modal(CommandModal(self.channel_id))
 
+asset_store = AssetStore()
 
-    async def on_size_button(self, interaction: discord.Interaction):
-        party_data = state.active_channels[self.channel_id]
-        if interaction.user.id != party_data['creator_id']:
-            await interaction.response.send_message(
-                "Only the party creator can adjust the party size!",
-                ephemeral=True
+
+@tasks.loop(minutes=30)
+@graceful_shutdown.periodic
+async def refresh_guide_assets():
+    asset_store.refresh()
+
+# ====================== Memory Introspection ======================
+
+# Objects owned by discord.py's connection state rather than the structure that
+# points at them; the walk stops there unless they are the entries being measured
+SHARED_OBJECT_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType,
+    asyncio.AbstractEventLoop, discord.Client, discord.state.ConnectionState, discord.http.HTTPClient,
+    discord.Guild, discord.abc.GuildChannel, discord.Role, discord.Member, discord.User, discord.Message
+)
+
+
+class MemoryIntrospector:
+    # Entry counts and approximate deep sizes for the bot's own structures and
+    # discord.py's caches. The object walk runs in short slices between event
+    # loop turns, and large structures are sized from a sample
+    def __init__(self):
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.longest_slice = 0.0
+
+    def structures(self) -> List[Tuple[str, list]]:
+        # (name, containers); discord.py's caches are measured in place, never copied
+        connection = bot._connection
+        return [
+            ("active_channels", [state.active_channels]),
+            ("party_views", [state.party_views]),
+            ("user_participation", [state.user_participation]),
+            ("last_online_time", [state.last_online_time]),
+            ("offline_warning_messages", [state.offline_warning_messages]),
+            ("party_indexes", [state.party_indexes]),
+            ("matchmaking_queues", [state.matchmaking_queues]),
+            ("rate_limit_buckets", [interaction_limiter._buckets]),
+            ("permission_overlay", [permission_batcher._applied]),
+            ("dm_closed", [dm_notifier._closed]),
+            ("ign_cache", [ign_resolver._cache]),
+            ("ign_memory", [ign_memory._igns or {}]),
+            ("idle_deadlines", [idle_parties._deadlines]),
+            ("party_categories", [category_allocator.party_category]),
+            ("recent_members", [member_cache.recent]),
+            ("d.py members", [guild._members for guild in bot.guilds]),
+            ("d.py users", [connection._users]),
+            ("d.py messages", [connection._messages or ()]),
+            ("d.py views", [connection._view_store._views])
+        ]
+
+    async def _walk(self, roots: list) -> int:
+        seen = set()
+        stack = []
+        size = 0
+        for root in roots:
+            if id(root) not in seen:
+                seen.add(id(root))
+                size += sys.getsizeof(root)
+                stack.extend(gc.get_referents(root))
+        started = time.perf_counter()
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen or isinstance(obj, SHARED_OBJECT_TYPES):
+                continue
+            seen.add(id(obj))
+            size += sys.getsizeof(obj)
+            stack.extend(gc.get_referents(obj))
+            elapsed = time.perf_counter() - started
+            if elapsed > CONFIG["MEMORY_REPORT_SLICE"]:
+                self.longest_slice = max(self.longest_slice, elapsed)
+                await asyncio.sleep(0)
+                started = time.perf_counter()
+        self.longest_slice = max(self.longest_slice, time.perf_counter() - started)
+        return size
+
+    async def measure(self, containers: list) -> Tuple[int, int, bool]:
+        # Returns (entries, approximate bytes, sampled). Only the sampled
+        # entries are touched, so a cache of any size costs the same to measure
+        count = sum(len(container) for container in containers)
+        sample_size = CONFIG["MEMORY_REPORT_SAMPLE"]
+        sampled = 0
+        roots = []
+        for container in containers:
+            if sampled >= sample_size:
+                break
+            if hasattr(container, "items"):
+                entries = list(islice(container.items(), sample_size - sampled))
+                roots.extend(part for entry in entries for part in entry)
+            else:
+                entries = list(islice(container, sample_size - sampled))
+                roots.extend(entries)
+            sampled += len(entries)
+        size = await self._walk(roots)
+        if 0 < sampled < count:
+            size = size * count // sampled
+        return count, sum(sys.getsizeof(container) for container in containers) + size, sampled < count
+
+    async def report(self) -> str:
+        self.longest_slice = 0.0
+        started = time.perf_counter()
+        lines = [f"{'structure':<26}{'entries':>9}{'size':>12}"]
+        total = 0
+        for name, containers in self.structures():
+            count, size, sampled = await self.measure(containers)
+            await asyncio.sleep(0)
+            total += size
+            lines.append(f"{name:<26}{count:>9}{('~' if sampled else '') + format_bytes(size):>12}")
+        lines.append(f"{'total':<26}{'':>9}{format_bytes(total):>12}")
+        lines.append(
+            f"\nRSS {resident_memory_mb():.1f} MB, walked in {time.perf_counter() - started:.2f}s, "
+            f"longest slice {self.longest_slice * 1000:.1f} ms"
+        )
+        return "\n".join(lines)
+
+    async def trace_diff(self, limit: int = 10) -> str:
+        # The first call starts tracemalloc; later calls diff against the previous snapshot.
+        # take_snapshot() copies every trace in C while holding the GIL, so it
+        # stalls the event loop for as long as the copy takes (grows with the
+        # number of live allocations, easily 100+ ms on a big bot) whichever
+        # thread runs it; hence MEMORY_TRACE. Filtering and diffing are Python
+        # and run in a thread, which the loop interleaves with
+        if not CONFIG["MEMORY_TRACE"]:
+            return (
+                "Allocation tracing is off: each snapshot blocks the bot while tracemalloc copies its traces. "
+                'Set "MEMORY_TRACE": True to allow `!memory trace`.'
             )
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.snapshot = None
+        started = time.perf_counter()
+        raw = tracemalloc.take_snapshot()
+        stall = time.perf_counter() - started
+        snapshot = await asyncio.to_thread(filter_snapshot, raw)
+        previous, self.snapshot = self.snapshot, snapshot
+        if previous is None:
+            return f"Allocation tracing started, run `!memory trace` again to see what grew. (snapshot stalled the loop {stall * 1000:.0f} ms)"
+        stats = await asyncio.to_thread(snapshot.compare_to, previous, "lineno")
+        lines = [
+            f"{format_bytes(stat.size_diff):>10} {stat.count_diff:>+8}  "
+            f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}"
+            for stat in stats[:limit]
+        ] or ["No allocations changed."]
+        lines.append(f"\nSnapshot stalled the loop {stall * 1000:.0f} ms")
+        return "\n".join(lines)
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self.snapshot = None
+
+
+def filter_snapshot(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ])
+
+
+def format_bytes(size: float) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.1f} GB"
+
+
+memory_introspector = MemoryIntrospector()
+
+# ====================== Loop Lag Monitor ======================
+
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, math.inf)
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)  # Loop internals are left out of captured stacks
+
+
+class LoopLagMonitor:
+    # Samples how late the event loop wakes a sleeping task and keeps a rolling
+    # per-minute histogram. A watchdog thread notices when the samples stop and
+    # captures the loop thread's stack, which shows the code blocking the loop
+    def __init__(self):
+        self._minutes: deque = deque(maxlen=CONFIG["LOOP_LAG_WINDOW"])  # of (minute, Counter of bucket index)
+        self.stalls: deque = deque(maxlen=10)
+        self.stall_sources: Counter = Counter()  # {coroutine: stalls}
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._stall: Optional[dict] = None  # captured by the watchdog, finished by the next sample
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None:
             return
+        loop = asyncio.get_running_loop()
+        self._heartbeat = time.monotonic()
+        self._task = loop.create_task(self._sample(), name="loop-lag-monitor")
+        threading.Thread(
+            target=self._watch, args=(loop, threading.get_ident()), name="loop-stall-watchdog", daemon=True
+        ).start()
 
-        current_size = party_data['max_size']
-        current_members = len(party_data['members'])
+    async def _sample(self):
+        interval = CONFIG["LOOP_LAG_INTERVAL"]
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record(now - expected)
 
-        if current_members > current_size:
-            await interaction.response.send_message(
-                f"You currently have {current_members} members which is more than your set maximum ({current_size}). "
-                "You can't reduce the size below your current member count.",
-                ephemeral=True
+    def record(self, lag: float):
+        lag = max(lag, 0.0)
+        minute = int(time.monotonic() // 60)
+        if not self._minutes or self._minutes[-1][0] != minute:
+            self._minutes.append((minute, Counter()))
+        lag_ms = lag * 1000
+        self._minutes[-1][1][next(i for i, bound in enumerate(LAG_BUCKETS_MS) if lag_ms <= bound)] += 1
+        self.max_lag = max(self.max_lag, lag)
+        stall, self._stall = self._stall, None
+        if stall is not None:
+            stall["seconds"] = lag
+            logging.warning(
+                f"Event loop blocked for {lag:.2f}s in {stall['coroutine']}:\n" + "".join(stall["stack"])
             )
-            return
 
-        # Defer before sending the view
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+        threshold = CONFIG["LOOP_STALL_THRESHOLD"]
+        while not loop.is_closed():
+            time.sleep(threshold / 2)
+            blocked = time.monotonic() - self._heartbeat - CONFIG["LOOP_LAG_INTERVAL"]
+            if blocked < threshold or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+            # Between task steps the loop runs plain callbacks (e.g. socket reads), there is no task then
+            task = asyncio.current_task(loop)
+            coroutine = task.get_coro().__qualname__ if task is not None else "loop callback"
+            frames = [entry for entry in traceback.extract_stack(frame) if not entry.filename.startswith(ASYNCIO_DIR)]
+            stack = traceback.format_list(frames[-CONFIG["LOOP_STALL_FRAMES"]:])
+            self.stall_sources[coroutine] += 1
+            self._stall = {"at": datetime.now(), "coroutine": coroutine, "seconds": blocked, "stack": stack}
+            self.stalls.append(self._stall)
 
-        await interaction.response.defer(ephemeral=False)
-        view = SizeSelectView(self.channel_id, current_size, party_data['creator_id'])
-        await interaction.followup.send(
-            "Select the new maximum party size:",
-            view=view
-        )
+    def histogram(self) -> Counter:
+        counts = Counter()
+        for _, minute in self._minutes:
+            counts.update(minute)
+        return counts
 
+    def percentile(self, counts: Counter, fraction: float) -> float:
+        target = sum(counts.values()) * fraction
+        seen = 0
+        for index, bound in enumerate(LAG_BUCKETS_MS):
+            seen += counts[index]
+            if seen >= target:
+                return bound
+        return math.inf
 
-    async def on_kick_button(self, interaction: discord.Interaction):
-        party_data = state.active_channels[self.channel_id]
-        if interaction.user.id != party_data['creator_id']:
-            await interaction.response.send_message(
-                "Only the party creator can kick members!",
-                ephemeral=True
+    def report(self) -> str:
+        counts = self.histogram()
+        samples = sum(counts.values())
+        if not samples:
+            return "No lag samples yet."
+        lines = [
+            f"{samples} samples over {len(self._minutes)} min: p50 <= {self.percentile(counts, 0.5)} ms, "
+            f"p99 <= {self.percentile(counts, 0.99)} ms, max {self.max_lag * 1000:.0f} ms since start",
+            ""
+        ]
+        lower = 0
+        for index, bound in enumerate(LAG_BUCKETS_MS):
+            if counts[index]:
+                lines.append(f"{lower:>5}-{bound:<5} ms {counts[index]:>7}")
+            lower = bound
+        if self.stall_sources:
+            lines.append(f"\nStalls over {CONFIG['LOOP_STALL_THRESHOLD']}s by coroutine:")
+            lines.extend(f"{count:>5}  {coroutine}" for coroutine, count in self.stall_sources.most_common(5))
+        if self.stalls:
+            stall = self.stalls[-1]
+            lines.append(
+                f"\nLast stall {stall['at']:%H:%M:%S}, {stall['seconds']:.2f}s in {stall['coroutine']}:"
             )
+            lines.append("".join(stall["stack"]).rstrip())
+        return "\n".join(lines)
+
+
+loop_monitor = LoopLagMonitor()
+
+# ====================== Party API ======================
+
+class PartyApi:
+    # Read-only HTTP view of the open parties for the community website.
+    # GET /parties is versioned by party_log.sequence, so polls with a current
+    # ETag get a 304 without touching the party state. GET /parties/stream
+    # sends a snapshot and then every party change as a server-sent event
+    def __init__(self):
+        self.instance = uuid.uuid4().hex[:8]  # sequences restart with the process, ETags must not repeat
+        self._body: Optional[bytes] = None
+        self._body_sequence = -1
+        self._streams: set = set()  # of asyncio.Queue, one per connected stream
+        self._runner: Optional[web.AppRunner] = None
+        self.served = 0
+        self.not_modified = 0
+        self.streams_dropped = 0
+
+    async def start(self):
+        if self._runner is not None:
             return
+        app = web.Application()
+        app.router.add_get("/parties", self.get_parties)
+        app.router.add_get("/parties/stream", self.stream_parties)
+        runner = web.AppRunner(app, access_log=None)  # polls would drown the log
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, CONFIG["PARTY_API_HOST"], CONFIG["PARTY_API_PORT"]).start()
+        except OSError as e:
+            await runner.cleanup()
+            logging.error(f"Party API could not listen on port {CONFIG['PARTY_API_PORT']}: {e}")
+            return
+        self._runner = runner
+        party_log.listeners.append(self.publish)
+        logging.info(f"Party API listening on http://{CONFIG['PARTY_API_HOST']}:{CONFIG['PARTY_API_PORT']}/parties")
 
-        # Don't allow kicking if there's only 1 member
-        if len(party_data['members']) <= 1:
-            await interaction.response.send_message(
-                "You can't kick yourself! Use the leave button instead.",
-                ephemeral=True
-            )
+    async def stop(self):
+        if self._runner is None:
             return
+        if self.publish in party_log.listeners:
+            party_log.listeners.remove(self.publish)
+        for stream in list(self._streams):
+            self._close_stream(stream)
+        runner, self._runner = self._runner, None
+        await runner.cleanup()
 
-        # Create a view with select menu of members to kick
-        view = View(timeout=30)
-        view.add_item(KickSelect(
-            self.channel_id,
-            party_data['members'],
-            party_data['usernames']
-        ))
+    def etag(self) -> str:
+        return f'"{self.instance}-{party_log.sequence}"'
 
-        # Send the response with the view
-        await interaction.response.send_message(
-            "Select a member to kick:",
-            view=view,
-            ephemeral=False
+    @staticmethod
+    def party_json(channel_id: int) -> Optional[dict]:
+        data = state.active_channels.get(channel_id)
+        if data is None:
+            return None
+        channel = bot.get_channel(channel_id)
+        leader = data['members'].index(data['creator_id']) if data['creator_id'] in data['members'] else None
+        return {
+            "id": str(channel_id),  # snowflakes don't fit in a JavaScript number
+            "name": channel.name if channel else None,
+            "leader": data['usernames'][leader] if leader is not None else None,
+            "players": list(data['usernames']),
+            "size": len(data['members']),
+            "max_size": data['max_size'],
+            "locked": data.get('locked', False),
+            "open": len(data['members']) < data['max_size'] and not data.get('locked', False)
+        }
+
+    def body(self) -> bytes:
+        # Built at most once per party change, however many clients poll
+        if self._body_sequence != party_log.sequence:
+            parties = [self.party_json(channel_id) for channel_id in state.active_channels]
+            self._body = json.dumps(
+                {"version": party_log.sequence, "parties": parties}, separators=(",", ":")
+            ).encode()
+            self._body_sequence = party_log.sequence
+        return self._body
+
+    async def get_parties(self, request: web.Request) -> web.Response:
+        etag = self.etag()
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        self.served += 1
+        return web.Response(
+            body=self.body(), content_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"}
         )
-    
 
-    
-    async def on_lock_button(self, interaction: discord.Interaction):
-        if interaction.user.id != state.active_channels[self.channel_id]['creator_id']:
-            await interaction.response.send_message(
-                "Only the Party creator can lock the party!",
-                ephemeral=True
-            )
+    def publish(self, record: dict):
+        # party_log listener; the event is encoded once and queued for every stream
+        if not self._streams:
             return
-            
-        await interaction.response.send_modal(LockConfirmModal(self.channel_id))
+        party = None if record["e"] == "close" else self.party_json(record["party"])
+        data = json.dumps({"event": record["e"], "id": str(record["party"]), "party": party}, separators=(",", ":"))
+        message = f"id: {party_log.sequence}\nevent: party\ndata: {data}\n\n".encode()
+        for stream in list(self._streams):
+            try:
+                stream.put_nowait(message)
+            except asyncio.QueueFull:
+                # A client this far behind reconnects and starts over from a snapshot
+                self.streams_dropped += 1
+                self._close_stream(stream)
 
-async def update_party_embed(channel_id: int):
-    channel = bot.get_channel(channel_id)
-    if not channel or channel_id not in state.active_channels:
-        return
-    
-    data = state.active_channels[channel_id]
+    def _close_stream(self, stream: asyncio.Queue):
+        self._streams.discard(stream)
+        while not stream.empty():
+            stream.get_nowait()
+        stream.put_nowait(None)
+
+    async def stream_parties(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # keep reverse proxies from buffering events
+        })
+        await response.prepare(request)
+        stream = asyncio.Queue(maxsize=CONFIG["PARTY_API_STREAM_BUFFER"])
+        self._streams.add(stream)
+        try:
+            await response.write(f"id: {party_log.sequence}\nevent: snapshot\ndata: ".encode() + self.body() + b"\n\n")
+            while True:
+                try:
+                    message = await asyncio.wait_for(stream.get(), CONFIG["PARTY_API_HEARTBEAT"])
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break
+                await response.write(message)
+        except ConnectionResetError:
+            pass
+        finally:
+            self._streams.discard(stream)
+        return response
+
+
+party_api = PartyApi()
+
+# ====================== Macro Check Import ======================
+
+MACRO_CHECK_FIELDS = ("video_url", "account_name", "custom_name", "check_type", "ban_status", "macro_duration")
+
+
+async def macro_check_display_name(custom_name: str) -> str:
+    # A mention or user id is shown as a mention, anything else as typed
+    if custom_name.startswith('<@') and custom_name.endswith('>'):
+        return custom_name
     try:
-        message = await channel.fetch_message(data['message_id'])
-        
-        embed = discord.Embed(
-            title=f"⚔️ Worm Party #{list(state.active_channels.keys()).index(channel_id)+1}",
-            color=discord.Color.green()
-        )
-        
-        # Add locked status to title if party is locked
-        if data.get('locked', False):
-            embed.title += " (LOCKED 🔒)"
-        
-        # Players list
-        player_list = []
-        for i, (member_id, mc_name) in enumerate(zip(data['members'], data['usernames']), 1):
-            member = channel.guild.get_member(member_id)
-            player_list.append(f"{i}. {member.mention} (MC: {mc_name})")
-        
-        embed.add_field(
-            name="Players",
-            value="\n".join(player_list) or "No players in Party",
-            inline=False
-        )
-        
-        # Join command (if set)
-        if data.get('join_cmd'):
-            embed.add_field(
-                name="Join Command",
-                value=f"```{data['join_cmd']}```",
-                inline=False
-            )
-        
-        player_count = len(data['members'])
-        max_size = data['max_size']
-        status = "Party complete! 🎉" if player_count == max_size else f"{player_count}/{max_size} players joined"
-        
-        # Add locked status to footer if party is locked
-        if data.get('locked', False):
-            status += " | PARTY LOCKED 🔒"
-        
-        embed.set_footer(text=status)
-        
-        view = PartyView(channel_id, data['creator_id'])
-        await message.edit(embed=embed, view=view)
-        
-        # Pin the message if it's not already pinned
-        if not message.pinned:
-            try:
-                await message.pin()
-            except (discord.Forbidden, discord.HTTPException) as e:
-                logging.warning(f"Failed to pin message: {e}")
-        
-    except discord.NotFound:
-        logging.warning(f"Message not found for channel {channel_id}")
+        user_id = int(custom_name)
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        return user.mention
+    except (ValueError, discord.NotFound):
+        return custom_name
 
-async def handle_party_join(interaction: discord.Interaction, mc_username: str):
-    # First check if user is trying to join a locked party
-    for ch_id, data in state.active_channels.items():
-        if interaction.user.id in data['members'] and data.get('locked', False):
-            channel = bot.get_channel(ch_id)
-            await interaction.response.send_message(
-                embed=discord.Embed(
-                    title="Party Locked",
-                    description=f"The party in {channel.mention} is locked and not accepting new members.",
-                    color=discord.Color.red()
-                ),
-                ephemeral=True
-            )
-            return
+
+def macro_check_embed(display_name: str, check_type: str, macro_duration: str, ban_status: str,
+                      video_url: str, head: str) -> discord.Embed:
+    # head: account uuid when known, since names can change, else the account name
+    embed = discord.Embed(
+        title=f"Macro Check - {display_name}",
+        color=discord.Color.red(),
+        description=f"** **"
+    )
     
-    category = interaction.guild.get_channel(CONFIG["TARGET_CATEGORY_ID"])
-    if not category:
-        await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Error",
-                description="Couldn't find the Wormparty category!",
-                color=discord.Color.red()
-            ),
-            ephemeral=True
-        )
-        return
+    embed.add_field(name=f" ", value=f" ", inline=False)
+    embed.add_field(
+        name=f" ", 
+        value=f"**Type of Check:** {check_type}\n**Macro Duration:** {macro_duration}\n**Ban:** {ban_status}", 
+        inline=False
+    )
+    embed.set_thumbnail(url=f"https://mc-heads.net/avatar/{head}/128")
+    embed.add_field(name=" ", value=f"[**Video**]({video_url})", inline=False)
+    return embed
 
-    channel = None
-    for ch_id, data in state.active_channels.items():
-        if len(data['members']) < data['max_size'] and not data.get('locked', False):
-            channel = interaction.guild.get_channel(ch_id)
-            break
 
-    if channel is None:
-        # Create new party channel
-        overwrites = {
-            interaction.guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            interaction.user: discord.PermissionOverwrite(read_messages=True)
-        }
-        channel = await category.create_text_channel(
-            f'Worm-Party-{len(state.active_channels)+1}',
-            overwrites=overwrites
-        )
-        
-        state.active_channels[channel.id] = {
-            'members': [interaction.user.id],
-            'usernames': [mc_username],
-            'message_id': None,
-            'creator_id': interaction.user.id,
-            'join_cmd': None,
-            'max_size': CONFIG["MAX_PLAYERS_PER_PARTY"],
-            'locked': False
-        }
+class MacroImportJob:
+    # Posts a validated file of macro checks to the macro checks channel at a
+    # paced rate. The checks are written to DATA_DIR once and every finished
+    # row is appended to a progress log, so after a restart the job resumes
+    # where it stopped instead of posting everything again
+    def __init__(self, filename: Optional[str] = "macro_import.json"):
+        self.filename = filename  # None keeps the job in memory only
+        self.checks: List[dict] = []
+        self.results: Dict[int, Optional[str]] = {}  # {row: None if posted, else the error}
+        self.report_channel_id: Optional[int] = None
+        self.validating = False  # set while a file is validated, which can take minutes of IGN lookups
+        self._task: Optional[asyncio.Task] = None
 
-        # Track user participation
-        state.user_participation[interaction.user.id] = channel.id
-        await post_initial_button()
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def busy(self) -> bool:
+        return self.validating or self.running
+
+    @staticmethod
+    def parse(filename: str, data: bytes) -> List[dict]:
+        text = data.decode("utf-8-sig")
+        if filename.lower().endswith(".json"):
+            rows = json.loads(text)
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError("a JSON file must hold a list of objects")
+            return rows
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [field for field in MACRO_CHECK_FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"the CSV header is missing {', '.join(missing)}")
+        return list(reader)
+
+    @staticmethod
+    async def validate(rows: List[dict], posted: set) -> Tuple[List[dict], List[str]]:
+        # Every row is checked, and its IGN and display name resolved, before
+        # anything is posted. posted: video URLs already in the macro checks channel
+        checks = []
+        errors = []
+        videos: Dict[str, int] = {}
+        for number, row in enumerate(rows, 1):
+            values = {field: str(row.get(field) or "").strip() for field in MACRO_CHECK_FIELDS}
+            missing = [field for field, value in values.items() if not value]
+            if missing:
+                errors.append(f"row {number}: missing {', '.join(missing)}")
+                continue
+            url = urllib.parse.urlparse(values["video_url"])
+            if url.scheme not in ("http", "https") or not url.netloc:
+                errors.append(f"row {number}: video_url isn't a link")
+                continue
+            if values["video_url"] in videos:
+                errors.append(f"row {number}: same video as row {videos[values['video_url']]}")
+                continue
+            if values["video_url"] in posted:
+                errors.append(f"row {number}: video is already in the macro checks channel")
+                continue
+            videos[values["video_url"]] = number
+            ban_status = values["ban_status"].capitalize()
+            if ban_status not in ("Yes", "No"):
+                errors.append(f"row {number}: ban_status must be Yes or No")
+                continue
+            profile = await canonical_ign(values["account_name"])
+            if profile is None:
+                errors.append(f"row {number}: {values['account_name']} isn't a Minecraft account")
+                continue
+            check = dict(
+                values,
+                account_name=profile[0],
+                head=profile[1] or profile[0],
+                display_name=await macro_check_display_name(values["custom_name"]),
+                ban_status=ban_status
+            )
+            embed = macro_check_embed(check["display_name"], check["check_type"], check["macro_duration"],
+                                      check["ban_status"], check["video_url"], check["head"])
+            if len(embed.title) > 256 or any(len(field.value) > 1024 for field in embed.fields):
+                errors.append(f"row {number}: too long for an embed")
+                continue
+            checks.append(check)
+        return checks, errors
+
+    def _progress_path(self) -> str:
+        return data_path(f"{self.filename}.progress")
+
+    def start(self, checks: List[dict], report_channel_id: int) -> bool:
+        if self.running:
+            return False
+        self.checks = checks
+        self.results = {}
+        self.report_channel_id = report_channel_id
+        if self.filename:
+            path = data_path(self.filename)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"report_channel_id": report_channel_id, "checks": checks}, f, separators=(",", ":"))
+            os.replace(f"{path}.tmp", path)
+            open(self._progress_path(), "w").close()
+        self._task = asyncio.create_task(self._run())
+        return True
+
+    def resume(self) -> bool:
+        if self.running or not self.filename or not os.path.exists(data_path(self.filename)):
+            return False
+        try:
+            with open(data_path(self.filename), encoding="utf-8") as f:
+                job = json.load(f)
+            self.checks = job["checks"]
+            self.report_channel_id = job["report_channel_id"]
+            self.results = {}
+            if os.path.exists(self._progress_path()):
+                with open(self._progress_path(), encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            result = json.loads(line)
+                            self.results[result["row"]] = result["error"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Failed to resume the macro check import: {e}")
+            return False
+        logging.info(f"Resuming macro check import at {len(self.results)}/{len(self.checks)}")
+        self._task = asyncio.create_task(self._run())
+        return True
+
+    def cancel(self) -> bool:
+        if not self.running:
+            return False
+        self._task.cancel()
+        self._finish()
+        return True
+
+    def _record(self, row: int, error: Optional[str]):
+        self.results[row] = error
+        if self.filename:
+            try:
+                with open(self._progress_path(), "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"row": row, "error": error}) + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to record macro import progress: {e}")
+
+    def _finish(self):
+        if self.filename:
+            for path in (data_path(self.filename), self._progress_path()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
 
-        view = PartyView(channel.id, interaction.user.id)
-        state.party_views[channel.id] = view
+    async def _post(self, channel: discord.TextChannel, check: dict) -> Optional[str]:
+        # Returns None once posted, else the error. After a timeout or server
+        # error the message may have gone out anyway, so the channel is searched
+        # for it after the circuit cooldown and it is only sent again if it isn't
+        # there. A row whose outcome can't be checked is failed, not sent twice
+        since = discord.utils.utcnow() - timedelta(seconds=5)  # allow for clock skew
+        for attempt in range(CONFIG["SIDE_EFFECT_RETRIES"] + 1):
+            if attempt:
+                await asyncio.sleep(CONFIG["CIRCUIT_COOLDOWN"])
+                try:
+                    posted = await self._find_posted(channel, check["video_url"], since)
+                except Exception as e:
+                    return f"may have been posted, couldn't check the channel: {e!r}"
+                if posted:
+                    break
+            try:
+                await channel.send(embed=macro_check_embed(
+                    check["display_name"], check["check_type"], check["macro_duration"],
+                    check["ban_status"], check["video_url"], check["head"]
+                ))
+                break
+            except Exception as e:
+                if not is_transient(e):
+                    return str(e)
+                if attempt == CONFIG["SIDE_EFFECT_RETRIES"]:
+                    return f"may have been posted, gave up after {attempt + 1} attempts: {e!r}"
+                logging.warning(
+                    f"Macro import: posting failed ({e!r}), checking the channel in {CONFIG['CIRCUIT_COOLDOWN']}s"
+                )
+        macro_check_log.record(check["check_type"], check["ban_status"], check["video_url"])
+        return None
 
-        embed = discord.Embed(
-            title=f"⚔️ Wormparty #{len(state.active_channels)}",
-            color=discord.Color.green()
-        )
-        embed.add_field(
-            name="Players",
-            value=f"1. {interaction.user.mention} (MC: {mc_username})",
-            inline=False
-        )
-        embed.set_footer(text=f"1/{CONFIG['MAX_PLAYERS_PER_PARTY']} players joined")
-        
-        message = await channel.send(embed=embed, view=view)
-        state.active_channels[channel.id]['message_id'] = message.id
+    @staticmethod
+    async def _find_posted(channel: discord.TextChannel, video_url: str, since: datetime) -> bool:
+        async for message in channel.history(limit=50, after=since):
+            if message.author == bot.user and message.embeds and MacroCheckLog.video_of(message.embeds[0]) == video_url:
+                return True
+        return False
 
-        try:
-            await message.pin()
-        except (discord.Forbidden, discord.HTTPException) as e:
-            logging.warning(f"Failed to pin message: {e}")
+    async def _run(self):
+        channel = bot.get_channel(CONFIG["MACRO_CHECKS_CHANNEL_ID"])
+        if channel is None:
+            logging.error("Macro import: couldn't find the macro checks channel")
+            return
+        for row, check in enumerate(self.checks, 1):
+            if row in self.results:
+                continue
+            if graceful_shutdown.closing:
+                return  # the progress log lets the next start pick up from here
+            # discord.py waits out 429s by itself; the pacing keeps the import
+            # from using up the channel's bucket in the first place
+            self._record(row, await self._post(channel, check))
+            await asyncio.sleep(CONFIG["MACRO_IMPORT_INTERVAL"])
+        self._finish()
+        await self._report()
 
-        await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Party Created!",
-                description=f"You've started a new Party in {channel.mention}",
-                color=discord.Color.green()
-            ),
-            ephemeral=True
+    def progress(self) -> str:
+        if self.validating and not self.running:
+            return "A macro check import file is being validated."
+        if not self.running:
+            return "No macro check import is running."
+        left = len(self.checks) - len(self.results)
+        failed = sum(error is not None for error in self.results.values())
+        return (
+            f"Macro check import: {len(self.results)}/{len(self.checks)} done, {failed} failed, "
+            f"about {format_duration(left * CONFIG['MACRO_IMPORT_INTERVAL'])} left."
         )
-    else:
-        # Join existing party
-        state.active_channels[channel.id]['members'].append(interaction.user.id)
-        state.active_channels[channel.id]['usernames'].append(mc_username)
-        state.user_participation[interaction.user.id] = channel.id
-        
-        await channel.set_permissions(
-            interaction.user,
-            read_messages=True,
-            send_messages=True
+
+    async def _report(self):
+        failures = [(row, error) for row, error in sorted(self.results.items()) if error is not None]
+        embed = discord.Embed(
+            title="Macro Check Import Finished",
+            description=f"Posted {len(self.results) - len(failures)} of {len(self.checks)} checks.",
+            color=discord.Color.green() if not failures else discord.Color.orange()
         )
+        if failures:
+            lines = [f"row {row}: {error}"[:200] for row, error in failures[:10]]
+            if len(failures) > 10:
+                lines.append(f"... and {len(failures) - 10} more, see the log")
+            embed.add_field(name="Failed", value="\n".join(lines)[:1024], inline=False)
+            for row, error in failures:
+                logging.warning(f"Macro import: row {row} failed: {error}")
+        channel = bot.get_channel(self.report_channel_id) if self.report_channel_id else None
+        try:
+            if channel is not None:
+                await channel.send(embed=embed)
+            else:
+                dm_notifier.notify([CONFIG["AUTHORIZED_USER_ID"]], embed)
+        except discord.HTTPException as e:
+            logging.error(f"Failed to report the macro check import: {e}")
 
-        # Get the current member count
-        member_count = len(state.active_channels[channel.id]['members'])
-        
-        # Create the appropriate trigger message based on member count
-        trigger_messages = {
-            1: "1 Member = 15-20",
-            2: "2 Member = 25-30",
-            3: "3 Member = 35-40",
-            4: "4 Member = 45-50",
-            5: "5 Member = 50-55",
-            6: "6 Member = 55-60"
-        }
-        
-        if member_count in trigger_messages:
-            join_embed = discord.Embed(
-                title=f"New Player Joined!",
-                description=f"{interaction.user.mention} has joined the party!",
-                color=discord.Color.green()
-            )
-            join_embed.add_field(
-                name="Worm Trigger Count",
-                value=trigger_messages[member_count],
-                inline=False
-            )
-            await channel.send(embed=join_embed)
 
-        await update_party_embed(channel.id)
-        await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Joined Party!",
-                description=f"You've joined {channel.mention}",
-                color=discord.Color.green()
-            ),
-            ephemeral=True
-        )
-        
-        if len(state.active_channels[channel.id]['members']) == CONFIG["MAX_PLAYERS_PER_PARTY"]:
-            await channel.send("Your Party is full!")
+macro_import = MacroImportJob()
 
-async def on_join_button(interaction: discord.Interaction):
 
-    # Rate limiting - 5 seconds between interactions per user
-    cooldown = timedelta(seconds=5)
-    last_interaction = state.last_interaction_time.get(interaction.user.id)
-    
-    if last_interaction and (datetime.now() - last_interaction) < cooldown:
-        remaining = (cooldown - (datetime.now() - last_interaction)).seconds
-        await interaction.response.send_message(
-            f"Please wait {remaining} seconds before using this again.",
-            ephemeral=True
-        )
+async def submit_macro_import(message: discord.Message):
+    if macro_import.busy:
+        await message.channel.send(macro_import.progress() + " Use `!macroimport cancel` to stop it first.")
         return
-    
-    state.last_interaction_time[interaction.user.id] = datetime.now()
+    # Held until the job starts, so a second file sent during validation is refused
+    macro_import.validating = True
+    try:
+        await validate_macro_import(message)
+    finally:
+        macro_import.validating = False
 
 
-    if interaction.user.id in state.user_participation:
-        channel_id = state.user_participation[interaction.user.id]
-        channel = bot.get_channel(channel_id)
-        await interaction.response.send_message(
-            embed=discord.Embed(
-                title="Already in a Party",
-                description=f"You're already in a party! Please leave {channel.mention} before joining another.",
-                color=discord.Color.red()
-            ),
-            ephemeral=True
-        )
+async def validate_macro_import(message: discord.Message):
+    attachment = message.attachments[0]
+    if attachment.size > CONFIG["MACRO_IMPORT_MAX_BYTES"]:
+        await message.channel.send(f"The file is too large, the limit is {format_bytes(CONFIG['MACRO_IMPORT_MAX_BYTES'])}.")
+        return
+    try:
+        rows = MacroImportJob.parse(attachment.filename, await attachment.read())
+    except (ValueError, csv.Error) as e:
+        await message.channel.send(f"Couldn't read {attachment.filename}: {e}")
+        return
+    if not rows:
+        await message.channel.send(f"{attachment.filename} has no checks.")
         return
-    
-    await interaction.response.send_modal(UsernameModal())
 
-async def post_initial_button():
-    channel = bot.get_channel(CONFIG["YOUR_CHANNEL_ID"])
-    if not channel:
+    channel = bot.get_channel(CONFIG["MACRO_CHECKS_CHANNEL_ID"])
+    if channel is None:
+        await message.channel.send("Couldn't find the macro checks channel.")
         return
 
+    await message.channel.send(f"Validating {len(rows)} checks...")
     try:
-        if state.initial_button_message_id:
-            message = await channel.fetch_message(state.initial_button_message_id)
-        else:
-            # Search for the last message sent by the bot in this channel
-            found_message = None
-            async for msg in channel.history(limit=10):
-                if msg.author == bot.user and msg.embeds and "Worm Party Finder" in msg.embeds[0].title:
-                    found_message = msg
-                    break
-            
-            if found_message:
-                message = found_message
-                state.initial_button_message_id = found_message.id
-            else:
-                message = None
-        
-        if message:
-            # Update existing message
-            embed = discord.Embed(
-                title="Worm Party Finder",
-                description=f"Click the button to create a Worm party.\n\n**Current active parties:** {len(state.active_channels)}",
-                color=discord.Color.blue()
-            )
-            view = View(timeout=None)
-            join_button = Button(
-                label="Join / Create a Worm Party", 
-                style=discord.ButtonStyle.green,
-                emoji="⛏️",
-                custom_id="initial_join_button"
+        await macro_check_log.load(channel)  # the posted videos, for the duplicate check
+    except discord.HTTPException as e:
+        await message.channel.send(f"Couldn't read the macro checks channel: {e}")
+        return
+    checks, errors = await MacroImportJob.validate(rows, macro_check_log.videos)
+    if errors:
+        lines = errors[:20] + ([f"... and {len(errors) - 20} more"] if len(errors) > 20 else [])
+        await message.channel.send(
+            embed=discord.Embed(
+                title="Macro Check Import Rejected",
+                description=f"{len(errors)} of {len(rows)} rows are invalid, nothing was posted. "
+                            "Fix them and send the file again.\n```\n" + "\n".join(lines)[:3800] + "\n```",
+                color=discord.Color.red()
             )
-            join_button.callback = on_join_button
-            view.add_item(join_button)
-            await message.edit(embed=embed, view=view)
-            return
-        
-    except discord.NotFound:
-        pass  # Message doesn't exist, will create new one
-    except Exception as e:
-        logging.error(f"Error while trying to find/edit message: {e}")
-    
-    # Create new message if we couldn't find an existing one
-    embed = discord.Embed(
-        title="Worm Party Finder",
-        description=f"Click the button to create a Worm party.\n\n**Current active parties:** {len(state.active_channels)}",
-        color=discord.Color.blue()
-    )
-    view = View(timeout=None)
-    join_button = Button(
-        label="Join / Create a Worm Party", 
-        style=discord.ButtonStyle.green,
-        emoji="⛏️",
-        custom_id="initial_join_button"
+        )
+        return
+    if not macro_import.start(checks, message.channel.id):
+        await message.channel.send(macro_import.progress() + " Send the file again once it has finished.")
+        return
+    await message.channel.send(
+        f"All {len(checks)} checks are valid. Posting them over about "
+        f"{format_duration(len(checks) * CONFIG['MACRO_IMPORT_INTERVAL'])}, "
+        "`!macroimport` shows the progress."
     )
-    join_button.callback = on_join_button
-    view.add_item(join_button)
-    message = await channel.send(embed=embed, view=view)
-    state.initial_button_message_id = message.id
 
-# ====================== Wormfishing Guide Components ======================
+# ====================== Macro Check Charts ======================
 
-class MenuView(View):
-    def __init__(self):
-        super().__init__(timeout=None)
-        self.add_item(Button(style=discord.ButtonStyle.primary, label="Taunahi Settings", custom_id="taunahi_settings"))
-        self.add_item(Button(style=discord.ButtonStyle.success, label="3rd Party Mods", custom_id="third_party_mods"))
-        self.add_item(Button(style=discord.ButtonStyle.danger, label="Ingame Setup", custom_id="ingame_setup"))
+MACRO_DETAILS_PATTERN = re.compile(r"\*\*Type of Check:\*\* (?P<type>.*)\n.*\n\*\*Ban:\*\* (?P<ban>.*)")
+MACRO_VIDEO_PATTERN = re.compile(r"\[\*\*Video\*\*\]\((?P<url>.*)\)")
+MACRO_CHART_WINDOWS = {"30d": 30, "90d": 90, "1y": 365, "all": None}  # {choice: days, None for all time}
+MACRO_CHART_TYPES = 6  # Most common check types charted on their own, the rest as "Other"
 
-class ThirdPartyModsView(View):
-    def __init__(self):
-        super().__init__(timeout=None)
-        self.add_item(Button(style=discord.ButtonStyle.primary, label="Odin", custom_id="odin_mod"))
-        self.add_item(Button(style=discord.ButtonStyle.secondary, label="Chattriggers", custom_id="chattriggers_mod"))
-        self.add_item(Button(style=discord.ButtonStyle.success, label="NEU", custom_id="neu_mod"))
 
-class IngameSetupView(View):
-    def __init__(self):
-        super().__init__(timeout=None)
-        self.add_item(Button(style=discord.ButtonStyle.primary, label="Fishing Setup", custom_id="fishing_setup"))
-        self.add_item(Button(style=discord.ButtonStyle.secondary, label="Cage Setup", custom_id="cage_setup"))
+class MacroCheckLog:
+    # Posted macro checks as JSON lines in DATA_DIR, for the /macrostats charts.
+    # The log is built once from the channel history; until then new checks
+    # aren't written, the history scan will find them
+    def __init__(self, filename: Optional[str] = "macro_checks.jsonl"):
+        self.filename = filename
+        self.checks: Optional[List[Tuple[float, str, bool]]] = None  # (posted at, check type, banned)
+        self.videos: set = set()  # video URLs of the posted checks, for the import's duplicate check
+        self.version = 0  # bumped per new check, charts are cached per version
+        self._loading: Optional[asyncio.Task] = None
 
-class FishingSetupView(View):
+    @staticmethod
+    def parse_embed(embed: discord.Embed) -> Optional[Tuple[str, bool]]:
+        if not (embed.title or "").startswith("Macro Check - "):
+            return None
+        for field in embed.fields:
+            match = MACRO_DETAILS_PATTERN.search(field.value or "")
+            if match:
+                return match["type"].strip(), match["ban"].strip().lower() == "yes"
+        return None
+
+    @staticmethod
+    def video_of(embed: discord.Embed) -> Optional[str]:
+        for field in embed.fields:
+            match = MACRO_VIDEO_PATTERN.fullmatch(field.value or "")
+            if match:
+                return match["url"]
+        return None
+
+    def _path(self) -> Optional[str]:
+        return data_path(self.filename) if self.filename else None
+
+    async def load(self, channel: discord.TextChannel) -> List[Tuple[float, str, bool]]:
+        if self.checks is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load(channel))
+            try:
+                await asyncio.shield(self._loading)
+            finally:
+                self._loading = None  # a failed scan is retried by the next caller
+        return self.checks
+
+    async def _load(self, channel: discord.TextChannel):
+        path = self._path()
+        checks = []
+        videos = set()
+        complete = bool(path and os.path.exists(path))
+        if complete:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        check = json.loads(line)
+                        checks.append((check["ts"], check["type"], check["ban"]))
+                        videos.add(check.get("video"))
+            # Logs written before the videos were recorded are rebuilt once
+            complete = None not in videos
+        if not complete:
+            checks = []
+            videos = set()
+            lines = []
+            async for message in channel.history(limit=None, oldest_first=True):
+                parsed = message.embeds and self.parse_embed(message.embeds[0])
+                if parsed:
+                    video = self.video_of(message.embeds[0]) or ""
+                    checks.append((message.created_at.timestamp(), *parsed))
+                    videos.add(video)
+                    lines.append(json.dumps({"ts": checks[-1][0], "type": parsed[0], "ban": parsed[1], "video": video}) + "\n")
+            logging.info(f"Built the macro check log from {len(checks)} checks in the channel history")
+            if path:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    f.writelines(lines)
+                os.replace(f"{path}.tmp", path)
+        videos.discard("")
+        self.checks = checks
+        self.videos = videos
+
+    def record(self, check_type: str, ban_status: str, video_url: str):
+        self.version += 1
+        check = (time.time(), check_type.strip(), ban_status.strip().lower() == "yes")
+        if self.checks is not None:
+            self.checks.append(check)
+            self.videos.add(video_url)
+        path = self._path()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": check[0], "type": check[1], "ban": check[2], "video": video_url}) + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to record macro check: {e}")
+
+
+macro_check_log = MacroCheckLog()
+
+
+def render_macro_chart(checks: List[Tuple[float, str, bool]], days: Optional[int], now: float) -> bytes:
+    # Runs in a chart worker process. Stacked checks per check type with bans
+    # as a line, per day, week or month depending on the time span
+    from matplotlib.figure import Figure
+
+    span_days = days or max(1, math.ceil((now - min((ts for ts, _, _ in checks), default=now)) / 86400))
+    bucket_days = 1 if span_days <= 31 else 7 if span_days <= 180 else 30
+    buckets = max(1, math.ceil(span_days / bucket_days))
+    bucket_seconds = bucket_days * 86400
+
+    top_types = [kind for kind, _ in Counter(kind for _, kind, _ in checks).most_common(MACRO_CHART_TYPES)]
+    counts = {kind: [0] * buckets for kind in top_types + ["Other"]}
+    bans = [0] * buckets
+    for ts, kind, banned in checks:
+        index = buckets - 1 - int((now - ts) // bucket_seconds)
+        if index < 0:
+            continue
+        counts[kind if kind in top_types else "Other"][index] += 1
+        bans[index] += banned
+
+    starts = [datetime.fromtimestamp(now - (buckets - i) * bucket_seconds) for i in range(buckets)]
+    labels = [start.strftime("%d %b" if bucket_days < 30 else "%b %Y") for start in starts]
+    figure = Figure(figsize=(10, 4.5), dpi=100)
+    axes = figure.subplots()
+    bottom = [0] * buckets
+    for kind, values in counts.items():
+        if any(values):
+            axes.bar(range(buckets), values, bottom=bottom, label=kind[:30])
+            bottom = [b + v for b, v in zip(bottom, values)]
+    axes.plot(range(buckets), bans, color="black", marker="o", markersize=3, label="Bans")
+    step = max(1, buckets // 12)
+    axes.set_xticks(range(0, buckets, step), labels[::step], rotation=30, ha="right")
+    axes.set_ylabel("Checks per " + {1: "day", 7: "week"}.get(bucket_days, "month"))
+    axes.set_title(f"Macro checks, last {days} days" if days else "Macro checks, all time")
+    axes.legend(loc="upper left", fontsize="small")
+    figure.tight_layout()
+    output = io.BytesIO()
+    figure.savefig(output, format="png")
+    return output.getvalue()
+
+
+class MacroChartRenderer:
+    # Charts are rendered in a process pool so matplotlib never blocks the
+    # event loop. A chart is cached per window and day until a new check is
+    # recorded, and concurrent requests for one chart share a render
     def __init__(self):
-        super().__init__(timeout=None)
-        self.add_item(Button(emoji="🛡️", label="Armor", custom_id="fishing_armor", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="🧰", label="Equipment", custom_id="fishing_equipment", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="🐚", label="Pet", custom_id="fishing_pet", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="🎣", label="Fishing Rod", custom_id="fishing_rod", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="⚔️", label="Weapons", custom_id="fishing_weapons", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="🪨", label="Power Stone", custom_id="power_stone", style=discord.ButtonStyle.primary))
-        self.add_item(Button(emoji="⛏️", label="HOTM", custom_id="fishing_hotm", style=discord.ButtonStyle.primary))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: Dict[Tuple[str, str], Tuple[int, bytes]] = {}  # {(window, day): (log version, png)}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.renders = 0
+        self.hits = 0
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("matplotlib") is not None
+
+    async def chart(self, window: str, channel: discord.TextChannel) -> bytes:
+        await macro_check_log.load(channel)
+        key = (window, datetime.now().strftime("%Y-%m-%d"))
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == macro_check_log.version:
+            self.hits += 1
+            return cached[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(key))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _render(self, key: Tuple[str, str]) -> bytes:
+        version = macro_check_log.version
+        days = MACRO_CHART_WINDOWS[key[0]]
+        now = time.time()
+        checks = [check for check in macro_check_log.checks if days is None or check[0] >= now - days * 86400]
+        if self._pool is None:
+            # spawn: a forked worker would inherit the loop's threads and locks
+            self._pool = ProcessPoolExecutor(CONFIG["CHART_WORKERS"], mp_context=multiprocessing.get_context("spawn"))
+        pool = self._pool
+        try:
+            png = await asyncio.get_running_loop().run_in_executor(pool, render_macro_chart, checks, days, now)
+        except BrokenProcessPool:
+            # A worker died; the rest of the pool is shut down and the next chart starts a new one
+            if self._pool is pool:
+                self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            del self._inflight[key]
+        self.renders += 1
+        self._cache = {cached_key: entry for cached_key, entry in self._cache.items() if cached_key[1] == key[1]}
+        self._cache[key] = (version, png)
+        return png
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+macro_charts = MacroChartRenderer()
 
 # ====================== Bot Events and Commands ======================
 
+startup_complete = False  # on_ready fires again after gateway reconnects
+
 @bot.event
 async def on_ready():
+    global startup_complete
     print(f'Logged in as {bot.user.name}')
+    member_cache.install_presence_filter()
+    if not startup_complete:
+        state_snapshot.restore()
+    category = bot.get_channel(CONFIG["TARGET_CATEGORY_ID"])
+    if category:
+        await member_cache.load_party_members(category.guild)
+        category_allocator.adopt(category.guild)
     await post_initial_button()
     logging.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
+
+    if member_cache.startup_seconds is None:
+        member_cache.startup_seconds = time.monotonic() - PROCESS_STARTED
+    report = member_cache.report()
+    logging.info(
+        f"Ready after {report['startup_seconds']:.2f}s with {report['mode']} member cache: "
+        f"{report['cached_members']} members cached, {report['rss_mb']:.1f} MB resident"
+    )
+
+    if startup_complete:
+        logging.info("Reconnected, startup tasks already running")
+        return
+    startup_complete = True
     
+    loop_monitor.start()
+    asyncio.ensure_future(party_log.load())  # /partystats aggregates, rebuilt off the event loop
+    if CONFIG["PARTY_API_PORT"]:
+        await party_api.start()
+
     # Add persistent views
     bot.add_view(PartyView(0, 0))  # For the initial button
     
     # Start the offline members check task
     check_offline_members.start()
+    macro_import.resume()
+    if CONFIG["PARTY_IDLE_TIMEOUT"]:
+        collect_idle_parties.start()
+    if CONFIG["MATCHMAKING_MODE"]:
+        run_matchmaking.start()
+    asset_store.report_missing()
+    if CONFIG["ASSET_CHANNEL_ID"]:
+        refresh_guide_assets.start()
     
-    logging.info("Syncing commands...")
     try:
-        synced = await bot.tree.sync()
-        logging.info(f"Successfully synced {len(synced)} commands")
+        await sync_command_tree()
     except Exception as e:
         logging.error(f"Error syncing commands: {e}")
 
 @bot.event
 async def on_presence_update(before: discord.Member, after: discord.Member):
+    recorder.record_presence(before, after)
+    if event_log.isEnabledFor(logging.DEBUG):
+        event_log.debug("presence update", extra={
+            "event": "presence_update",
+            "user": after.id,
+            "party": state.user_participation.get(after.id),
+            "status": str(after.status)
+        })
+    if after.status == discord.Status.offline and queued_type(after.id) is not None:
+        leave_matchmaking_queue(after.id)
     if after.id in state.user_participation:
         channel_id = state.user_participation[after.id]
         
@@ -1014,6 +4078,10 @@ async def on_presence_update(before: discord.Member, after: discord.Member):
 async def on_message(message):
     if message.author == bot.user:
         return
+
+    recorder.record_message(message)
+    if message.channel.id in state.active_channels:
+        idle_parties.touch(message.channel.id)
         
     if message.content == "!menu18769":
         embed = discord.Embed(
@@ -1024,6 +4092,51 @@ async def on_message(message):
         )
         await message.channel.send(embed=embed, view=MenuView())
     
+    # Force a global command sync, e.g. after editing commands without a code change
+    elif message.content == "!sync":
+        if message.author.id != CONFIG["AUTHORIZED_USER_ID"]:
+            return
+        try:
+            synced = await sync_command_tree(force=True)
+            await message.channel.send(f"Synced {synced} commands.")
+        except Exception as e:
+            logging.error(f"Error syncing commands: {e}")
+            await message.channel.send(f"Command sync failed: {e}")
+
+    # Report memory used by the bot's structures and discord.py's caches;
+    # "!memory trace" diffs tracemalloc snapshots between calls, "!memory untrace" stops tracing
+    elif message.content.split()[:1] == ["!memory"]:
+        if message.author.id != CONFIG["AUTHORIZED_USER_ID"]:
+            return
+        option = message.content[len("!memory"):].strip()
+        if option == "trace":
+            report = await memory_introspector.trace_diff()
+        elif option == "untrace":
+            memory_introspector.stop_tracing()
+            report = "Allocation tracing stopped."
+        else:
+            report = await memory_introspector.report()
+        await message.channel.send(f"```\n{report[:1900]}\n```")
+
+    # Bulk macro checks from an attached CSV or JSON file; "!macroimport" alone
+    # shows the progress of a running import, "!macroimport cancel" stops it
+    elif message.content.split()[:1] == ["!macroimport"]:
+        if message.author.id != CONFIG["AUTHORIZED_USER_ID"]:
+            return
+        if message.content[len("!macroimport"):].strip() == "cancel":
+            cancelled = macro_import.cancel()
+            await message.channel.send("Macro check import cancelled." if cancelled else macro_import.progress())
+        elif message.attachments:
+            await submit_macro_import(message)
+        else:
+            await message.channel.send(macro_import.progress())
+
+    # Event loop lag histogram and the stacks that blocked the loop
+    elif message.content == "!lag":
+        if message.author.id != CONFIG["AUTHORIZED_USER_ID"]:
+            return
+        await message.channel.send(f"```\n{loop_monitor.report()[-1900:]}\n```")
+
     # Add the !close command handler
     elif message.content == "!close":
         # Check if the message author is the bot creator
@@ -1052,41 +4165,37 @@ async def on_message(message):
         party_data = state.active_channels[message.channel.id]
         
         # Notify all members
-        for member_id in party_data['members']:
-            member = message.guild.get_member(member_id)
-            if member:
-                try:
-                    await member.send(
-                        embed=discord.Embed(
-                            title="Party Closed",
-                            description=f"The party in {message.channel.mention} was closed by the bot creator.",
-                            color=discord.Color.red()
-                        )
-                    )
-                except discord.Forbidden:
-                    pass  # User has DMs disabled
-            
-            # Remove user from participation tracking
-            if member_id in state.user_participation:
-                del state.user_participation[member_id]
-        
-        # Delete the channel
-        await message.channel.delete()
-        
-        # Clean up state
-        del state.active_channels[message.channel.id]
-        if message.channel.id in state.party_views:
-            del state.party_views[message.channel.id]
-            
-        await post_initial_button()
+        dm_notifier.notify(
+            party_data['members'],
+            discord.Embed(
+                title="Party Closed",
+                description=f"The party in {message.channel.mention} was closed by the bot creator.",
+                color=discord.Color.red()
+            )
+        )
+        # Delete the channel and clean up state
+        await close_party(message.channel.id, "owner")
 
 @bot.event
 async def on_interaction(interaction):
+    recorder.record_interaction(interaction)
+    member_cache.touch(interaction.user)
+    if event_log.isEnabledFor(logging.DEBUG):
+        latency = (discord.utils.utcnow() - interaction.created_at).total_seconds() if interaction.created_at else None
+        event_log.debug("interaction", extra=dict(
+            interaction_log_fields(interaction),
+            event="interaction",
+            latency_ms=round(latency * 1000, 1) if latency is not None else None
+        ))
+    if interaction.channel_id in state.active_channels:
+        idle_parties.touch(interaction.channel_id)
     if interaction.type != discord.InteractionType.component:
         return
     
     try:
         custom_id = interaction.data.get("custom_id")
+        if custom_id in GUIDE_BUTTON_IDS and not await admit_interaction(interaction, "guide"):
+            return
         
         # Wormfishing guide interactions
         if custom_id == "taunahi_settings":
@@ -1104,13 +4213,13 @@ async def on_interaction(interaction):
             embed1.add_field(name="Only important for the Killer / Party creator", value=" ", inline=False)
             
             embed2 = discord.Embed(color=discord.Color.blue())
-            embed2.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1373834661033414829/Screenshot_2025-05-19_030542.png")
+            embed2.set_image(url=asset_store.url("taunahi_settings_1"))
             
             embed3 = discord.Embed(color=discord.Color.blue())
-            embed3.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1373834661830197298/Screenshot_2025-05-19_030627.png")
+            embed3.set_image(url=asset_store.url("taunahi_settings_2"))
             
             embed4 = discord.Embed(color=discord.Color.blue())
-            embed4.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1373834661435805746/Screenshot_2025-05-19_030649.png")
+            embed4.set_image(url=asset_store.url("taunahi_settings_3"))
             
             await interaction.response.send_message(embeds=[embed1, embed2, embed3, embed4], ephemeral=True)
         
@@ -1145,7 +4254,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed1.add_field(name="***Upgrades:***", value="**Reforge:**  Festive\n**Modifiers:**     Recombulator 3000\n**Gemstones:**   2x Perfect Aqua\n**Enchants:**  Bobbin' Time V\n**Attributes:** Fishing Experience 10", inline=True)
-            embed1.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374148870249910342/magma_lord_helmet.png")
+            embed1.set_thumbnail(url=asset_store.url("magma_lord_helmet"))
             
             embed2 = discord.Embed(
                 title="Magma Lord Chestplate 9✪",
@@ -1153,7 +4262,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed2.add_field(name="***Upgrades:***", value="**Reforge:**  Festive\n**Modifiers:**     Recombulator 3000\n**Gemstones:**   2x Perfect Aqua\n**Enchants:**  Bobbin' Time V\n**Attributes:** Fishing Experience 10", inline=True)
-            embed2.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149395939065916/magma_lord_chestplate.png")
+            embed2.set_thumbnail(url=asset_store.url("magma_lord_chestplate"))
             
             embed3 = discord.Embed(
                 title="Magma Lord Leggings 9✪",
@@ -1161,7 +4270,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed3.add_field(name="***Upgrades:***", value="**Reforge:**  Festive\n**Modifiers:**     Recombulator 3000\n**Gemstones:**   2x Perfect Aqua\n**Enchants:**  Bobbin' Time V\n**Attributes:** Fishing Experience 10", inline=True)
-            embed3.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149434518143066/magma_lord_leggings.png")
+            embed3.set_thumbnail(url=asset_store.url("magma_lord_leggings"))
             
             embed4 = discord.Embed(
                 title="Magma Lord Boots 9✪",
@@ -1169,7 +4278,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed4.add_field(name="***Upgrades:***", value="**Reforge:**  Festive\n**Modifiers:**     Recombulator 3000\n**Gemstones:**   2x Perfect Aqua\n**Enchants:**  Bobbin' Time V\n**Attributes:** Fishing Experience 10", inline=True)
-            embed4.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149467124793364/magma_lord_boots.png")
+            embed4.set_thumbnail(url=asset_store.url("magma_lord_boots"))
             
             await interaction.response.send_message(embeds=[embed1, embed2, embed3, embed4], ephemeral=True)
         
@@ -1180,7 +4289,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed1.add_field(name="***Upgrades:***", value="**Reforge:**  Snowy\n**Modifiers:**     Recombulator 3000", inline=True)
-            embed1.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374777154675540139/Thunderbolt_Necklace.png")
+            embed1.set_thumbnail(url=asset_store.url("thunderbolt_necklace"))
             
             embed2 = discord.Embed(
                 title="Gillsplash Cloak 10✪",
@@ -1188,7 +4297,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed2.add_field(name="***Upgrades:***", value="**Reforge:**  Snowy\n**Modifiers:**     Recombulator 3000", inline=True)
-            embed2.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374525958458970322/latest.png")
+            embed2.set_thumbnail(url=asset_store.url("gillsplash_cloak"))
             
             embed3 = discord.Embed(
                 title="Gillsplash Belt 10✪",
@@ -1196,7 +4305,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed3.add_field(name="***Upgrades:***", value="**Reforge:**  Snowy\n**Modifiers:**     Recombulator 3000", inline=True)
-            embed3.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374526000699801621/latest.png")
+            embed3.set_thumbnail(url=asset_store.url("gillsplash_belt"))
             
             embed4 = discord.Embed(
                 title="Gillsplash Gloves 10✪",
@@ -1204,7 +4313,7 @@ async def on_interaction(interaction):
                 color=discord.Color.orange()
             )
             embed4.add_field(name="***Upgrades:***", value="**Reforge:**  Snowy\n**Modifiers:**     Recombulator 3000", inline=True)
-            embed4.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374526044274430033/latest.png")
+            embed4.set_thumbnail(url=asset_store.url("gillsplash_gloves"))
             
             await interaction.response.send_message(embeds=[embed1, embed2, embed3, embed4], ephemeral=True)
         
@@ -1215,7 +4324,7 @@ async def on_interaction(interaction):
                 color=discord.Color.teal()
             )
             embed.add_field(name="***Upgrades:***", value="**Pet Item:**  Burnt Texts", inline=True)
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149564159754311/a074a7bd976fe6aba1624161793be547d54c835cf422243a851ba09d1e650553.png")
+            embed.set_thumbnail(url=asset_store.url("ammonite"))
             
             await interaction.response.send_message(embed=embed, ephemeral=True)
         
@@ -1226,7 +4335,7 @@ async def on_interaction(interaction):
                 color=discord.Color.dark_red()
             )
             embed.add_field(name="***Upgrades:***", value="**Reforge:**  Pitchin'\n**Modifiers:**     Recombulator 3000\n**Gemstones:**   2x Perfect Aqua\n**Enchants:**  Flash 5 / everything beside Corruption\n**Attributes:** Double Hook 10 / Fishing Speed 10\n**Parts:** Titan Line", inline=True)
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149629637034074/hellfire_rod.png")
+            embed.set_thumbnail(url=asset_store.url("hellfire_rod"))
             
             await interaction.response.send_message(embed=embed, ephemeral=True)
         
@@ -1237,7 +4346,7 @@ async def on_interaction(interaction):
                 color=discord.Color.purple()
             )
             embed1.add_field(name="***Upgrades:***", value="**Enchant:**  Looting 5", inline=True)
-            embed1.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374150077974577306/hyperion.png")
+            embed1.set_thumbnail(url=asset_store.url("hyperion"))
             
             embed2 = discord.Embed(
                 title="Dreadlord Sword",
@@ -1245,7 +4354,7 @@ async def on_interaction(interaction):
                 color=discord.Color.dark_grey()
             )
             embed2.add_field(name="***Upgrades:***", value="**Enchant:**  None", inline=True)
-            embed2.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1374149764853268642/dreadlord_sword.png")
+            embed2.set_thumbnail(url=asset_store.url("dreadlord_sword"))
             
             await interaction.response.send_message(embeds=[embed1, embed2], ephemeral=True)
 
@@ -1256,7 +4365,7 @@ async def on_interaction(interaction):
                 color=discord.Color.dark_green()
             )
             embed.add_field(name="***Tuning:***", value="*None*", inline=True)
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/1374148859034468496/1375837261480067152/Glass_JE4_BE2.webp?ex=683323cc&is=6831d24c&hm=db054d393fff2d050f209af73160adf683d7e6a84ab40ab1c6cc069dc20af3e5&")
+            embed.set_thumbnail(url=asset_store.url("power_stone"))
             
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -1267,7 +4376,7 @@ async def on_interaction(interaction):
                 color=discord.Color.dark_orange()
             )
             embed.add_field(name="***Specs:***", value="**HOTM:**  6\n**Perks:**    Subterranean Fisher / Quick Forge\n**Note:**  Higher HOTM = More Double Hook",inline=True)
-            embed.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1374151457196085329/image.png")
+            embed.set_image(url=asset_store.url("hotm"))
             
             await interaction.response.send_message(embed=embed, ephemeral=True)
         
@@ -1277,7 +4386,7 @@ async def on_interaction(interaction):
                 description="Proper cage placement for worm fishing:",
                 color=discord.Color.greyple()
             )
-            embed.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1374121091529969834/cageonline-video-cutter.com-ezgif.com-video-to-gif-converter.gif")
+            embed.set_image(url=asset_store.url("cage_setup"))
             await interaction.response.send_message(embed=embed, ephemeral=True)
         
         elif custom_id == "odin_mod":
@@ -1285,7 +4394,7 @@ async def on_interaction(interaction):
                 title="Odin",
                 color=discord.Color.blue()
             )
-            embed.set_image(url="https://cdn.discordapp.com/attachments/1373747930066063472/1373964133426270248/Recording2025-05-19113500online-video-cutter.com1-ezgif.com-video-to-gif-converter.gif")
+            embed.set_image(url=asset_store.url("odin"))
             embed.add_field(
                 name="Download", 
                 value="[Get Odin Mod](https://github.com/odtheking/Odin/releases)", 
@@ -1338,10 +4447,126 @@ async def on_interaction(interaction):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             
     except Exception as e:
-        logging.error(f"Error handling interaction: {e}")
+        logging.error(f"Error handling interaction: {e}", extra=interaction_log_fields(interaction))
         if not interaction.response.is_done():
             await interaction.response.send_message("An error occurred while processing your request.", ephemeral=True)
 
+@bot.tree.command(
+    name="join",
+    description=f"Join or create a {DEFAULT_PARTY_TYPE.name} party" if len(PARTY_TYPES) == 1 else "Join or create a party"
+)
+@app_commands.describe(
+    ign="Your Minecraft name, defaults to the one you used last",
+    activity=f"What the party is for, defaults to {DEFAULT_PARTY_TYPE.name}"
+)
+@app_commands.choices(activity=[
+    app_commands.Choice(name=party_type.name, value=party_type.key) for party_type in PARTY_TYPES.values()
+])
+async def join_command(interaction: discord.Interaction, ign: Optional[str] = None, activity: Optional[str] = None):
+    try:
+        if not await admit_interaction(interaction, "join"):
+            return
+        if await reject_if_in_party(interaction):
+            return
+        party_type = PARTY_TYPES.get(activity, DEFAULT_PARTY_TYPE)
+
+        if ign is None:
+            recent = ign_memory.recent(interaction.user.id)
+            if not recent:
+                await interaction.response.send_modal(UsernameModal(party_type))
+                return
+            ign = recent[0]
+            await interaction.response.defer(ephemeral=True)  # creating the party can outlast the 3s deadline
+        else:
+            await interaction.response.defer(ephemeral=True)
+            profile = await canonical_ign(ign)
+            if profile is None:
+                await send_ephemeral(interaction, embed=unknown_ign_embed(ign))
+                return
+            ign = profile[0]
+
+        ign_memory.remember(interaction.user.id, ign)
+        await handle_party_join(interaction, ign, party_type)
+    except Exception as e:
+        logging.error(f"Error in /join: {e}", extra=interaction_log_fields(interaction))
+        await send_ephemeral(interaction, "An error occurred while processing your request.")
+
+@join_command.autocomplete("ign")
+async def join_ign_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    return [
+        app_commands.Choice(name=ign, value=ign)
+        for ign in ign_memory.recent(interaction.user.id)
+        if ign.lower().startswith(current.lower())
+    ][:25]
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+@bot.tree.command(
+    name="partystats",
+    description="Show party statistics"
+)
+@app_commands.describe(leaderboard="Show the most active players (bot owner only)")
+async def partystats(interaction: discord.Interaction, leaderboard: bool = False):
+    if leaderboard and interaction.user.id != CONFIG["AUTHORIZED_USER_ID"]:
+        await interaction.response.send_message("Only the bot creator can view the leaderboard!", ephemeral=True)
+        return
+
+    if not party_log.loaded:
+        await interaction.response.defer(ephemeral=leaderboard)  # only right after a restart
+    stats = await party_log.load()
+    created = stats.counts["create"]
+    title = f"{DEFAULT_PARTY_TYPE.name} Party Statistics" if len(PARTY_TYPES) == 1 else "Party Statistics"
+    embed = discord.Embed(title=title, color=discord.Color.blue())
+    parties = f"**Created:** {created}\n**Open:** {len(stats.open)}\n**Closed:** {stats.closed}"
+    if len(PARTY_TYPES) > 1:
+        parties += "".join(
+            f"\n**{party_type.name}:** {stats.created_by_type[party_type.key]} created" for party_type in PARTY_TYPES.values()
+        )
+    embed.add_field(
+        name="Parties",
+        value=parties,
+        inline=True
+    )
+    avg_fill = format_duration(stats.fill_seconds / stats.filled) if stats.filled else "n/a"
+    avg_size = f"{stats.peak_sizes / stats.closed:.1f}" if stats.closed else "n/a"
+    avg_life = format_duration(stats.lifetime_seconds / stats.closed) if stats.closed else "n/a"
+    embed.add_field(
+        name="Averages",
+        value=f"**Time to fill:** {avg_fill} ({stats.filled} filled)\n**Peak size:** {avg_size}\n**Lifetime:** {avg_life}",
+        inline=True
+    )
+    offline_closes = stats.close_reasons["offline"]
+    offline_share = f" ({offline_closes / stats.closed:.0%})" if stats.closed else ""
+    embed.add_field(
+        name="Activity",
+        value=(
+            f"**Joins:** {stats.counts['join']} · **Leaves:** {stats.counts['leave']} · **Kicks:** {stats.counts['kick']}\n"
+            f"**Leader transfers:** {stats.counts['transfer']} · **Locked:** {stats.counts['lock']} · "
+            f"**Resized:** {stats.counts['resize']}\n"
+            f"**Removed for being offline:** {stats.counts['offline_remove']}\n"
+            f"**Parties ended by offline removals:** {offline_closes}{offline_share}\n"
+            f"**Closed for inactivity:** {stats.close_reasons['idle']}"
+        ),
+        inline=False
+    )
+    if leaderboard:
+        for title, counter in (("Most parties joined", stats.joins_by_user), ("Most parties led", stats.leads_by_user)):
+            top = counter.most_common(10)
+            embed.add_field(
+                name=title,
+                value="\n".join(f"{i}. <@{user_id}> ({count})" for i, (user_id, count) in enumerate(top, 1)) or "No data yet",
+                inline=True
+            )
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, ephemeral=leaderboard)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=leaderboard)
+
 @bot.tree.command(
     name="macroadd",
     description="Create a macro check embed with video"
@@ -1368,34 +4593,16 @@ async def macroadd(
         if channel is None:
             raise ValueError("Could not find the macro checks channel")
         
-        # Create player head URL
-        player_head_url = f"https://mc-heads.net/avatar/{account_name}/128"
-        
-        # Check if custom_name is a user mention
-        if custom_name.startswith('<@') and custom_name.endswith('>'):
-            display_name = custom_name
-        else:
-            try:
-                user_id = int(custom_name)
-                user = await bot.fetch_user(user_id)
-                display_name = user.mention
-            except (ValueError, discord.NotFound):
-                display_name = custom_name
-        
-        embed = discord.Embed(
-            title=f"Macro Check - {display_name}",
-            color=discord.Color.red(),
-            description=f"** **"
-        )
-        
-        embed.add_field(name=f" ", value=f" ", inline=False)
-        embed.add_field(
-            name=f" ", 
-            value=f"**Type of Check:** {check_type}\n**Macro Duration:** {macro_duration}\n**Ban:** {ban_status}", 
-            inline=False
-        )
-        embed.set_thumbnail(url=player_head_url)
-        embed.add_field(name=" ", value=f"[**Video**]({video_url})", inline=False)
+        await interaction.response.defer(ephemeral=True)  # the Mojang lookup can take up to IGN_LOOKUP_TIMEOUT
+        profile = await canonical_ign(account_name)
+        if profile is None:
+            await interaction.followup.send(embed=unknown_ign_embed(account_name), ephemeral=True)
+            return
+        account_name, account_uuid = profile
+
+        display_name = await macro_check_display_name(custom_name)
+        embed = macro_check_embed(display_name, check_type, macro_duration, ban_status, video_url,
+                                  account_uuid or account_name)
         
         if interaction.user.id != CONFIG["AUTHORIZED_USER_ID"]:
             instruction_embed = discord.Embed(
@@ -1408,29 +4615,43 @@ async def macroadd(
                 value="Send <@ ur self> a video of the macro check, the account name, the type of check you got, the macro duration and your ban status",
                 inline=False
             )
-            await interaction.response.send_message(embed=instruction_embed, ephemeral=True)
+            await interaction.followup.send(embed=instruction_embed, ephemeral=True)
         else:
             await channel.send(embed=embed)
-            await interaction.response.send_message("Macro check added successfully!", ephemeral=True)
+            macro_check_log.record(check_type, ban_status, video_url)
+            await interaction.followup.send("Macro check added successfully!", ephemeral=True)
         
     except Exception as e:
         error_msg = "❌ Failed to create macro embed"
         logging.error(f"{error_msg}: {e}")
-        await interaction.response.send_message(error_msg, ephemeral=True)
+        await send_ephemeral(interaction, error_msg)
 
 @bot.tree.command(
     name="macrostats",
     description="Show macro check statistics"
 )
-async def macrostats(interaction: discord.Interaction):
+@app_commands.describe(chart="Attach a chart of checks and bans by check type over this time")
+@app_commands.choices(chart=[
+    app_commands.Choice(name="Last 30 days", value="30d"),
+    app_commands.Choice(name="Last 90 days", value="90d"),
+    app_commands.Choice(name="Last year", value="1y"),
+    app_commands.Choice(name="All time", value="all")
+])
+async def macrostats(interaction: discord.Interaction, chart: Optional[str] = None):
     try:
         channel = bot.get_channel(CONFIG["MACRO_CHECKS_CHANNEL_ID"])
         if channel is None:
             raise ValueError("Could not find the macro checks channel")
+        if chart is not None:
+            if not macro_charts.available():
+                await interaction.response.send_message("Charts need matplotlib: `pip install matplotlib`", ephemeral=True)
+                return
+            await interaction.response.defer()  # the first chart also builds the check log and starts a worker
+        elif macro_check_log.checks is None:
+            await interaction.response.defer()  # building the check log scans the channel history once
         
-        count = 0
-        async for _ in channel.history(limit=None):
-            count += 1
+        # Counted from the check log; the channel history is only read to build it
+        count = len(await macro_check_log.load(channel))
         
         embed = discord.Embed(
             title="Macro Check Statistics",
@@ -1453,17 +4674,45 @@ async def macrostats(interaction: discord.Interaction):
             inline=False
         )
         
-        await interaction.response.send_message(embed=embed)
+        if chart is not None:
+            png = await macro_charts.chart(chart, channel)
+            embed.set_image(url="attachment://macro_checks.png")
+            await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(png), "macro_checks.png"))
+        elif interaction.response.is_done():
+            await interaction.followup.send(embed=embed)
+        else:
+            await interaction.response.send_message(embed=embed)
         
     except Exception as e:
         error_msg = "❌ Failed to create stats embed"
         logging.error(f"{error_msg}: {e}")
-        await interaction.response.send_message(error_msg, ephemeral=True)
+        if interaction.response.is_done():
+            await interaction.followup.send(error_msg, ephemeral=True)
+        else:
+            await interaction.response.send_message(error_msg, ephemeral=True)
+
+async def edit_offline_countdown(channel: discord.TextChannel, message_id: int, user_id: int, remaining_time: timedelta):
+    try:
+        msg = await channel.fetch_message(message_id)
+    except discord.NotFound:
+        return  # message deleted manually
+    minutes, seconds = divmod(int(remaining_time.total_seconds()), 60)
+    embed = discord.Embed(
+        title="Player Went Offline",
+        description=(
+            f"<@{user_id}> has gone offline.\n"
+            f"They will be automatically removed in **{minutes:02}:{seconds:02}** if they don't come back."
+        ),
+        color=discord.Color.orange()
+    )
+    await msg.edit(embed=embed)
 
 @tasks.loop(minutes=1)  # Check every minute
+@graceful_shutdown.periodic
 async def check_offline_members():
     now = datetime.now()
     offline_threshold = timedelta(minutes=10)
+    member_cache.trim()
 
     offline_users = list(state.last_online_time.items())
     
@@ -1473,21 +4722,10 @@ async def check_offline_members():
             channel_id, message_id = state.offline_warning_messages[user_id]
             channel = bot.get_channel(channel_id)
             if channel:
-                try:
-                    msg = await channel.fetch_message(message_id)
-                    remaining_time = offline_threshold - (now - last_online)
-                    minutes, seconds = divmod(int(remaining_time.total_seconds()), 60)
-                    embed = discord.Embed(
-                        title="Player Went Offline",
-                        description=(
-                            f"<@{user_id}> has gone offline.\n"
-                            f"They will be automatically removed in **{minutes:02}:{seconds:02}** if they don't come back."
-                        ),
-                        color=discord.Color.orange()
-                    )
-                    await msg.edit(embed=embed)
-                except discord.NotFound:
-                    pass  # message deleted manually
+                remaining_time = offline_threshold - (now - last_online)
+                side_effects.spawn("edit countdown", functools.partial(
+                    edit_offline_countdown, channel, message_id, user_id, remaining_time
+                ), channel_id=channel_id)
 
         if (now - last_online) >= offline_threshold:
             if user_id in state.user_participation:
@@ -1499,6 +4737,8 @@ async def check_offline_members():
                     index = party_data['members'].index(user_id)
                     party_data['members'].pop(index)
                     mc_name = party_data['usernames'].pop(index)
+                    index_party(channel_id)
+                    party_log.record("offline_remove", channel_id, user=user_id)
                     
                     # Remove user from participation tracking
                     del state.user_participation[user_id]
@@ -1509,13 +4749,7 @@ async def check_offline_members():
                     channel = bot.get_channel(channel_id)
                     if channel:
                         member = channel.guild.get_member(user_id)
-                        
-                        if member:
-                            await channel.set_permissions(
-                                member,
-                                read_messages=False,
-                                send_messages=False
-                            )
+                        permission_batcher.set_access(channel, user_id, False)
                         
                         # Send embed notification to the party channel
                         embed = discord.Embed(
@@ -1525,15 +4759,72 @@ async def check_offline_members():
                         )
                         await channel.send(embed=embed)
                         
-                        await update_party_embed(channel_id)
+                        update_party_embed(channel_id)
                         
                         # Delete channel if empty
                         if not party_data['members']:
-                            await channel.delete()
-                            del state.active_channels[channel_id]
-                            if channel_id in state.party_views:
-                                del state.party_views[channel_id]
-                            await post_initial_button()
+                            await close_party(channel_id, "offline")
+
+# ====================== Runtime ======================
+
+runtime_report: Dict[str, str] = {}  # What the startup profile enabled, logged at startup
+
+
+def describe_runtime(uvloop_module) -> Dict[str, str]:
+    gateway_json = "orjson" if discord.utils.HAS_ORJSON else "json (orjson not installed)"
+    if uvloop_module is not None:
+        event_loop = f"uvloop {uvloop_module.__version__}"
+    else:
+        event_loop = "asyncio" + (" (uvloop not installed)" if CONFIG["PERFORMANCE_PROFILE"] else "")
+    if CONFIG["PERFORMANCE_PROFILE"]:
+        http_pool = f"{CONFIG['HTTP_POOL_SIZE']} connections, {CONFIG['HTTP_KEEPALIVE']}s keep-alive"
+    else:
+        http_pool = "discord.py default (unlimited, 15s keep-alive)"
+    return {
+        "profile": "performance" if CONFIG["PERFORMANCE_PROFILE"] else "default",
+        "event_loop": event_loop,
+        # discord.py picks orjson by itself once it is installed
+        "gateway_json": gateway_json,
+        "gateway_compression": discord.utils._ActiveDecompressionContext.COMPRESSION_TYPE,
+        "http_pool": http_pool
+    }
+
+
+async def start_bot(token: str):
+    if CONFIG["PERFORMANCE_PROFILE"]:
+        # discord.py creates an unlimited pool at login unless one is set; aiohttp wants it made on the running loop
+        bot.http.connector = aiohttp.TCPConnector(
+            limit=CONFIG["HTTP_POOL_SIZE"],
+            keepalive_timeout=CONFIG["HTTP_KEEPALIVE"],
+            ttl_dns_cache=300
+        )
+    graceful_shutdown.install(asyncio.get_running_loop())
+    async with bot:
+        await bot.start(token)
+
+
+def run_bot(token: str):
+    global log_listener
+    if log_listener is None:
+        log_listener = setup_logging()
+    uvloop_module = None
+    if CONFIG["PERFORMANCE_PROFILE"]:
+        try:
+            import uvloop as uvloop_module
+        except ImportError:
+            pass
+    runtime_report.update(describe_runtime(uvloop_module))
+    logging.info("Runtime: " + ", ".join(f"{key}={value}" for key, value in runtime_report.items()))
+    try:
+        if uvloop_module is not None:
+            uvloop_module.run(start_bot(token))
+        else:
+            asyncio.run(start_bot(token))
+    except KeyboardInterrupt:
+        pass
+    stop_logging()
+
 
 # Run the bot with your token
-bot.run('000000000')
+if __name__ == "__main__":
+    run_bot('000000000')
@@ -0,0 +1,306 @@
+"""In-process benchmarks for the party-finder hot paths.
+
+Runs app.py handlers against the fakes in fakes.py and reports throughput,
+p50/p99 handler latency, REST calls per operation and peak traced memory.
+
+    python bench.py                       # all scenarios, default sizes
+    python bench.py join --users 5000
+    python bench.py --json out.json       # save results
+    python bench.py --compare out.json    # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import discord
+
+import app
+from fakes import FakeGuild, FakeInteraction, install
+
+
+class Harness:
+    def __init__(self, seed: int = 0):
+        app.state = app.BotState()
+        app.permission_batcher = app.PermissionBatcher()
+        app.dm_notifier = app.DMNotifier()
+        app.side_effects = app.SideEffects()
+        app.party_log = app.PartyLog(filename=None)
+        app.idle_parties = app.IdlePartyCollector()
+        app.category_allocator = app.CategoryAllocator()
+        self.guild = FakeGuild()
+        self.category = self.guild.add_category()
+        self.lobby = self.guild.add_text_channel()
+        self.rng = random.Random(seed)
+        install(app, self.guild, self.lobby, self.category)
+        self._next_user = 1
+
+    @property
+    def rest(self):
+        return self.guild.rest
+
+    def new_member(self):
+        member = self.guild.add_member(self._next_user)
+        self._next_user += 1
+        return member
+
+    async def setup(self):
+        await app.post_initial_button()
+
+    async def join(self, member):
+        interaction = FakeInteraction(member, self.guild)
+        await app.handle_party_join(interaction, f"ign_{member.id}")
+
+    async def leave(self, member):
+        channel_id = app.state.user_participation[member.id]
+        view = app.PartyView(channel_id, app.state.active_channels[channel_id]['creator_id'])
+        interaction = FakeInteraction(member, self.guild, {"custom_id": f"leave_party_{channel_id}"})
+        await view.on_leave_button(interaction)
+
+    async def kick(self, channel_id: int, target_id: int):
+        party_data = app.state.active_channels[channel_id]
+        creator = self.guild.get_member(party_data['creator_id'])
+        select = app.KickSelect(channel_id, party_data['members'], party_data['usernames'])
+        select._values = [str(target_id)]
+        await select.callback(FakeInteraction(creator, self.guild))
+
+    async def go_offline(self, member):
+        before = _Presence(member, discord.Status.online)
+        after = _Presence(member, discord.Status.offline)
+        await app.on_presence_update(before, after)
+
+    async def offline_sweep(self):
+        await app.check_offline_members.coro()
+
+
+class _Presence:
+    def __init__(self, member, status):
+        self.id = member.id
+        self.mention = member.mention
+        self.status = status
+
+
+# ---------------------------------------------------------------- scenarios
+# Each scenario returns (harness, list of zero-arg coroutine factories to time)
+
+async def scenario_join(args):
+    h = Harness(args.seed)
+    await h.setup()
+    members = [h.new_member() for _ in range(args.users)]
+    return h, [lambda m=m: h.join(m) for m in members]
+
+
+async def scenario_churn(args):
+    h = Harness(args.seed)
+    await h.setup()
+    for _ in range(args.users):
+        await h.join(h.new_member())
+
+    def pick_op():
+        roll = h.rng.random()
+        participants = list(app.state.user_participation)
+        if roll < 0.4 and participants:
+            member = h.guild.get_member(h.rng.choice(participants))
+            return h.leave(member)
+        if roll < 0.7:
+            parties = [cid for cid, d in app.state.active_channels.items() if len(d['members']) > 1]
+            if parties:
+                channel_id = h.rng.choice(parties)
+                data = app.state.active_channels[channel_id]
+                target = h.rng.choice([m for m in data['members'] if m != data['creator_id']])
+                return h.kick(channel_id, target)
+        idle = [m for m in h.guild.members.values() if m.id not in app.state.user_participation]
+        return h.join(h.rng.choice(idle) if idle else h.new_member())
+
+    return h, [pick_op for _ in range(args.ops)]
+
+
+async def scenario_offline(args):
+    h = Harness(args.seed)
+    await h.setup()
+    for _ in range(args.users):
+        await h.join(h.new_member())
+    participants = list(app.state.user_participation)
+    gone = h.rng.sample(participants, int(len(participants) * args.offline_fraction))
+    for user_id in gone:
+        await h.go_offline(h.guild.get_member(user_id))
+    stale = datetime.now() - timedelta(minutes=11)
+    for user_id in gone:
+        app.state.last_online_time[user_id] = stale
+    # One sweep removes every stale member; time it as a single operation
+    # and report per-member figures through ops_override
+    h.ops_override = len(gone)
+    return h, [h.offline_sweep]
+
+
+async def scenario_embed(args):
+    h = Harness(args.seed)
+    await h.setup()
+    for _ in range(args.users):
+        await h.join(h.new_member())
+    channel_ids = list(app.state.active_channels)
+
+    async def refresh():
+        # The refresh itself runs in the background; run_ops drains it
+        app.update_party_embed(h.rng.choice(channel_ids))
+    return h, [refresh for _ in range(args.ops)]
+
+
+async def scenario_matchmaking(args):
+    # Everyone queues, then one matchmaking batch places them all
+    h = Harness(args.seed)
+    await h.setup()
+    app.CONFIG["MATCHMAKING_MODE"] = True
+    try:
+        for _ in range(args.users):
+            await h.join(h.new_member())
+    finally:
+        app.CONFIG["MATCHMAKING_MODE"] = False
+    h.ops_override = args.users
+    return h, [app.match_queued_players]
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "join": scenario_join,
+    "churn": scenario_churn,
+    "offline": scenario_offline,
+    "embed": scenario_embed,
+    "matchmaking": scenario_matchmaking,
+}
+
+
+# ---------------------------------------------------------------- runner
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_ops(ops) -> List[float]:
+    latencies = []
+    for op in ops:
+        started = time.perf_counter()
+        await op()
+        # Apply the batched permission edits, background DMs, notices and refreshes the op queued
+        await app.permission_batcher.flush_all()
+        await app.dm_notifier.drain()
+        await app.side_effects.drain()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def run_scenario(name: str, args) -> dict:
+    harness, ops = await SCENARIOS[name](args)
+    await app.permission_batcher.flush_all()
+    await app.side_effects.drain()
+    harness.rest.reset()
+    started = time.perf_counter()
+    latencies = await run_ops(ops)
+    elapsed = time.perf_counter() - started
+    op_count = getattr(harness, "ops_override", len(ops))
+    rest_calls = harness.rest.total
+    routes = dict(harness.rest.calls.most_common())
+
+    # Separate pass for memory so tracing overhead doesn't skew latency
+    tracemalloc.start()
+    harness, ops = await SCENARIOS[name](args)
+    await app.permission_batcher.flush_all()
+    await app.side_effects.drain()
+    tracemalloc.reset_peak()
+    await run_ops(ops)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "ops": op_count,
+        "seconds": elapsed,
+        "ops_per_sec": op_count / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rest_per_op": rest_calls / op_count if op_count else 0.0,
+        "rest_routes": routes,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def print_report(results: List[dict]):
+    header = f"{'scenario':<10}{'ops':>8}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'REST/op':>10}{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<10}{r['ops']:>8}{r['ops_per_sec']:>12.1f}{r['p50_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['rest_per_op']:>10.2f}{r['peak_mb']:>10.1f}")
+    for r in results:
+        routes = ", ".join(f"{route}={count}" for route, count in r['rest_routes'].items())
+        print(f"  {r['scenario']}: {routes}")
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        base = baseline.get(r['scenario'])
+        if not base:
+            continue
+        if r['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: throughput {base['ops_per_sec']:.1f} -> {r['ops_per_sec']:.1f} ops/s")
+        if r['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p99 {base['p99_ms']:.3f} -> {r['p99_ms']:.3f} ms")
+        if r['rest_per_op'] > base['rest_per_op'] + 1e-9:
+            regressions.append(f"{r['scenario']}: REST/op {base['rest_per_op']:.2f} -> {r['rest_per_op']:.2f}")
+        if r['peak_mb'] > base['peak_mb'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: peak {base['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB")
+    return regressions
+
+
+async def main(args) -> int:
+    names = args.scenarios or list(SCENARIOS)
+    with tempfile.TemporaryDirectory(prefix="bench-") as data_dir:
+        app.CONFIG["DATA_DIR"] = data_dir  # keep benchmark parties out of the bot's data/
+        results = [await run_scenario(name, args) for name in names]
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark party-finder handlers against fake Discord objects")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--users", type=int, default=5000, help="users joining / preloaded into parties")
+    parser.add_argument("--ops", type=int, default=2000, help="operations for churn and embed scenarios")
+    parser.add_argument("--offline-fraction", type=float, default=0.5, help="share of party members going offline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.WARNING)
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,307 @@
+"""Fake Discord objects for exercising app.py handlers without a live guild.
+
+Every method that would hit the Discord REST API records the call on a shared
+RestCounter instead, so benchmarks and replays can report REST calls per
+operation. Only the surface app.py actually touches is implemented.
+"""
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import discord
+
+
+class RestCounter:
+    def __init__(self):
+        self.calls: Counter = Counter()
+
+    def hit(self, route: str):
+        self.calls[route] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+
+def _http_error(cls, status: int, reason: str, message: str):
+    return cls(SimpleNamespace(status=status, reason=reason), message)
+
+
+class FakeIds:
+    # Snowflake-ish ids; replay preloads channel ids so recorded party channels line up
+    def __init__(self, start: int = 10_000_000):
+        self._counter = itertools.count(start)
+        self.preloaded_channels: List[int] = []
+
+    def next(self) -> int:
+        return next(self._counter)
+
+    def next_channel(self) -> int:
+        if self.preloaded_channels:
+            return self.preloaded_channels.pop(0)
+        return self.next()
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str = "@everyone"):
+        self.id = role_id
+        self.name = name
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, rest: RestCounter, dm_closed: bool = False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.global_name = name
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+        self.status = discord.Status.online
+        self.dm_closed = dm_closed
+        self._rest = rest
+
+    async def send(self, content=None, **kwargs):
+        self._rest.hit("dm")
+        if self.dm_closed:
+            raise _http_error(discord.Forbidden, 403, "Forbidden", "Cannot send messages to this user")
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id: int, name: str, guild: "FakeGuild", dm_closed: bool = False):
+        super().__init__(user_id, name, guild.rest, dm_closed)
+        self.guild = guild
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, channel: "FakeChannel", author, content=None, embeds=None, view=None):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds: List[discord.Embed] = embeds or []
+        self.view = view
+        self.pinned = False
+        self.guild = channel.guild
+
+    async def edit(self, *, content=None, embed=None, embeds=None, view=None, **kwargs):
+        self.channel.guild.rest.hit("message.edit")
+        if embed is not None:
+            self.embeds = [embed]
+        elif embeds is not None:
+            self.embeds = list(embeds)
+        if content is not None:
+            self.content = content
+        if view is not None:
+            self.view = view
+        return self
+
+    async def pin(self, **kwargs):
+        self.channel.guild.rest.hit("message.pin")
+        self.pinned = True
+
+    async def delete(self, **kwargs):
+        self.channel.guild.rest.hit("message.delete")
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, name: str, guild: "FakeGuild", category=None, overwrites=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.category_id = category.id if category else None
+        self.mention = f"<#{channel_id}>"
+        self.overwrites: Dict[object, discord.PermissionOverwrite] = dict(overwrites or {})
+        self.messages: Dict[int, FakeMessage] = {}
+        self.deleted = False
+
+    async def send(self, content=None, *, embed=None, embeds=None, view=None, **kwargs):
+        self.guild.rest.hit("channel.send")
+        if embed is not None:
+            embeds = [embed]
+        message = FakeMessage(self.guild.ids.next(), self, self.guild.me, content, embeds, view)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int):
+        self.guild.rest.hit("channel.fetch_message")
+        message = self.messages.get(message_id)
+        if message is None:
+            raise _http_error(discord.NotFound, 404, "Not Found", "Unknown Message")
+        return message
+
+    async def history(self, limit: Optional[int] = 100, **kwargs):
+        self.guild.rest.hit("channel.history")
+        messages = sorted(self.messages.values(), key=lambda m: m.id, reverse=True)
+        for message in messages[:limit] if limit else messages:
+            yield message
+
+    async def set_permissions(self, target, *, overwrite=None, **permissions):
+        self.guild.rest.hit("channel.set_permissions")
+        self.overwrites[target] = overwrite or discord.PermissionOverwrite(**permissions)
+
+    async def edit(self, *, overwrites=None, **kwargs):
+        self.guild.rest.hit("channel.edit")
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+        return self
+
+    async def delete(self, **kwargs):
+        self.guild.rest.hit("channel.delete")
+        self.deleted = True
+        self.guild.channels.pop(self.id, None)
+        if self.category:
+            self.category.channels.remove(self)
+
+
+CATEGORY_CHANNEL_LIMIT = 50
+
+
+class FakeCategory:
+    def __init__(self, category_id: int, name: str, guild: "FakeGuild"):
+        self.id = category_id
+        self.name = name
+        self.guild = guild
+        self.channels: List[FakeChannel] = []
+
+    async def create_text_channel(self, name: str, *, overwrites=None, **kwargs):
+        self.guild.rest.hit("category.create_text_channel")
+        if len(self.channels) >= CATEGORY_CHANNEL_LIMIT:
+            raise _http_error(discord.HTTPException, 400, "Bad Request",
+                              "Maximum number of channels in category reached (50)")
+        channel = FakeChannel(self.guild.ids.next_channel(), name, self.guild, self, overwrites)
+        self.channels.append(channel)
+        self.guild.channels[channel.id] = channel
+        return channel
+
+    async def delete(self, **kwargs):
+        self.guild.rest.hit("channel.delete")
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1, rest: Optional[RestCounter] = None, ids: Optional[FakeIds] = None):
+        self.id = guild_id
+        self.rest = rest or RestCounter()
+        self.ids = ids or FakeIds()
+        self.default_role = FakeRole(guild_id)
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, object] = {}
+        self.me = FakeUser(self.ids.next(), "WormBot", self.rest)
+        self.me.bot = True
+
+    def add_member(self, user_id: int, name: Optional[str] = None, dm_closed: bool = False) -> FakeMember:
+        member = FakeMember(user_id, name or f"user{user_id}", self, dm_closed)
+        self.members[user_id] = member
+        return member
+
+    def add_category(self, category_id: Optional[int] = None, name: str = "Worm Parties") -> FakeCategory:
+        category = FakeCategory(category_id or self.ids.next(), name, self)
+        self.channels[category.id] = category
+        return category
+
+    def add_text_channel(self, channel_id: Optional[int] = None, name: str = "party-finder") -> FakeChannel:
+        channel = FakeChannel(channel_id or self.ids.next(), name, self)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def create_category(self, name: str, **kwargs) -> FakeCategory:
+        self.rest.hit("guild.create_category")
+        return self.add_category(name=name)
+
+    async def fetch_member(self, user_id: int) -> FakeMember:
+        self.rest.hit("guild.fetch_member")
+        member = self.members.get(user_id)
+        if member is None:
+            raise _http_error(discord.NotFound, 404, "Not Found", "Unknown Member")
+        return member
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+
+class FakeResponse:
+    def __init__(self, rest: RestCounter):
+        self._rest = rest
+        self._done = False
+        self.sent: List[dict] = []
+        self.modal = None
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _respond(self, route: str):
+        if self._done:
+            raise discord.InteractionResponded(None)
+        self._rest.hit(route)
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._respond("interaction.send_message")
+        self.sent.append(dict(kwargs, content=content))
+
+    async def defer(self, **kwargs):
+        self._respond("interaction.defer")
+
+    async def send_modal(self, modal):
+        self._respond("interaction.send_modal")
+        self.modal = modal
+
+    async def edit_message(self, **kwargs):
+        self._respond("interaction.edit_message")
+
+
+class FakeFollowup:
+    def __init__(self, rest: RestCounter):
+        self._rest = rest
+        self.sent: List[dict] = []
+
+    async def send(self, content=None, **kwargs):
+        self._rest.hit("interaction.followup")
+        self.sent.append(dict(kwargs, content=content))
+
+
+class FakeInteraction:
+    def __init__(self, user, guild: FakeGuild, data: Optional[dict] = None,
+                 type: discord.InteractionType = discord.InteractionType.component, channel=None):
+        self.id = guild.ids.next()
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id if channel else None
+        self.data = data or {}
+        self.type = type
+        self.response = FakeResponse(guild.rest)
+        self.followup = FakeFollowup(guild.rest)
+        self.created_at = None
+
+
+def install(app, guild: FakeGuild, lobby: FakeChannel, category: FakeCategory):
+    # Point the module-level bot and CONFIG at the fake guild
+    app.bot.get_channel = guild.get_channel
+    app.bot.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+    app.bot.get_user = guild.get_member
+    app.bot._connection.user = guild.me
+    app.CONFIG["TARGET_CATEGORY_ID"] = category.id
+    app.CONFIG["YOUR_CHANNEL_ID"] = lobby.id
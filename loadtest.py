@@ -0,0 +1,347 @@
+"""End-to-end load test against the local mock Discord (mockdiscord.py).
+
+Starts the mock gateway/REST server, launches app.py in a subprocess pointed
+at it, then drives thousands of concurrent join/leave interactions and a
+presence storm through the real discord.py stack. Reports end-to-end ack
+latency, the REST call mix and 429 behaviour. Nothing leaves 127.0.0.1.
+
+    python loadtest.py --users 2000 --concurrency 200 --presence 20000
+    python loadtest.py --rate-limit 0          # disable simulated rate limits
+    python loadtest.py --large-guild --profiles full,lean
+    python loadtest.py --presence 50000 --runtimes default,performance
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from mockdiscord import (
+    CATEGORY_ID, FIRST_USER_ID, LOBBY_CHANNEL_ID, MACRO_CHANNEL_ID, OWNER_ID, MockDiscord, point_bot_at,
+)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Driver:
+    def __init__(self, mock: MockDiscord, args):
+        self.mock = mock
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped_leaves = 0  # the user had no party with controls to leave, e.g. its join never finished
+        self.presence_send_seconds = 0.0
+
+    async def _await_ack(self, future) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(future, self.args.ack_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+    async def join(self, user_id: int):
+        # Done once the bot has answered, not when it has deferred: a returning player's
+        # join and every modal submit are deferred while the party channel is set up
+        _, response = await self.mock.interact(
+            user_id, {"custom_id": "initial_join_button", "component_type": 2},
+            message_id=self.mock.lobby_message_id,
+        )
+        body = await self._await_ack(response)
+        if not body or body.get("type") != 9:
+            return  # joined in one interaction, cooldown, or already in a party
+        # Users take a moment to type; discord.py only registers the modal once its
+        # callback request returns, so an instant submit would race it
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_time)
+        modal = body["data"]
+        text_input = modal["components"][0]["components"][0]
+        submit = {
+            "custom_id": modal["custom_id"],
+            "components": [{"type": 1, "components": [
+                {"type": 4, "custom_id": text_input["custom_id"], "value": f"ign{user_id}"[:16]},
+            ]}],
+        }
+        _, response = await self.mock.interact(user_id, submit, type=5)
+        await self._await_ack(response)
+
+    async def leave(self, user_id: int):
+        # A member sees the party channel once the bot's batched permission edit lands
+        deadline = time.monotonic() + self.args.ack_timeout
+        while (channel_id := self.mock.party_of(user_id)) is None or channel_id not in self.mock.party_message:
+            if time.monotonic() > deadline:
+                self.skipped_leaves += 1
+                return
+            await asyncio.sleep(0.05)
+        _, response = await self.mock.interact(
+            user_id, {"custom_id": f"leave_party_{channel_id}", "component_type": 2},
+            message_id=self.mock.party_message[channel_id], channel_id=channel_id,
+        )
+        await self._await_ack(response)
+
+    async def run_concurrently(self, coros):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def bounded(coro):
+            async with semaphore:
+                try:
+                    await coro
+                except Exception:
+                    self.errors += 1
+
+        await asyncio.gather(*(bounded(coro) for coro in coros))
+
+    async def presence_storm(self, count: int) -> float:
+        users = self.mock.user_ids
+        started = time.perf_counter()
+        for i in range(count):
+            await self.mock.send_presence(self.rng.choice(users), self.rng.choice(("online", "idle", "dnd")))
+            if i % 500 == 0:
+                await asyncio.sleep(0)
+        self.presence_send_seconds = time.perf_counter() - started
+        # A trailing interaction only gets acked once the bot has worked through the backlog
+        probe = await self.mock.send_interaction(OWNER_ID, {"custom_id": "third_party_mods", "component_type": 2})
+        await self._await_ack(probe)
+        return time.perf_counter() - started
+
+
+def start_bot(base_url: str, profile: str, runtime: str, report_file: str, data_dir: str, args) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "--run-bot", base_url,
+               "--profile", profile, "--runtime", runtime, "--report-file", report_file, "--data-dir", data_dir,
+               "--users", str(args.users), "--returning-fraction", str(args.returning_fraction)]
+    if args.record:
+        command += ["--record", data_dir]
+    # app.py builds its Bot at import, so the lean member cache is chosen through the environment
+    env = dict(os.environ, LEAN_MEMBER_CACHE="1" if profile == "lean" else "0")
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def run_bot(base_url: str, args):
+    point_bot_at(base_url)
+    if args.runtime == "default":
+        # Measure the default profile as a plain install would run it: discord.py
+        # switches to orjson on its own whenever it is importable
+        import discord.utils
+        discord.utils._from_json = json.loads
+        discord.utils._to_json = lambda obj: json.dumps(obj, separators=(",", ":"), ensure_ascii=True)
+        discord.utils.HAS_ORJSON = False
+
+    import app
+    app.CONFIG.update(
+        TARGET_CATEGORY_ID=CATEGORY_ID,
+        YOUR_CHANNEL_ID=LOBBY_CHANNEL_ID,
+        AUTHORIZED_USER_ID=OWNER_ID,
+        MACRO_CHECKS_CHANNEL_ID=MACRO_CHANNEL_ID,
+        DATA_DIR=args.data_dir,  # mock ids must not end up in the real data/ (party log, command tree, logs)
+        EVENT_RECORDING=bool(args.record),
+        IGN_RESOLVER="stub",
+        PERFORMANCE_PROFILE=args.runtime == "performance",
+    )
+    # Returning players have an IGN on file, so the lobby button joins them without the modal
+    app.ign_memory = app.IgnMemory(filename=None)
+    app.state_snapshot = app.StateSnapshot(filename=None)  # mock channel ids repeat across runs
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + int(args.users * args.returning_fraction)):
+        app.ign_memory.remember(user_id, f"ign{user_id}"[:16])
+
+    async def write_reports():
+        # The driver reads the last report after the run; the bot is terminated, not shut down
+        while True:
+            # Written aside and renamed, the driver may terminate the bot mid-write
+            with open(args.report_file + ".tmp", "w") as f:
+                json.dump(dict(app.member_cache.report(), runtime=app.runtime_report), f)
+            os.replace(args.report_file + ".tmp", args.report_file)
+            await asyncio.sleep(1)
+
+    @app.bot.listen("on_ready")
+    async def start_reporting():
+        if not getattr(app.bot, "_loadtest_reporting", False):
+            app.bot._loadtest_reporting = True
+            asyncio.create_task(write_reports())
+
+    app.run_bot("mock-token")
+
+
+async def wait_for(predicate, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"timed out waiting for {what}")
+        await asyncio.sleep(0.05)
+
+
+def report(mock: MockDiscord, driver: Driver, phases: dict) -> dict:
+    latencies = mock.ack_latencies
+    result = {
+        "phases": phases,
+        "interactions_acked": len(latencies),
+        "ack_timeouts": driver.timeouts,
+        "driver_errors": driver.errors,
+        "skipped_leaves": driver.skipped_leaves,
+        "failed": driver.timeouts + driver.errors + driver.skipped_leaves,
+        "ack_p50_ms": percentile(latencies, 50) * 1000,
+        "ack_p90_ms": percentile(latencies, 90) * 1000,
+        "ack_p99_ms": percentile(latencies, 99) * 1000,
+        "ack_max_ms": max(latencies, default=0.0) * 1000,
+        "rest_calls": dict(mock.rest_calls.most_common()),
+        "rest_429s": dict(mock.rest_429s.most_common()),
+        "unhandled_routes": dict(mock.unhandled),
+        "gateway_events": dict(mock.gateway_events.most_common()),
+    }
+
+    print(f"\nInteractions acked: {result['interactions_acked']}  failed operations: {result['failed']} "
+          f"(unanswered: {driver.timeouts}, driver errors: {driver.errors}, leaves without a party: {driver.skipped_leaves})")
+    print(f"Ack latency ms  p50={result['ack_p50_ms']:.1f}  p90={result['ack_p90_ms']:.1f}  "
+          f"p99={result['ack_p99_ms']:.1f}  max={result['ack_max_ms']:.1f}")
+    for name, seconds in phases.items():
+        print(f"Phase {name:<10} {seconds:8.2f}s")
+    total = sum(mock.rest_calls.values())
+    print(f"\nREST calls ({total} total, {sum(mock.rest_429s.values())} answered with 429):")
+    for route, count in mock.rest_calls.most_common():
+        limited = mock.rest_429s.get(route, 0)
+        print(f"  {count:>7}  {route}" + (f"   [{limited} x 429]" if limited else ""))
+    if mock.unhandled:
+        print("Unhandled routes:", ", ".join(mock.unhandled))
+    return result
+
+
+async def run_profile(profile: str, runtime: str, args) -> dict:
+    mock = MockDiscord(members=args.users, rate_limit=args.rate_limit, rate_window=args.rate_window,
+                       global_limit=args.global_limit, dm_closed_every=args.dm_closed_every,
+                       large_guild=args.large_guild)
+    base_url = await mock.start()
+    report_file = os.path.join(tempfile.gettempdir(), f"loadtest-bot-{os.getpid()}-{profile}-{runtime}.json")
+    if args.record:
+        # Kept after the run: DIR/<profile>-<runtime>/events.jsonl feeds replay.py
+        data_dir = os.path.join(os.path.abspath(args.record), f"{profile}-{runtime}")
+        temp_dir = None
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix="loadtest-")
+        data_dir = temp_dir.name
+    bot = start_bot(base_url, profile, runtime, report_file, data_dir, args)
+    driver = Driver(mock, args)
+    phases = {}
+    try:
+        started = time.perf_counter()
+        await wait_for(lambda: mock.lobby_message_id is not None, args.startup_timeout, "bot startup")
+        phases["startup"] = time.perf_counter() - started
+
+        # In a large guild most members never join a party; they still generate presence traffic
+        users = driver.rng.sample(mock.user_ids, int(len(mock.user_ids) * args.join_fraction))
+        started = time.perf_counter()
+        await driver.run_concurrently(driver.join(user_id) for user_id in users)
+        phases["join"] = time.perf_counter() - started
+
+        if args.presence:
+            phases["presence"] = await driver.presence_storm(args.presence)
+
+        leavers = driver.rng.sample(users, int(len(users) * args.leave_fraction))
+        started = time.perf_counter()
+        await driver.run_concurrently(driver.leave(user_id) for user_id in leavers)
+        phases["leave"] = time.perf_counter() - started
+        await asyncio.sleep(1.5)  # let the bot write a final report
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await mock.stop()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print(f"\n=== profile: {profile}, runtime: {runtime} ===")
+    result = report(mock, driver, phases)
+    try:
+        with open(report_file) as f:
+            result["bot"] = json.load(f)
+        os.remove(report_file)
+    except (OSError, ValueError):
+        result["bot"] = {}
+    bot_report = result["bot"]
+    if bot_report:
+        print(f"Bot: {bot_report['mode']} member cache, ready after {bot_report['startup_seconds']:.2f}s, "
+              f"{bot_report['rss_mb']:.1f} MB resident, {bot_report['cached_members']} members cached, "
+              f"{bot_report['presences_dropped']} presence updates dropped")
+        print("Runtime: " + ", ".join(f"{key}={value}" for key, value in bot_report.get("runtime", {}).items()))
+    if phases.get("presence"):
+        result["presence_per_second"] = args.presence / phases["presence"]
+        print(f"Presence updates handled: {result['presence_per_second']:.0f}/s "
+              f"(the mock finished sending after {driver.presence_send_seconds:.2f}s)")
+    return result
+
+
+def compare_profiles(results: dict):
+    print("\n=== profile comparison ===")
+    print(f"{'profile':<20}{'ready s':>9}{'RSS MB':>9}{'members':>9}{'ack p50':>9}{'ack p99':>9}"
+          f"{'presence s':>12}{'presence/s':>12}")
+    for profile, result in results.items():
+        bot_report = result.get("bot") or {}
+        print(f"{profile:<20}{bot_report.get('startup_seconds') or 0:>9.2f}{bot_report.get('rss_mb', 0):>9.1f}"
+              f"{bot_report.get('cached_members', 0):>9}{result['ack_p50_ms']:>9.1f}{result['ack_p99_ms']:>9.1f}"
+              f"{result['phases'].get('presence', 0):>12.2f}{result.get('presence_per_second', 0):>12.0f}")
+
+
+async def main(args) -> int:
+    results = {}
+    runtimes = args.runtimes.split(",")
+    for profile in args.profiles.split(","):
+        for runtime in runtimes:
+            key = profile if len(runtimes) == 1 else f"{profile}/{runtime}"
+            results[key] = await run_profile(profile, runtime, args)
+    if len(results) > 1:
+        compare_profiles(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result["failed"] for result in results.values()) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test app.py against a local mock Discord")
+    parser.add_argument("--users", type=int, default=1000, help="guild members that each try to join")
+    parser.add_argument("--concurrency", type=int, default=100, help="interactions in flight at once")
+    parser.add_argument("--presence", type=int, default=5000, help="presence updates to dispatch")
+    parser.add_argument("--leave-fraction", type=float, default=0.3)
+    parser.add_argument("--rate-limit", type=int, default=5, help="requests per bucket window, 0 to disable")
+    parser.add_argument("--rate-window", type=float, default=5.0)
+    parser.add_argument("--global-limit", type=int, default=50, help="global requests per second, 0 to disable")
+    parser.add_argument("--dm-closed-every", type=int, default=7, help="every Nth user has DMs closed")
+    parser.add_argument("--large-guild", action="store_true", help="ship a partial member list and force chunking")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between modal open and submit")
+    parser.add_argument("--ack-timeout", type=float, default=30.0,
+                        help="seconds to wait for the bot's answer, including the followup of a deferred one")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--record", metavar="DIR",
+                        help="keep the bot's data directory in DIR/<profile>-<runtime>, with an events.jsonl for replay.py")
+    parser.add_argument("--returning-fraction", type=float, default=0.0,
+                        help="fraction of members with a remembered IGN, who join in one interaction")
+    parser.add_argument("--join-fraction", type=float, default=1.0,
+                        help="fraction of guild members that join a party")
+    parser.add_argument("--profiles", default="full", help="comma-separated bot profiles to run: full, lean")
+    parser.add_argument("--runtimes", default="default",
+                        help="comma-separated runtime profiles to run: default, performance (uvloop, orjson, tuned pool)")
+    parser.add_argument("--run-bot", metavar="BASE_URL", help=argparse.SUPPRESS)
+    parser.add_argument("--runtime", default="default", help=argparse.SUPPRESS)
+    parser.add_argument("--profile", default="full", help=argparse.SUPPRESS)
+    parser.add_argument("--report-file", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.run_bot:
+        run_bot(args.run_bot, args)
+    else:
+        sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,577 @@
+"""Local stand-in for the Discord gateway and REST API.
+
+Serves just enough of the v10 REST routes and gateway protocol for app.py to
+log in, receive its guild, answer component/modal interactions and manage
+party channels, all on 127.0.0.1. Per-route rate limit buckets return real
+429 responses (with the headers discord.py's HTTP client reads) so its
+ratelimit handling is exercised as well. Used by loadtest.py.
+"""
+import asyncio
+import json
+import re
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+GUILD_ID = 1_000
+CATEGORY_ID = 1_001
+DISCORD_EPOCH_MS = 1_420_070_400_000
+LOBBY_CHANNEL_ID = 1_002
+MACRO_CHANNEL_ID = 1_003
+BOT_USER_ID = 999
+APPLICATION_ID = 998
+OWNER_ID = 2_000
+FIRST_USER_ID = 2_001
+
+
+def point_bot_at(base_url: str):
+    # Redirect discord.py's REST client and gateway connection to the mock
+    import discord.gateway
+    import discord.http
+    import yarl
+    discord.http.Route.BASE = f"{base_url}/api/v10"
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(base_url.replace("http", "ws", 1) + "/gateway")
+
+
+def json_response(data, status: int = 200, headers: Optional[dict] = None) -> web.Response:
+    # discord.py only decodes bodies whose content-type is exactly application/json,
+    # so aiohttp's json_response (which appends a charset) can't be used
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={"Content-Type": "application/json", **(headers or {})})
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+_ID_SEGMENT = re.compile(r"/\d+")
+_TOKEN_ROUTE = re.compile(r"/(interactions|webhooks)/\{id\}/[^/]+")
+
+
+def route_template(method: str, path: str) -> str:
+    path = path.split("/api/v10", 1)[-1]
+    path = _ID_SEGMENT.sub("/{id}", path)
+    path = _TOKEN_ROUTE.sub(r"/\1/{id}/{token}", path)
+    return f"{method} {path}"
+
+
+def major_parameter(path: str) -> str:
+    # Webhook routes are scoped by id and token, so every interaction's followups get their own bucket
+    match = re.search(r"/webhooks/(\d+)/([^/]+)", path)
+    if match:
+        return f"{match.group(1)}/{match.group(2)}"
+    match = re.search(r"/(channels|guilds|webhooks|interactions)/(\d+)", path)
+    return match.group(2) if match else ""
+
+
+class RateLimiter:
+    # Fixed-window buckets keyed by route template + major parameter, plus a global cap
+    def __init__(self, limit: int, window: float, global_limit: int):
+        self.limit = limit
+        self.window = window
+        self.global_limit = global_limit
+        self._buckets: Dict[str, List[float]] = {}
+        self._global = [0.0, 0]
+
+    def check(self, route: str, major: str):
+        now = time.monotonic()
+        if self.global_limit:
+            started, count = self._global
+            if now - started >= 1.0:
+                self._global = [now, 0]
+            if self._global[1] >= self.global_limit:
+                return False, 1.0 - (now - self._global[0]), True, 0
+            self._global[1] += 1
+
+        if not self.limit:
+            return True, self.window, False, 1
+        key = f"{route}:{major}"
+        bucket = self._buckets.get(key)
+        if bucket is None or now - bucket[0] >= self.window:
+            bucket = self._buckets[key] = [now, 0]
+        reset_after = self.window - (now - bucket[0])
+        if bucket[1] >= self.limit:
+            return False, reset_after, False, 0
+        bucket[1] += 1
+        return True, reset_after, False, self.limit - bucket[1]
+
+
+class MockDiscord:
+    def __init__(self, members: int = 1000, rate_limit: int = 5, rate_window: float = 5.0,
+                 global_limit: int = 50, dm_closed_every: int = 0, large_guild: bool = False):
+        self.member_count = members
+        self.large_guild = large_guild
+        self.dm_closed_every = dm_closed_every
+        self.limiter = RateLimiter(rate_limit, rate_window, global_limit)
+
+        self._next_id = 10_000_000
+        self.users: Dict[int, dict] = {}
+        self.channels: Dict[int, dict] = {}
+        self.messages: Dict[int, Dict[int, dict]] = defaultdict(dict)
+        self.dm_channels: Dict[int, int] = {}
+
+        # Stats
+        self.rest_calls: Counter = Counter()
+        self.rest_429s: Counter = Counter()
+        self.unhandled: Counter = Counter()
+        self.gateway_events: Counter = Counter()
+
+        # Interaction bookkeeping: id -> (dispatched_at, future resolved with the callback body)
+        self.pending_interactions: Dict[int, tuple] = {}
+        # token -> future resolved with the final response: the callback body, or for a
+        # deferred callback the first followup or edit of the original response
+        self.pending_responses: Dict[str, "asyncio.Future"] = {}
+        self.ack_latencies: List[float] = []
+
+        # Party tracking derived from REST traffic, for the driver
+        self.party_message: Dict[int, int] = {}  # {channel_id: message_id with party controls}
+        self.lobby_message_id: Optional[int] = None
+
+        self._ws: Optional[web.WebSocketResponse] = None
+        self._compressor = None
+        self._presence_bodies: Dict[tuple, str] = {}
+        self._seq = 0
+        self.ready = asyncio.Event()
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+        self._seed()
+
+    # ------------------------------------------------------------ payloads
+
+    def new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _seed(self):
+        self.users[BOT_USER_ID] = self.user_payload(BOT_USER_ID, "WormBot", bot=True)
+        self.users[OWNER_ID] = self.user_payload(OWNER_ID, "owner")
+        for user_id in range(FIRST_USER_ID, FIRST_USER_ID + self.member_count):
+            self.users[user_id] = self.user_payload(user_id, f"user{user_id}")
+        self.channels[CATEGORY_ID] = self.channel_payload(CATEGORY_ID, "Worm Parties", type=4)
+        self.channels[LOBBY_CHANNEL_ID] = self.channel_payload(LOBBY_CHANNEL_ID, "party-finder")
+        self.channels[MACRO_CHANNEL_ID] = self.channel_payload(MACRO_CHANNEL_ID, "macro-checks")
+
+    @property
+    def user_ids(self) -> List[int]:
+        return list(range(FIRST_USER_ID, FIRST_USER_ID + self.member_count))
+
+    @staticmethod
+    def user_payload(user_id: int, name: str, bot: bool = False) -> dict:
+        return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": name,
+                "avatar": None, "bot": bot}
+
+    def member_payload(self, user_id: int) -> dict:
+        return {"user": self.users[user_id], "roles": [], "joined_at": _now_iso(), "deaf": False,
+                "mute": False, "flags": 0, "permissions": "0"}
+
+    @staticmethod
+    def channel_payload(channel_id: int, name: str, type: int = 0, parent_id=None, overwrites=None) -> dict:
+        return {"id": str(channel_id), "type": type, "guild_id": str(GUILD_ID), "name": name,
+                "position": 0, "permission_overwrites": overwrites or [], "parent_id": parent_id,
+                "nsfw": False, "topic": None, "last_message_id": None, "rate_limit_per_user": 0}
+
+    def message_payload(self, channel_id: int, body: dict, author_id: int = BOT_USER_ID) -> dict:
+        return {"id": str(self.new_id()), "channel_id": str(channel_id), "guild_id": str(GUILD_ID),
+                "author": self.users[author_id], "content": body.get("content") or "",
+                "timestamp": _now_iso(), "edited_timestamp": None, "tts": False, "mention_everyone": False,
+                "mentions": [], "mention_roles": [], "attachments": [], "embeds": body.get("embeds") or [],
+                "components": body.get("components") or [], "pinned": False, "type": 0, "flags": 0}
+
+    def guild_payload(self) -> dict:
+        member_ids = [BOT_USER_ID, OWNER_ID] + self.user_ids
+        if self.large_guild:
+            # Large guilds only ship a partial member list; the rest must be chunked
+            members = [self.member_payload(BOT_USER_ID)]
+        else:
+            members = [self.member_payload(user_id) for user_id in member_ids]
+        return {
+            "id": str(GUILD_ID), "name": "Mock Guild", "icon": None, "owner_id": str(OWNER_ID),
+            "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+                       "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+            "channels": [c for c in self.channels.values() if c["type"] in (0, 4)],
+            "members": members,
+            "presences": [{"user": {"id": str(user_id)}, "status": "online", "activities": [],
+                           "client_status": {"desktop": "online"}} for user_id in self.user_ids
+                          if not self.large_guild],
+            "member_count": len(member_ids), "large": self.large_guild, "unavailable": False,
+            "features": [], "emojis": [], "stickers": [], "threads": [], "stage_instances": [],
+            "guild_scheduled_events": [], "voice_states": [], "verification_level": 0,
+            "default_message_notifications": 0, "explicit_content_filter": 0, "mfa_level": 0,
+            "nsfw_level": 0, "premium_tier": 0, "preferred_locale": "en-US", "afk_timeout": 300,
+            "system_channel_flags": 0, "joined_at": _now_iso(),
+        }
+
+    # ------------------------------------------------------------ gateway
+
+    async def dispatch(self, event: str, data: dict):
+        if self._ws is None or self._ws.closed:
+            return
+        self._seq += 1
+        self.gateway_events[event] += 1
+        await self._send({"op": 0, "t": event, "s": self._seq, "d": data})
+
+    async def _send(self, payload: dict):
+        await self._send_raw(json.dumps(payload))
+
+    async def _send_raw(self, raw: str):
+        if self._compressor is not None:
+            data = self._compressor.compress(raw.encode()) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            await self._ws.send_bytes(data)
+        else:
+            await self._ws.send_str(raw)
+
+    async def gateway(self, request: web.Request):
+        ws = web.WebSocketResponse(compress=False, max_msg_size=0)
+        await ws.prepare(request)
+        self._ws = ws
+        self._compressor = zlib.compressobj() if request.query.get("compress") == "zlib-stream" else None
+        await self._send({"op": 10, "d": {"heartbeat_interval": 41250}})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op = payload.get("op")
+            if op == 1:
+                # Ack a beat later: discord.py times heartbeat latency from when its keep-alive
+                # thread finishes sending, which an instant localhost ack can beat
+                asyncio.get_running_loop().call_later(0.005, lambda: asyncio.ensure_future(self._send({"op": 11})))
+            elif op == 2:
+                await self.dispatch("READY", {
+                    "v": 10, "user": self.users[BOT_USER_ID], "guilds": [{"id": str(GUILD_ID), "unavailable": True}],
+                    "session_id": "mock-session", "resume_gateway_url": self.base_url.replace("http", "ws") + "/gateway",
+                    "application": {"id": str(APPLICATION_ID), "flags": 0},
+                })
+                await self.dispatch("GUILD_CREATE", self.guild_payload())
+                self.ready.set()
+            elif op == 8:
+                await self._send_member_chunks(payload["d"])
+        return ws
+
+    async def _send_member_chunks(self, request: dict):
+        member_ids = [BOT_USER_ID, OWNER_ID] + self.user_ids
+        wanted = request.get("user_ids")
+        if wanted:
+            member_ids = [int(user_id) for user_id in wanted if int(user_id) in self.users]
+        chunks = [member_ids[i:i + 1000] for i in range(0, len(member_ids), 1000)] or [[]]
+        for index, chunk in enumerate(chunks):
+            await self.dispatch("GUILD_MEMBERS_CHUNK", {
+                "guild_id": str(GUILD_ID), "members": [self.member_payload(user_id) for user_id in chunk],
+                "chunk_index": index, "chunk_count": len(chunks), "nonce": request.get("nonce"),
+                "presences": [],
+            })
+
+    # ------------------------------------------------------------ driver API
+
+    async def send_interaction(self, user_id: int, data: dict, type: int = 3, message_id: Optional[int] = None,
+                               channel_id: int = LOBBY_CHANNEL_ID) -> "asyncio.Future":
+        ack, _ = await self.interact(user_id, data, type, message_id, channel_id)
+        return ack
+
+    async def interact(self, user_id: int, data: dict, type: int = 3, message_id: Optional[int] = None,
+                       channel_id: int = LOBBY_CHANNEL_ID) -> tuple:
+        # Returns (ack, response) futures; they differ when the bot defers and answers with a followup
+        # A real snowflake, so the bot can tell how old the interaction is
+        interaction_id = (int(time.time() * 1000) - DISCORD_EPOCH_MS) << 22 | self.new_id() % (1 << 22)
+        payload = {
+            "id": str(interaction_id), "application_id": str(APPLICATION_ID), "type": type,
+            "token": f"token{interaction_id}", "version": 1, "guild_id": str(GUILD_ID),
+            "channel_id": str(channel_id), "member": self.member_payload(user_id), "data": data,
+            "locale": "en-US", "guild_locale": "en-US", "app_permissions": "0", "entitlements": [],
+            "authorizing_integration_owners": {}, "context": 0,
+        }
+        if message_id is not None:
+            message = self.messages[channel_id].get(message_id)
+            if message is not None:
+                payload["message"] = message
+        future = asyncio.get_running_loop().create_future()
+        response = asyncio.get_running_loop().create_future()
+        self.pending_interactions[interaction_id] = (time.perf_counter(), future)
+        self.pending_responses[payload["token"]] = response
+        await self.dispatch("INTERACTION_CREATE", payload)
+        return future, response
+
+    def _respond(self, token: str, body: dict):
+        response = self.pending_responses.pop(token, None)
+        if response is not None and not response.done():
+            response.set_result(body)
+
+    async def send_presence(self, user_id: int, status: str):
+        # Presence storms should measure the bot, not this encoder: the payload body is encoded once per user and status
+        key = (user_id, status)
+        body = self._presence_bodies.get(key)
+        if body is None:
+            body = self._presence_bodies[key] = json.dumps({
+                "user": {"id": str(user_id)}, "guild_id": str(GUILD_ID), "status": status,
+                "activities": [], "client_status": {"desktop": status} if status != "offline" else {},
+            })
+        if self._ws is None or self._ws.closed:
+            return
+        self._seq += 1
+        self.gateway_events["PRESENCE_UPDATE"] += 1
+        await self._send_raw(f'{{"op":0,"t":"PRESENCE_UPDATE","s":{self._seq},"d":{body}}}')
+
+    def party_of(self, user_id: int) -> Optional[int]:
+        for channel_id in self.party_message:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                continue
+            for overwrite in channel["permission_overwrites"]:
+                if overwrite["id"] == str(user_id) and int(overwrite.get("allow", 0)) & 1024:
+                    return channel_id
+        return None
+
+    # ------------------------------------------------------------ REST
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path == "/gateway":
+            return await handler(request)
+        route = route_template(request.method, request.path)
+        self.rest_calls[route] += 1
+        if "/interactions/" not in request.path:
+            allowed, reset_after, is_global, remaining = self.limiter.check(route, major_parameter(request.path))
+            headers = {}
+            if self.limiter.limit:
+                # Without bucket headers discord.py just sends; with them it paces pre-emptively
+                headers = {"X-RateLimit-Limit": str(self.limiter.limit), "X-RateLimit-Remaining": str(remaining),
+                           "X-RateLimit-Reset-After": f"{max(reset_after, 0):.3f}",
+                           "X-RateLimit-Bucket": f"{abs(hash(route)):x}"}
+            if not allowed:
+                self.rest_429s[route] += 1
+                headers["Via"] = "1.1 google"
+                if is_global:
+                    headers["X-RateLimit-Global"] = "true"
+                return json_response({"message": "You are being rate limited.",
+                                      "retry_after": max(reset_after, 0.01), "global": is_global},
+                                     status=429, headers=headers)
+            response = await handler(request)
+            response.headers.update(headers)
+            return response
+        return await handler(request)
+
+    async def _json(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "payload_json":
+                    return json.loads(await part.text())
+        return {}
+
+    async def get_gateway(self, request):
+        return json_response({"url": self.base_url.replace("http", "ws") + "/gateway", "shards": 1,
+                                  "session_start_limit": {"total": 1000, "remaining": 1000,
+                                                          "reset_after": 0, "max_concurrency": 1}})
+
+    async def get_me(self, request):
+        return json_response(self.users[BOT_USER_ID])
+
+    async def get_application(self, request):
+        return json_response({"id": str(APPLICATION_ID), "name": "WormBot", "description": "", "icon": None,
+                              "bot_public": False, "bot_require_code_grant": False, "verify_key": "0" * 64,
+                              "owner": self.users[OWNER_ID], "team": None, "flags": 0, "tags": []})
+
+    async def get_user(self, request):
+        user = self.users.get(int(request.match_info["user_id"]))
+        if user is None:
+            return json_response({"message": "Unknown User", "code": 10013}, status=404)
+        return json_response(user)
+
+    async def put_commands(self, request):
+        return json_response([dict(command, id=str(self.new_id()), application_id=str(APPLICATION_ID),
+                                       version="1") for command in await request.json()])
+
+    async def interaction_callback(self, request):
+        interaction_id = int(request.match_info["interaction_id"])
+        body = await self._json(request)
+        pending = self.pending_interactions.pop(interaction_id, None)
+        if pending is not None:
+            dispatched_at, future = pending
+            self.ack_latencies.append(time.perf_counter() - dispatched_at)
+            if not future.done():
+                future.set_result(body)
+        if body.get("type") not in (5, 6):  # deferred callbacks are answered by a followup
+            self._respond(request.match_info["token"], body)
+        return json_response({"interaction": {"id": str(interaction_id), "type": body.get("type", 4)}})
+
+    async def webhook_message(self, request):
+        body = await self._json(request)
+        self._respond(request.match_info["token"], body)
+        return json_response(self.message_payload(LOBBY_CHANNEL_ID, body))
+
+    async def create_message(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        body = await self._json(request)
+        if channel_id in self.dm_channels.values():
+            return json_response(self.message_payload(channel_id, body))
+        if channel_id not in self.channels:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        message = self.message_payload(channel_id, body)
+        self.messages[channel_id][int(message["id"])] = message
+        self._track_controls(channel_id, message)
+        await self.dispatch("MESSAGE_CREATE", message)
+        return json_response(message)
+
+    def _track_controls(self, channel_id: int, message: dict):
+        for row in message.get("components", []):
+            for component in row.get("components", []):
+                custom_id = component.get("custom_id", "")
+                if custom_id == "initial_join_button":
+                    self.lobby_message_id = int(message["id"])
+                elif custom_id.startswith("leave_party_"):
+                    self.party_message[channel_id] = int(message["id"])
+
+    async def get_message(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        message = self.messages[channel_id].get(int(request.match_info["message_id"]))
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        return json_response(message)
+
+    async def edit_message(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        message = self.messages[channel_id].get(int(request.match_info["message_id"]))
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        body = await self._json(request)
+        for key in ("content", "embeds", "components"):
+            if key in body:
+                message[key] = body[key]
+        message["edited_timestamp"] = _now_iso()
+        self._track_controls(channel_id, message)
+        await self.dispatch("MESSAGE_UPDATE", message)
+        return json_response(message)
+
+    async def history(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        limit = int(request.query.get("limit", 50))
+        messages = sorted(self.messages[channel_id].values(), key=lambda m: int(m["id"]), reverse=True)
+        return json_response(messages[:limit])
+
+    async def pin(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        message = self.messages[channel_id].get(int(request.match_info["message_id"]))
+        if message is not None:
+            message["pinned"] = True
+        return web.Response(status=204)
+
+    async def create_channel(self, request):
+        body = await request.json()
+        parent_id = str(body["parent_id"]) if body.get("parent_id") else None
+        if parent_id and sum(1 for c in self.channels.values() if c["parent_id"] == parent_id) >= 50:
+            return json_response({"message": "Invalid Form Body", "code": 50035, "errors": {"parent_id": {
+                "_errors": [{"code": "CHANNEL_PARENT_MAX_CHANNELS", "message": "Maximum number of channels in category reached (50)"}]
+            }}}, status=400)
+        channel_id = self.new_id()
+        channel = self.channel_payload(channel_id, body["name"], body.get("type", 0), parent_id,
+                                       self.overwrite_payloads(body.get("permission_overwrites")))
+        self.channels[channel_id] = channel
+        await self.dispatch("CHANNEL_CREATE", channel)
+        return json_response(channel)
+
+    @staticmethod
+    def overwrite_payloads(overwrites) -> list:
+        # discord.py sends ids and bitsets as ints; Discord stores and returns strings
+        return [{"id": str(o["id"]), "type": o.get("type", 1), "allow": str(o.get("allow", 0)),
+                 "deny": str(o.get("deny", 0))} for o in overwrites or []]
+
+    async def edit_channel(self, request):
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        body = await request.json()
+        if "permission_overwrites" in body:
+            body["permission_overwrites"] = self.overwrite_payloads(body["permission_overwrites"])
+        channel.update({key: value for key, value in body.items() if key in channel})
+        await self.dispatch("CHANNEL_UPDATE", channel)
+        return json_response(channel)
+
+    async def put_permission(self, request):
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        body = await request.json()
+        target = request.match_info["target"]
+        overwrites = [o for o in channel["permission_overwrites"] if o["id"] != target]
+        overwrites.append({"id": target, "type": body.get("type", 1), "allow": str(body.get("allow", 0)),
+                           "deny": str(body.get("deny", 0))})
+        channel["permission_overwrites"] = overwrites
+        await self.dispatch("CHANNEL_UPDATE", channel)
+        return web.Response(status=204)
+
+    async def delete_channel(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        channel = self.channels.pop(channel_id, None)
+        if channel is None:
+            return json_response({"message": "Unknown Channel", "code": 10003}, status=404)
+        self.messages.pop(channel_id, None)
+        self.party_message.pop(channel_id, None)
+        await self.dispatch("CHANNEL_DELETE", channel)
+        return json_response(channel)
+
+    async def create_dm(self, request):
+        body = await request.json()
+        user_id = int(body["recipient_id"])
+        if self.dm_closed_every and user_id % self.dm_closed_every == 0:
+            # Real Discord fails on the message send, not the channel open; close enough here
+            return json_response({"message": "Cannot send messages to this user", "code": 50007}, status=403)
+        channel_id = self.dm_channels.setdefault(user_id, self.new_id())
+        return json_response({"id": str(channel_id), "type": 1, "recipients": [self.users[user_id]],
+                                  "last_message_id": None})
+
+    async def get_member(self, request):
+        user_id = int(request.match_info["user_id"])
+        if user_id not in self.users:
+            return json_response({"message": "Unknown Member", "code": 10007}, status=404)
+        return json_response(self.member_payload(user_id))
+
+    async def fallback(self, request):
+        self.unhandled[route_template(request.method, request.path)] += 1
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        api = "/api/v10"
+        app.router.add_get("/gateway", self.gateway)
+        app.router.add_get(f"{api}/gateway/bot", self.get_gateway)
+        app.router.add_get(f"{api}/users/@me", self.get_me)
+        app.router.add_get(f"{api}/oauth2/applications/@me", self.get_application)
+        app.router.add_get(api + "/users/{user_id:\\d+}", self.get_user)
+        app.router.add_post(f"{api}/users/@me/channels", self.create_dm)
+        app.router.add_put(api + "/applications/{app_id}/commands", self.put_commands)
+        app.router.add_post(api + "/interactions/{interaction_id}/{token}/callback", self.interaction_callback)
+        app.router.add_post(api + "/webhooks/{app_id}/{token}", self.webhook_message)
+        app.router.add_patch(api + "/webhooks/{app_id}/{token}/messages/{message_id}", self.webhook_message)
+        app.router.add_post(api + "/channels/{channel_id}/messages", self.create_message)
+        app.router.add_get(api + "/channels/{channel_id}/messages", self.history)
+        app.router.add_get(api + "/channels/{channel_id}/messages/{message_id:\\d+}", self.get_message)
+        app.router.add_patch(api + "/channels/{channel_id}/messages/{message_id:\\d+}", self.edit_message)
+        app.router.add_put(api + "/channels/{channel_id}/pins/{message_id:\\d+}", self.pin)
+        app.router.add_put(api + "/channels/{channel_id}/permissions/{target}", self.put_permission)
+        app.router.add_patch(api + "/channels/{channel_id}", self.edit_channel)
+        app.router.add_delete(api + "/channels/{channel_id}", self.delete_channel)
+        app.router.add_post(api + "/guilds/{guild_id}/channels", self.create_channel)
+        app.router.add_get(api + "/guilds/{guild_id}/members/{user_id}", self.get_member)
+        app.router.add_route("*", "/{tail:.*}", self.fallback)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,322 @@
+"""Replay a recording made with CONFIG["EVENT_RECORDING"] through app.py's handlers.
+
+Events are fed to the real handlers against the fakes in fakes.py on a
+virtual clock, so offline timers and cooldowns behave exactly as they did in
+production no matter how fast the replay runs. Party channels get the ids
+they had when recorded, so interactions line up with the parties they
+targeted. After every event the party invariants are checked, which pins
+down the first event that broke them.
+
+    python replay.py data/events.jsonl            # as fast as possible
+    python replay.py data/events.jsonl --speed 60 # one recorded minute per second
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Iterator, List
+
+import discord
+
+import app
+from fakes import FakeGuild, FakeIds, FakeInteraction, FakeMessage, install
+
+
+class VirtualDatetime(datetime):
+    # Stand-in for app.datetime; now() follows the recording instead of the wall clock
+    current: datetime = datetime.now()
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+def recording_files(path: str) -> List[str]:
+    return app.RotatingJsonlWriter.existing_files(path)
+
+
+def read_events(path: str) -> Iterator[dict]:
+    for file in recording_files(path):
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Replayer:
+    def __init__(self, events: List[dict]):
+        self.events = events
+        ids = FakeIds()
+        ids.preloaded_channels = [event["channel"] for event in events if event["e"] == "channel_create"]
+        app.state = app.BotState()
+        app.permission_batcher = app.PermissionBatcher()
+        app.dm_notifier = app.DMNotifier()
+        app.side_effects = app.SideEffects()
+        app.party_log = app.PartyLog(filename=None)
+        app.idle_parties = app.IdlePartyCollector()
+        app.category_allocator = app.CategoryAllocator()
+        self.guild = FakeGuild(ids=ids)
+        self.category = self.guild.add_category()
+        self.lobby = self.guild.add_text_channel()
+        install(app, self.guild, self.lobby, self.category)
+        app.datetime = VirtualDatetime
+        app.interaction_limiter = app.TokenBucketLimiter(clock=lambda: VirtualDatetime.current.timestamp())
+        app.CONFIG["EVENT_RECORDING"] = False
+        app.CONFIG["IGN_RESOLVER"] = "stub"
+        app.ign_resolver = app.IgnResolver()
+        app.ign_memory = app.IgnMemory(filename=None)
+
+        self.counts: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.errors: List[str] = []
+        self.violations: List[str] = []
+        self.latencies = defaultdict(list)
+
+    def member(self, event: dict):
+        member = self.guild.get_member(event["user"])
+        if member is None:
+            member = self.guild.add_member(event["user"], event.get("name"))
+        return member
+
+    def channel(self, channel_id):
+        channel = self.guild.get_channel(channel_id)
+        if channel is None and channel_id is not None and channel_id not in self.guild.ids.preloaded_channels:
+            channel = self.guild.add_text_channel(channel_id, name=f"channel-{channel_id}")
+        return channel
+
+    # ---------------------------------------------------------------- dispatch
+
+    async def interaction(self, event: dict):
+        data = event.get("data") or {}
+        interaction_type = discord.InteractionType(event["type"])
+        interaction = FakeInteraction(self.member(event), self.guild, data, interaction_type,
+                                      self.channel(event.get("channel")))
+        custom_id = data.get("custom_id", "")
+
+        if interaction_type == discord.InteractionType.component:
+            handler = self.component_handler(custom_id, data)
+            if handler is not None:
+                owner, callback = handler
+                # Same order as discord.py's view dispatch: interaction_check, then the callback
+                if await owner.interaction_check(interaction):
+                    await callback(interaction)
+                else:
+                    self.skipped["rate limited"] += 1
+            await app.on_interaction(interaction)
+        elif interaction_type == discord.InteractionType.modal_submit:
+            await self.modal_submit(interaction, custom_id, data)
+        elif interaction_type == discord.InteractionType.application_command:
+            await self.app_command(interaction, data)
+        else:
+            self.skipped[f"interaction type {interaction_type.name}"] += 1
+
+    def component_handler(self, custom_id: str, data: dict):
+        # One lobby button per party type, wired like lobby_board does
+        for party_type in app.PARTY_TYPES.values():
+            if custom_id == party_type.button_id:
+                return (app.RateLimitedView(timeout=None, action="join"),
+                        functools.partial(app.on_join_button, party_type=party_type))
+        prefix, _, channel_id = custom_id.rpartition("_")
+        if not channel_id.isdigit():
+            return None  # guide buttons are handled by on_interaction itself
+        channel_id = int(channel_id)
+        party_data = app.state.active_channels.get(channel_id)
+        if party_data is None:
+            self.skipped[f"{prefix} on closed party"] += 1
+            return None
+
+        view_methods = {
+            "cmd_button": "on_cmd_button",
+            "transfer_button": "on_transfer_button",
+            "size_button": "on_size_button",
+            "leave_party": "on_leave_button",
+            "kick_button": "on_kick_button",
+            "lock_button": "on_lock_button",
+        }
+        if prefix in view_methods:
+            view = app.PartyView(channel_id, party_data['creator_id'])
+            return view, getattr(view, view_methods[prefix])
+        if prefix == "size_select":
+            view = app.SizeSelectView(channel_id, party_data['max_size'], party_data['creator_id'])
+            return view, view.on_select
+        if prefix in ("kick_select", "transfer_select"):
+            if prefix == "kick_select":
+                select = app.KickSelect(channel_id, party_data['members'], party_data['usernames'])
+            else:
+                select = app.TransferLeaderSelect(channel_id, [discord.SelectOption(label=v, value=v)
+                                                               for v in data.get("values", [])])
+            select._values = list(data.get("values", []))
+            return app.RateLimitedView(timeout=30), select.callback
+        self.skipped[f"component {prefix}"] += 1
+        return None
+
+    async def modal_submit(self, interaction, custom_id: str, data: dict):
+        values = [component.get("value", "")
+                  for row in data.get("components", []) for component in row.get("components", [])]
+        kind, _, rest = custom_id.partition("_modal_")
+        if kind == "username":
+            modal = app.UsernameModal()
+            modal.username._value = values[0] if values else ""
+        elif kind in ("command", "lock"):
+            channel_id = int(rest.split("_")[0])
+            if channel_id not in app.state.active_channels:
+                self.skipped[f"{kind} modal on closed party"] += 1
+                return
+            modal = app.CommandModal(channel_id) if kind == "command" else app.LockConfirmModal(channel_id)
+            text_input = modal.command if kind == "command" else modal.confirm
+            text_input._value = values[0] if values else ""
+        else:
+            self.skipped[f"modal {custom_id}"] += 1
+            return
+        if not await modal.interaction_check(interaction):
+            self.skipped["rate limited"] += 1
+            return
+        await modal.on_submit(interaction)
+
+    async def app_command(self, interaction, data: dict):
+        command = app.bot.tree.get_command(data.get("name", ""))
+        if command is None:
+            self.skipped[f"command {data.get('name')}"] += 1
+            return
+        options = {option["name"]: option.get("value") for option in data.get("options", [])}
+        await command.callback(interaction, **options)
+
+    async def presence(self, event: dict):
+        member = self.member(event)
+        before = SimpleNamespace(id=member.id, mention=member.mention, status=discord.Status(event["before"]))
+        after = SimpleNamespace(id=member.id, mention=member.mention, status=discord.Status(event["after"]))
+        member.status = after.status
+        await app.on_presence_update(before, after)
+
+    async def message(self, event: dict):
+        channel = self.channel(event["channel"])
+        if channel is None:
+            self.skipped["message in unknown channel"] += 1
+            return
+        message = FakeMessage(self.guild.ids.next(), channel, self.member(event), event.get("content") or "")
+        await app.on_message(message)
+
+    # ---------------------------------------------------------------- loop
+
+    def check_invariants(self, index: int, event: dict):
+        seen = {}
+        for channel_id, data in app.state.active_channels.items():
+            if len(data['members']) > data['max_size']:
+                self.violations.append(f"event {index} ({event['e']}): party {channel_id} has "
+                                       f"{len(data['members'])}/{data['max_size']} members")
+            if len(data['members']) != len(data['usernames']):
+                self.violations.append(f"event {index}: party {channel_id} members/usernames out of sync")
+            for user_id in data['members']:
+                if user_id in seen:
+                    self.violations.append(f"event {index}: user {user_id} in parties {seen[user_id]} and {channel_id}")
+                seen[user_id] = channel_id
+                if app.state.user_participation.get(user_id) != channel_id:
+                    self.violations.append(f"event {index}: user {user_id} participation points to "
+                                           f"{app.state.user_participation.get(user_id)}, not {channel_id}")
+
+    async def run(self, speed: float):
+        handlers = {"interaction": self.interaction, "presence": self.presence, "message": self.message}
+        if not self.events:
+            return
+        VirtualDatetime.current = datetime.fromtimestamp(self.events[0]["ts"])
+        # Background loops that run on a timer in production: [kind, interval, coroutine function, next run]
+        loops = [["offline_sweep", timedelta(minutes=1), app.check_offline_members.coro, None],
+                 ["idle_parties", timedelta(seconds=30), app.collect_idle_parties.coro, None]]
+        if app.CONFIG["MATCHMAKING_MODE"]:
+            loops.append(["matchmaking", timedelta(seconds=app.CONFIG["MATCHMAKING_INTERVAL"]),
+                          app.match_queued_players, None])
+        for loop in loops:
+            loop[3] = VirtualDatetime.current + loop[1]
+        await app.post_initial_button()
+
+        previous_ts = self.events[0]["ts"]
+        for index, event in enumerate(self.events):
+            if speed > 0:
+                await asyncio.sleep(max(0.0, event["ts"] - previous_ts) / speed)
+            previous_ts = event["ts"]
+            VirtualDatetime.current = datetime.fromtimestamp(event["ts"])
+
+            # Replay the loop runs that fell in between, in time order
+            saved = VirtualDatetime.current
+            while True:
+                due = min(loops, key=lambda loop: loop[3])
+                if due[3] > saved:
+                    break
+                VirtualDatetime.current = due[3]
+                await self.timed(due[0], due[2]())
+                await app.permission_batcher.flush_all()
+                await app.dm_notifier.drain()
+                await app.side_effects.drain()
+                due[3] += due[1]
+            VirtualDatetime.current = saved
+
+            handler = handlers.get(event["e"])
+            if handler is None:
+                continue
+            await self.timed(event["e"], handler(event), index)
+            await app.permission_batcher.flush_all()
+            await app.dm_notifier.drain()
+            await app.side_effects.drain()
+            self.check_invariants(index, event)
+
+    async def timed(self, kind: str, coro, index: int = -1):
+        self.counts[kind] += 1
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors.append(f"event {index} ({kind}): {type(e).__name__}: {e}")
+        self.latencies[kind].append(time.perf_counter() - started)
+
+    def report(self, elapsed: float):
+        total = sum(self.counts.values())
+        print(f"Replayed {total} handler calls in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f}/s), "
+              f"{self.guild.rest.total} REST calls")
+        for kind, samples in self.latencies.items():
+            ordered = sorted(samples)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+            print(f"  {kind:<14} {len(samples):>7}  p50={p50:.3f}ms  p99={p99:.3f}ms")
+        print(f"Final state: {len(app.state.active_channels)} parties, {len(app.state.user_participation)} players")
+        for reason, count in self.skipped.items():
+            print(f"  skipped {count} x {reason}")
+        for line in self.errors[:20]:
+            print(f"ERROR {line}")
+        for line in self.violations[:20]:
+            print(f"VIOLATION {line}")
+
+
+async def main(args) -> int:
+    events = list(read_events(args.recording))
+    if args.limit:
+        events = events[:args.limit]
+    with tempfile.TemporaryDirectory(prefix="replay-") as data_dir:
+        app.CONFIG["DATA_DIR"] = data_dir  # the recording is read from data/, nothing is written back there
+        replayer = Replayer(events)
+        app.CONFIG["MATCHMAKING_MODE"] = args.matchmaking
+        started = time.perf_counter()
+        await replayer.run(args.speed)
+        replayer.report(time.perf_counter() - started)
+    return 1 if replayer.violations or replayer.errors else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded event stream through the bot's handlers")
+    parser.add_argument("recording", nargs="?", default=os.path.join(app.CONFIG["DATA_DIR"], "events.jsonl"))
+    parser.add_argument("--speed", type=float, default=0, help="time compression factor, 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, help="only replay the first N events")
+    parser.add_argument("--matchmaking", action="store_true", help="the recording was made in matchmaking mode")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sys.exit(asyncio.run(main(parse_args())))